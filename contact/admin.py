@@ -1,7 +1,8 @@
 from django.contrib import admin
+from django.utils import timezone
 from reversion_compare.admin import CompareVersionAdmin
 
-from .models import EmailList, GroupEmailEntry, UserEmailEntry, ContactReason
+from .models import EmailList, GroupEmailEntry, UserEmailEntry, ContactReason, QueuedEmail
 
 
 class GroupInline(admin.TabularInline):
@@ -17,9 +18,22 @@ class UserInline(admin.TabularInline):
 @admin.register(EmailList)
 class EmailListAdmin(CompareVersionAdmin):
     inlines = [GroupInline, UserInline]
-    list_display = ['name']
+    list_display = ['name', 'digest_minutes']
 
 
 @admin.register(ContactReason)
 class ContactReasonAdmin(CompareVersionAdmin):
     list_display = ['name', 'list']
+
+
+@admin.register(QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'created', 'status', 'attempts', 'next_attempt', 'sent']
+    list_filter = ['status']
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        count = queryset.exclude(status=QueuedEmail.STATUS_SENT) \
+            .update(status=QueuedEmail.STATUS_PENDING, attempts=0, next_attempt=timezone.now())
+        self.message_user(request, "%d e-mail(s) will be sent again" % count)
+    retry.short_description = "Retry sending the selected e-mails"
@@ -0,0 +1,66 @@
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from datetime import timedelta
+
+from .models import DigestEntry, EmailList
+from .outbox import queue_email
+from .utils import FROM_EMAIL, format_subject, load_recipients
+
+DIGEST_SEPARATOR = "-" * 72
+
+
+def format_time(value):
+    return timezone.localtime(value).strftime("%Y-%m-%d %H:%M %Z")
+
+
+def format_digest(entries):
+    sections = ["%d message(s) since %s" % (len(entries), format_time(entries[0].created))]
+    for entry in entries:
+        lines = [DIGEST_SEPARATOR, entry.subject, "Sent: %s" % format_time(entry.created)]
+        if entry.reply_to:
+            lines.append("Reply To: %s" % entry.reply_to)
+        lines += ["", entry.body]
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def due_lists(now):
+    """
+    The lists whose oldest held message has waited out the list's digest interval
+    """
+    lists = EmailList.objects.annotate(oldest=Min('digestentry__created')).filter(oldest__isnull=False)
+    return [email_list for email_list in lists
+            if email_list.oldest + timedelta(minutes=email_list.digest_minutes) <= now]
+
+
+def send_digest(email_list):
+    """
+    Queues everything held for the list as one e-mail, removing what it sent in the same transaction.  Returns the
+    number of messages in the digest.
+    """
+    with transaction.atomic():
+        entries = list(DigestEntry.objects.select_for_update().filter(list=email_list).order_by('created', 'id'))
+        if not entries:
+            return 0
+
+        queue_email(EmailMessage(subject=format_subject("Digest", "%d message(s) to %s" % (len(entries), email_list)),
+                                 body=format_digest(entries),
+                                 from_email=FROM_EMAIL,
+                                 to=load_recipients(email_list)))
+        DigestEntry.objects.filter(id__in=[entry.id for entry in entries]).delete()
+        return len(entries)
+
+
+def send_digests(now=None):
+    """
+    Queues a digest for each list that's due one.  Returns (list, message count) for each digest queued.
+    """
+    sent = []
+    for email_list in due_lists(now or timezone.now()):
+        count = send_digest(email_list)
+        if count:
+            sent.append((email_list, count))
+    return sent
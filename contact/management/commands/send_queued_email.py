@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+import time
+
+from contact.digests import send_digests
+from contact.outbox import BATCH_SIZE, deliver_all, get_throttle
+from convention.announcements import describe_announcement, queue_announcements
+
+
+class Command(BaseCommand):
+    help = "Queues the announcements being sent and the digests that are due, then sends the e-mails waiting in the " \
+           "outbox, retrying those that fail with a growing delay.  Run it with --loop as a worker process, or " \
+           "without to empty the outbox once, for instance from a scheduler."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help="E-mails sent over each connection")
+        parser.add_argument('--rate', type=float, default=None,
+                            help="Most e-mails to send per second, overriding the EMAIL_SEND_RATE setting")
+        parser.add_argument('--loop', action='store_true', default=False,
+                            help="Keep checking the outbox until stopped")
+        parser.add_argument('--interval', type=float, default=10,
+                            help="Seconds to wait between checks when looping")
+
+    def handle(self, *args, **options):
+        throttle = get_throttle(options['rate'])
+        while True:
+            for announcement in queue_announcements():
+                self.stdout.write(describe_announcement(announcement))
+            for email_list, count in send_digests():
+                self.stdout.write("Digest of %d message(s) to %s" % (count, email_list))
+            sent, retried, failed = deliver_all(options['batch_size'], throttle=throttle)
+            if sent or retried or failed or not options['loop']:
+                self.stdout.write("Sent %d, will retry %d, failed %d" % (sent, retried, failed))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from shadowcon.sqlite import keep_foreign_keys
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0002_queuedemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_foreign_keys, keep_foreign_keys),
+        migrations.CreateModel(
+            name='DigestEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.TextField()),
+                ('body', models.TextField()),
+                ('reply_to', models.CharField(blank=True, default='', max_length=256)),
+                ('created', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='emaillist',
+            name='digest_minutes',
+            field=models.PositiveIntegerField(default=0, help_text='Collect messages into one e-mail sent at most this often, or 0 to send each message straight away.', verbose_name='Digest Every (minutes)'),
+        ),
+        migrations.AddField(
+            model_name='digestentry',
+            name='list',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contact.EmailList'),
+        ),
+    ]
@@ -6,6 +6,9 @@ from django.contrib.auth.models import Group, User
 
 class EmailList(models.Model):
     name = models.CharField(max_length=256)
+    digest_minutes = models.PositiveIntegerField(default=0, verbose_name="Digest Every (minutes)",
+                                                 help_text="Collect messages into one e-mail sent at most this often, "
+                                                           "or 0 to send each message straight away.")
 
     def __str__(self):
         return self.name
@@ -27,3 +30,47 @@ class ContactReason(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class DigestEntry(models.Model):
+    """
+    A message held for the next digest of a list
+    """
+    list = models.ForeignKey(EmailList, on_delete=models.CASCADE)
+    subject = models.TextField()
+    body = models.TextField()
+    reply_to = models.CharField(max_length=256, blank=True, default="")
+    created = models.DateTimeField(db_index=True)
+
+
+class QueuedEmail(models.Model):
+    """
+    An e-mail waiting in the outbox, or the record of one that was sent or given up on.  Addresses are stored one per
+    line.
+    """
+    STATUS_PENDING = 'P'
+    STATUS_SENT = 'S'
+    STATUS_FAILED = 'F'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    subject = models.TextField()
+    body = models.TextField()
+    from_email = models.CharField(max_length=256)
+    to = models.TextField()
+    reply_to = models.TextField(blank=True, default="")
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField()
+    next_attempt = models.DateTimeField()
+    sent = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        # the worker's query for what's due
+        index_together = ('status', 'next_attempt')
+
+    def __str__(self):
+        return "%s to %s" % (self.subject, ", ".join(self.to.splitlines()))
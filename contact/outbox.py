@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from datetime import timedelta
+import logging
+import time
+
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+# e-mails sent per batch over one connection
+BATCH_SIZE = 100
+
+# attempts before an e-mail is marked failed and left for someone to look at
+MAX_ATTEMPTS = 5
+
+# seconds before the first retry, doubled for each one after
+RETRY_DELAY = 60
+
+# seconds a worker has to deliver the e-mails it claimed before another worker may try them
+CLAIM_TIMEOUT = 600
+
+
+class Throttle(object):
+    """
+    Spaces out sends so there are at most rate per second, or doesn't wait at all without a rate
+    """
+
+    def __init__(self, rate=None, clock=time.time, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.next_send = None
+
+    def wait(self):
+        if not self.rate:
+            return
+        now = self.clock()
+        if self.next_send is not None and now < self.next_send:
+            self.sleep(self.next_send - now)
+            now = self.next_send
+        self.next_send = now + 1.0 / self.rate
+
+
+def get_throttle(rate=None):
+    return Throttle(rate if rate is not None else getattr(settings, 'EMAIL_SEND_RATE', None))
+
+
+def queue_emails(messages):
+    """
+    Stores EmailMessages in the outbox with a single insert, in the caller's transaction, so they're only sent if it
+    commits.  Messages without recipients are dropped.  Returns the number queued.
+    """
+    now = timezone.now()
+    emails = [QueuedEmail(subject=message.subject, body=message.body, from_email=message.from_email,
+                          to="\n".join(message.to), reply_to="\n".join(message.reply_to), created=now,
+                          next_attempt=now) for message in messages if message.to]
+    QueuedEmail.objects.bulk_create(emails)
+    return len(emails)
+
+
+def queue_email(message):
+    return queue_emails([message])
+
+
+def as_message(email):
+    return EmailMessage(subject=email.subject, body=email.body, from_email=email.from_email,
+                        to=email.to.splitlines(), reply_to=email.reply_to.splitlines())
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_batch(size, now):
+    """
+    The e-mails due to be sent, pushed back by the claim timeout so other workers pass over them meanwhile
+    """
+    with transaction.atomic():
+        emails = list(QueuedEmail.objects.select_for_update()
+                      .filter(status=QueuedEmail.STATUS_PENDING, next_attempt__lte=now)
+                      .order_by('next_attempt', 'id')[:size])
+        QueuedEmail.objects.filter(id__in=[email.id for email in emails]) \
+            .update(next_attempt=now + timedelta(seconds=CLAIM_TIMEOUT))
+        return emails
+
+
+def record_failure(email, error, now):
+    email.attempts += 1
+    email.last_error = "%s: %s" % (error.__class__.__name__, error)
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = QueuedEmail.STATUS_FAILED
+        logger.error("Gave up sending '%s' to %s: %s", email.subject, email.to, email.last_error)
+    else:
+        email.next_attempt = now + retry_delay(email.attempts)
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        logger.exception("Error closing the e-mail connection")
+
+
+def deliver_queued(batch_size=BATCH_SIZE, connection=None, throttle=None):
+    """
+    Sends a batch of due e-mails, keeping one connection open for all of them and no faster than the throttle allows.
+    An e-mail that can't be sent is retried later, waiting twice as long each time, until it has been tried
+    MAX_ATTEMPTS times.  Returns the number sent, retried and failed.
+    """
+    now = timezone.now()
+    emails = claim_batch(batch_size, now)
+    counts = {QueuedEmail.STATUS_SENT: 0, QueuedEmail.STATUS_PENDING: 0, QueuedEmail.STATUS_FAILED: 0}
+    if not emails:
+        return 0, 0, 0
+
+    connection = connection or get_connection()
+    throttle = throttle or get_throttle()
+    try:
+        for email in emails:
+            throttle.wait()
+            try:
+                # opens the connection for the first e-mail, or again after an error, otherwise reuses it
+                connection.open()
+                if not connection.send_messages([as_message(email)]):
+                    raise RuntimeError("The e-mail backend didn't send the message")
+            except Exception as e:
+                # the connection may be unusable after an error, so the next e-mail starts a fresh one
+                close_quietly(connection)
+                record_failure(email, e, now)
+            else:
+                email.attempts += 1
+                email.status = QueuedEmail.STATUS_SENT
+                email.sent = timezone.now()
+            email.save(update_fields=['attempts', 'status', 'sent', 'next_attempt', 'last_error'])
+            counts[email.status] += 1
+    finally:
+        close_quietly(connection)
+
+    return counts[QueuedEmail.STATUS_SENT], counts[QueuedEmail.STATUS_PENDING], counts[QueuedEmail.STATUS_FAILED]
+
+
+def deliver_all(batch_size=BATCH_SIZE, connection=None, throttle=None):
+    """
+    Sends batches until nothing more is due.  Returns the totals sent, retried and failed.
+    """
+    throttle = throttle or get_throttle()
+    totals = (0, 0, 0)
+    while True:
+        counts = deliver_queued(batch_size, connection, throttle)
+        if not any(counts):
+            return totals
+        totals = tuple(total + count for total, count in zip(totals, counts))
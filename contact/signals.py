@@ -0,0 +1,35 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from shadowcon.versions import invalidate_on_commit
+
+from .models import EmailList, GroupEmailEntry, UserEmailEntry
+from .utils import invalidate_recipients
+
+
+def recipients_changed():
+    invalidate_on_commit(invalidate_recipients)
+
+
+@receiver(post_save, sender=UserEmailEntry)
+@receiver(post_delete, sender=UserEmailEntry)
+@receiver(post_save, sender=GroupEmailEntry)
+@receiver(post_delete, sender=GroupEmailEntry)
+@receiver(post_delete, sender=EmailList)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def entry_changed(sender, **kwargs):
+    recipients_changed()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def membership_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        recipients_changed()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, update_fields=None, **kwargs):
+    # logging in saves the user too, but only its last_login
+    if update_fields is None or 'email' in update_fields:
+        recipients_changed()
@@ -1,13 +1,23 @@
+from datetime import timedelta
 from ddt import ddt, data
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.test import Client
+from django.utils import timezone
+from django.utils.six import StringIO
 from reversion_compare.admin import CompareVersionAdmin
 from shadowcon.tests.utils import ShadowConTestCase
 from unittest import TestCase
 
 from .admin import EmailListAdmin, ContactReasonAdmin
-from .models import EmailList
-from .utils import mail_list
+from .digests import send_digests
+from .models import DigestEntry, EmailList, GroupEmailEntry, QueuedEmail, UserEmailEntry
+from .outbox import MAX_ATTEMPTS, RETRY_DELAY, Throttle, claim_batch, deliver_all, deliver_queued
+from .utils import get_recipients, mail_list, mail_users
 
 
 class ContactTest(ShadowConTestCase):
@@ -82,7 +92,7 @@ class ContactTest(ShadowConTestCase):
             self.test_data['name'],
             self.test_data['email'],
             self.test_data['message']))
-        self.assertEquals(email.to, ['staff-test@mg.shadowcon.net', 'admin-test@mg.shadowcon.net'])
+        self.assertEquals(email.to, ['admin-test@mg.shadowcon.net', 'staff-test@mg.shadowcon.net'])
         self.assertEquals(email.from_email, self.from_address)
         self.check_reply(email, self.test_data['name'], self.test_data['email'])
         self.assertEquals(email.subject, 'ShadowCon [Something Broke]: %s' % self.test_data['summary'])
@@ -99,7 +109,7 @@ class ContactTest(ShadowConTestCase):
             self.test_data['name'],
             self.test_data['email'],
             self.test_data['message']))
-        self.assertEquals(email.to, ['staff-test@mg.shadowcon.net', 'admin-test@mg.shadowcon.net'])
+        self.assertEquals(email.to, ['admin-test@mg.shadowcon.net', 'staff-test@mg.shadowcon.net'])
         self.assertEquals(email.from_email, self.from_address)
         self.check_reply(email, self.test_data['name'], self.test_data['email'])
         self.assertEquals(email.subject, 'ShadowCon [Something Broke]: %s' % self.test_data['summary'])
@@ -177,7 +187,7 @@ class UtilsTest(ShadowConTestCase):
         email = self.get_email()
 
         self.assertEquals(email.body, message)
-        self.assertEquals(email.to, ['staff-test@mg.shadowcon.net', 'admin-test@mg.shadowcon.net'])
+        self.assertEquals(email.to, ['admin-test@mg.shadowcon.net', 'staff-test@mg.shadowcon.net'])
         self.assertEquals(email.from_email, self.from_address)
         self.assertEquals(email.subject, 'ShadowCon [%s]: %s' % (subject_source, subject_details))
 
@@ -192,3 +202,349 @@ class UtilsTest(ShadowConTestCase):
     def test_email_reply_to(self):
         email = self.run_base_test("Bob <na-test@mg.shadowcon.net>")
         self.assertEquals(email.reply_to, [self.from_address, "Bob <na-test@mg.shadowcon.net>"])
+
+    def test_mail_users(self):
+        users = [User.objects.get(username=username) for username in ["admin", "staff"]]
+        queued = mail_users("Reminder", "Bring dice", [(user, "Hi %s" % user.username) for user in users])
+
+        self.assertEquals(queued, 2)
+        emails = self.get_emails()
+        self.assertEquals([(email.to, email.body) for email in emails],
+                          [(['admin-test@mg.shadowcon.net'], "Hi admin"),
+                           (['staff-test@mg.shadowcon.net'], "Hi staff")])
+        self.assertEquals(emails[0].subject, 'ShadowCon [Reminder]: Bring dice')
+        self.assertEquals(emails[0].from_email, self.from_address)
+
+    def test_mail_users_without_email(self):
+        user = User.objects.get(username="admin")
+        user.email = ""
+        self.assertEquals(mail_users("Reminder", "Bring dice", [(user, "Hi")]), 0)
+        self.assertEquals(len(self.get_emails()), 0)
+
+
+class RecipientsTest(ShadowConTestCase):
+    def setUp(self):
+        self.website = EmailList.objects.get(name="Website")
+
+    def assertRecipients(self, emails):
+        self.assertEquals(get_recipients(EmailList.objects.get(name="Website")), emails)
+
+    def test_single_query(self):
+        for index in range(5):
+            group = Group.objects.create(name="Group %d" % index)
+            GroupEmailEntry.objects.create(list=self.website, group=group)
+            for user in User.objects.all():
+                user.groups.add(group)
+
+        with self.assertNumQueries(1):
+            emails = get_recipients(self.website)
+        self.assertEquals(emails, ['admin-test@mg.shadowcon.net', 'staff-test@mg.shadowcon.net',
+                                   'user-test@mg.shadowcon.net'])
+
+    def test_cached(self):
+        get_recipients(self.website)
+        with self.assertNumQueries(0):
+            self.assertEquals(get_recipients(self.website), ['admin-test@mg.shadowcon.net',
+                                                             'staff-test@mg.shadowcon.net'])
+
+    def test_duplicates(self):
+        User.objects.get(username="admin").groups.add(Group.objects.get(name="Website"))
+        self.assertRecipients(['admin-test@mg.shadowcon.net', 'staff-test@mg.shadowcon.net'])
+
+    def test_no_email(self):
+        User.objects.filter(username="staff").update(email="")
+        self.assertRecipients(['admin-test@mg.shadowcon.net'])
+
+    def test_user_entry_added(self):
+        get_recipients(self.website)
+        UserEmailEntry.objects.create(list=self.website, user=User.objects.get(username="user"))
+        self.assertRecipients(['admin-test@mg.shadowcon.net', 'staff-test@mg.shadowcon.net',
+                               'user-test@mg.shadowcon.net'])
+
+    def test_user_entry_removed(self):
+        get_recipients(self.website)
+        UserEmailEntry.objects.get(list=self.website).delete()
+        self.assertRecipients(['staff-test@mg.shadowcon.net'])
+
+    def test_group_entry_removed(self):
+        get_recipients(self.website)
+        GroupEmailEntry.objects.get(list=self.website).delete()
+        self.assertRecipients(['admin-test@mg.shadowcon.net'])
+
+    def test_member_added(self):
+        get_recipients(self.website)
+        User.objects.get(username="user").groups.add(Group.objects.get(name="Website"))
+        self.assertRecipients(['admin-test@mg.shadowcon.net', 'staff-test@mg.shadowcon.net',
+                               'user-test@mg.shadowcon.net'])
+
+    def test_member_removed(self):
+        get_recipients(self.website)
+        Group.objects.get(name="Website").user_set.clear()
+        self.assertRecipients(['admin-test@mg.shadowcon.net'])
+
+    def test_group_deleted(self):
+        get_recipients(self.website)
+        Group.objects.get(name="Website").delete()
+        self.assertRecipients(['admin-test@mg.shadowcon.net'])
+
+    def test_email_changed(self):
+        get_recipients(self.website)
+        user = User.objects.get(username="staff")
+        user.email = "new-staff@mg.shadowcon.net"
+        user.save()
+        self.assertRecipients(['admin-test@mg.shadowcon.net', 'new-staff@mg.shadowcon.net'])
+
+    def test_user_deleted(self):
+        get_recipients(self.website)
+        User.objects.get(username="staff").delete()
+        self.assertRecipients(['admin-test@mg.shadowcon.net'])
+
+    def test_login_keeps_cache(self):
+        get_recipients(self.website)
+        self.client.login(username="staff", password="123")
+        with self.assertNumQueries(0):
+            get_recipients(self.website)
+
+    def test_mail_list_queries(self):
+        mail_list("Test", "Warm", "Body", list_name="Website")
+        with self.assertNumQueries(2):
+            mail_list("Test", "Cached", "Body", list_name="Website")
+
+
+class FlakyBackend(EmailBackend):
+    """
+    Keeps what it sends like the locmem backend, but fails for the addresses given and counts the connections opened
+    """
+
+    def __init__(self, failing=(), *args, **kwargs):
+        super(FlakyBackend, self).__init__(*args, **kwargs)
+        self.failing = failing
+        self.opened = 0
+        self.is_open = False
+
+    def open(self):
+        if not self.is_open:
+            self.is_open = True
+            self.opened += 1
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & set(self.failing):
+                raise IOError("Connection refused")
+        return super(FlakyBackend, self).send_messages(messages)
+
+
+class OutboxTest(ShadowConTestCase):
+    def queue(self, count, subject="Test"):
+        for index in range(count):
+            mail_list(subject, "Message %d" % index, "Body %d" % index, list_name="Admin")
+
+    def make_due(self):
+        QueuedEmail.objects.update(next_attempt=timezone.now())
+
+    def test_queued(self):
+        self.queue(1)
+        self.assertEquals(len(mail.outbox), 0)
+
+        email = QueuedEmail.objects.get()
+        self.assertEquals(email.status, QueuedEmail.STATUS_PENDING)
+        self.assertEquals(email.to, "user-test@mg.shadowcon.net")
+        self.assertEquals(str(email), "ShadowCon [Test]: Message 0 to user-test@mg.shadowcon.net")
+
+    def test_rolled_back(self):
+        try:
+            with transaction.atomic():
+                self.queue(1)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_no_recipients(self):
+        mail_list("Test", "Nobody", "Body", EmailList.objects.create(name="Empty"))
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_delivered(self):
+        self.queue(1)
+        self.assertEquals(deliver_queued(), (1, 0, 0))
+
+        email = QueuedEmail.objects.get()
+        self.assertEquals((email.status, email.attempts), (QueuedEmail.STATUS_SENT, 1))
+        self.assertIsNotNone(email.sent)
+        self.assertEquals(deliver_queued(), (0, 0, 0))
+        self.assertEquals(len(mail.outbox), 1)
+
+    def test_reply_to(self):
+        mail_list("Test", "Reply", "Body", list_name="Admin", reply_to="Bob <na-test@mg.shadowcon.net>")
+        self.assertEquals(self.get_email().reply_to, [self.from_address, "Bob <na-test@mg.shadowcon.net>"])
+
+    def test_single_connection(self):
+        self.queue(5)
+        backend = FlakyBackend()
+        self.assertEquals(deliver_queued(connection=backend), (5, 0, 0))
+        self.assertEquals(backend.opened, 1)
+        self.assertFalse(backend.is_open)
+        self.assertEquals([email.subject for email in mail.outbox],
+                          ["ShadowCon [Test]: Message %d" % index for index in range(5)])
+
+    def test_batches(self):
+        self.queue(5)
+        backend = FlakyBackend()
+        self.assertEquals(deliver_all(batch_size=2, connection=backend), (5, 0, 0))
+        self.assertEquals(backend.opened, 3)
+
+    def test_retry(self):
+        self.queue(1)
+        before = timezone.now()
+        self.assertEquals(deliver_queued(connection=FlakyBackend(["user-test@mg.shadowcon.net"])), (0, 1, 0))
+
+        email = QueuedEmail.objects.get()
+        self.assertEquals((email.status, email.attempts), (QueuedEmail.STATUS_PENDING, 1))
+        self.assertEquals(email.last_error, "IOError: Connection refused")
+        self.assertGreaterEqual(email.next_attempt, before + timedelta(seconds=RETRY_DELAY))
+
+        # not due yet
+        self.assertEquals(deliver_queued(), (0, 0, 0))
+
+        self.make_due()
+        before = timezone.now()
+        deliver_queued(connection=FlakyBackend(["user-test@mg.shadowcon.net"]))
+        self.assertGreaterEqual(QueuedEmail.objects.get().next_attempt, before + timedelta(seconds=2 * RETRY_DELAY))
+
+        self.make_due()
+        self.assertEquals(deliver_queued(), (1, 0, 0))
+        self.assertEquals(QueuedEmail.objects.get().attempts, 3)
+
+    def test_failed(self):
+        self.queue(1)
+        for attempt in range(MAX_ATTEMPTS):
+            self.make_due()
+            deliver_queued(connection=FlakyBackend(["user-test@mg.shadowcon.net"]))
+
+        email = QueuedEmail.objects.get()
+        self.assertEquals((email.status, email.attempts), (QueuedEmail.STATUS_FAILED, MAX_ATTEMPTS))
+        self.make_due()
+        self.assertEquals(deliver_queued(), (0, 0, 0))
+
+    def test_failure_keeps_batch_going(self):
+        mail_list("Test", "Website", "Body", list_name="Website")
+        self.queue(2)
+        backend = FlakyBackend(["admin-test@mg.shadowcon.net"])
+        self.assertEquals(deliver_queued(connection=backend), (2, 1, 0))
+
+        # the connection is opened again after the failure
+        self.assertEquals(backend.opened, 2)
+        self.assertEquals(len(mail.outbox), 2)
+
+    def test_claimed(self):
+        self.queue(3)
+        self.assertEquals(len(claim_batch(2, timezone.now())), 2)
+        self.assertEquals(len(claim_batch(2, timezone.now())), 1)
+        self.assertEquals(claim_batch(2, timezone.now()), [])
+
+    def test_command(self):
+        self.queue(3)
+        out = StringIO()
+        call_command("send_queued_email", stdout=out)
+        self.assertEquals(out.getvalue(), "Sent 3, will retry 0, failed 0\n")
+        self.assertEquals(len(mail.outbox), 3)
+
+    def test_throttled(self):
+        self.queue(3)
+        clock = [100.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            clock[0] += seconds
+
+        throttle = Throttle(4, clock=lambda: clock[0], sleep=sleep)
+        self.assertEquals(deliver_queued(throttle=throttle), (3, 0, 0))
+        self.assertEquals(waits, [0.25, 0.25])
+
+    def test_unthrottled(self):
+        waits = []
+        throttle = Throttle(None, sleep=waits.append)
+        for index in range(3):
+            throttle.wait()
+        self.assertEquals(waits, [])
+
+
+class DigestTest(ShadowConTestCase):
+    def setUp(self):
+        EmailList.objects.filter(name="Website").update(digest_minutes=15)
+        self.website = EmailList.objects.get(name="Website")
+
+    def send(self, count, reply_to=None):
+        for index in range(count):
+            mail_list("Registration", "Person %d registered" % index, "Details %d" % index, list_name="Website",
+                      reply_to=reply_to)
+
+    def later(self, minutes):
+        return timezone.now() + timedelta(minutes=minutes)
+
+    def test_held(self):
+        self.send(3)
+        self.assertEquals(DigestEntry.objects.count(), 3)
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_immediate_list(self):
+        mail_list("Registration", "Someone registered", "Details", list_name="Admin")
+        self.assertFalse(DigestEntry.objects.exists())
+        self.assertEquals(QueuedEmail.objects.count(), 1)
+
+    def test_not_due(self):
+        self.send(2)
+        self.assertEquals(send_digests(self.later(14)), [])
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_merged(self):
+        self.send(100)
+        self.assertEquals([(str(email_list), count) for email_list, count in send_digests(self.later(15))],
+                          [("Website", 100)])
+        self.assertFalse(DigestEntry.objects.exists())
+
+        email = self.get_email()
+        self.assertEquals(email.subject, "ShadowCon [Digest]: 100 message(s) to Website")
+        self.assertEquals(email.to, ['admin-test@mg.shadowcon.net', 'staff-test@mg.shadowcon.net'])
+        self.assertEquals(email.from_email, self.from_address)
+        self.assertTrue(email.body.startswith("100 message(s) since "))
+        self.assertIn("ShadowCon [Registration]: Person 0 registered\nSent: ", email.body)
+        self.assertIn("\n\nDetails 99", email.body)
+        self.assertEquals(email.body.count("-" * 72), 100)
+
+    def test_reply_to(self):
+        self.send(1, reply_to="Bob <na-test@mg.shadowcon.net>")
+        send_digests(self.later(15))
+        self.assertIn("Reply To: Bob <na-test@mg.shadowcon.net>", self.get_email().body)
+
+    def test_next_window(self):
+        self.send(2)
+        send_digests(self.later(15))
+        self.send(1)
+        self.assertEquals(send_digests(self.later(10)), [])
+        self.assertEquals(len(send_digests(self.later(15))), 1)
+        self.assertEquals(QueuedEmail.objects.count(), 2)
+
+    def test_current_recipients(self):
+        # the worker never sees the signals sent by the web process, which these bulk updates stand in for
+        get_recipients(self.website)
+        User.objects.filter(username="staff").update(email="new-staff@mg.shadowcon.net")
+        self.send(1)
+        send_digests(self.later(15))
+        self.assertEquals(self.get_email().to, ['admin-test@mg.shadowcon.net', 'new-staff@mg.shadowcon.net'])
+
+    def test_switched_to_immediate(self):
+        self.send(2)
+        EmailList.objects.filter(name="Website").update(digest_minutes=0)
+        self.assertEquals(len(send_digests()), 1)
+
+    def test_command(self):
+        self.send(2)
+        DigestEntry.objects.update(created=self.later(-15))
+        out = StringIO()
+        call_command("send_queued_email", stdout=out)
+        self.assertEquals(out.getvalue(), "Digest of 2 message(s) to Website\nSent 1, will retry 0, failed 0\n")
@@ -1,6 +1,48 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.mail import EmailMessage
+from django.db.models import Q
+from django.utils import timezone
+from shadowcon.versions import bump_version, get_version
 
-from .models import EmailList, UserEmailEntry, GroupEmailEntry
+from .models import DigestEntry, EmailList
+from .outbox import queue_email, queue_emails
+
+FROM_EMAIL = "ShadowCon Website <postmaster@mg.shadowcon.net>"
+
+RECIPIENTS_VERSION_KEY = "contact:recipients_version"
+RECIPIENTS_KEY = "contact:recipients:%s:%s"
+# only the process that makes a change drops its copy straight away, so other workers may use the old list this long
+RECIPIENTS_TIMEOUT = 60
+
+
+def invalidate_recipients():
+    bump_version(RECIPIENTS_VERSION_KEY)
+
+
+def load_recipients(email_list):
+    """
+    The distinct e-mail addresses of the list's users and of the members of its groups, in a single query
+    """
+    return list(User.objects.filter(Q(useremailentry__list=email_list) | Q(groups__groupemailentry__list=email_list))
+                .exclude(email="").order_by('email').values_list('email', flat=True).distinct())
+
+
+def get_recipients(email_list):
+    """
+    The list's addresses for mail sent while handling a request, cached for a short while.  Long running processes
+    should use load_recipients, as they never see the changes made elsewhere.
+    """
+    key = RECIPIENTS_KEY % (email_list.pk, get_version(RECIPIENTS_VERSION_KEY))
+    emails = cache.get(key)
+    if emails is None:
+        emails = load_recipients(email_list)
+        cache.set(key, emails, RECIPIENTS_TIMEOUT)
+    return emails
+
+
+def format_subject(subject_source, subject_details):
+    return "ShadowCon [%s]: %s" % (subject_source, subject_details)
 
 
 def mail_list(subject_source, subject_details, message, email_list=None, list_name=None, reply_to=None):
@@ -9,22 +51,30 @@ def mail_list(subject_source, subject_details, message, email_list=None, list_na
             raise ValueError("Both email_list and list_name are None")
         email_list = EmailList.objects.get(name=list_name)
 
-    users = map(lambda x: x.user, UserEmailEntry.objects.filter(list=email_list))
-    groups = map(lambda x: x.group, GroupEmailEntry.objects.filter(list=email_list))
-    for group in groups:
-        users.extend(group.user_set.all())
+    subject = format_subject(subject_source, subject_details)
+    if email_list.digest_minutes:
+        DigestEntry.objects.create(list=email_list, subject=subject, body=message, reply_to=reply_to or "",
+                                   created=timezone.now())
+        return
 
-    # filter out any duplicate e-mails due to users showing up multiple times in the list
-    emails = set(map(lambda x: x.email, users))
-
-    subject = "ShadowCon [%s]: %s" % (subject_source, subject_details)
-    from_email = "ShadowCon Website <postmaster@mg.shadowcon.net>"
+    emails = get_recipients(email_list)
+    from_email = FROM_EMAIL
 
     if reply_to:
         reply_to = [from_email, reply_to]
 
-    EmailMessage(subject=subject,
-                 body=message,
-                 from_email=from_email,
-                 to=emails,
-                 reply_to=reply_to).send()
+    queue_email(EmailMessage(subject=subject,
+                             body=message,
+                             from_email=from_email,
+                             to=emails,
+                             reply_to=reply_to))
+
+
+def mail_users(subject_source, subject_details, messages):
+    """
+    Queues an e-mail of its own for each user in a list of (user, message) pairs.  Users without an e-mail address are
+    skipped.  Returns the number queued.
+    """
+    subject = format_subject(subject_source, subject_details)
+    return queue_emails([EmailMessage(subject=subject, body=message, from_email=FROM_EMAIL, to=[user.email])
+                         for user, message in messages if user.email])
@@ -1,7 +1,12 @@
+from django.conf.urls import url
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from reversion_compare.admin import CompareVersionAdmin
 from .models import TimeBlock, TimeSlot, ConInfo, Location, Game, PaymentOption, BlockRegistration, Registration
-from .models import Trigger, Referral
+from .models import Trigger, Referral, Announcement
+from .forms import AnnouncementForm
+from .scheduling import get_schedule_conflicts
 
 
 @admin.register(TimeBlock)
@@ -32,6 +37,25 @@ class LocationAdmin(CompareVersionAdmin):
 class GameAdmin(CompareVersionAdmin):
     model = Game
     list_display = ('title', 'gm', 'time_block', 'time_slot', 'location')
+    change_list_template = 'admin/convention/game/change_list.html'
+
+    def save_model(self, request, obj, form, change):
+        # the descriptions page caches each game until it's modified
+        if change and form.changed_data and 'last_modified' not in form.changed_data:
+            obj.last_modified = timezone.now()
+        super(GameAdmin, self).save_model(request, obj, form, change)
+
+    def get_urls(self):
+        urls = [url(r'^conflicts/$', self.admin_site.admin_view(self.conflicts_view),
+                    name='convention_game_conflicts')]
+        return urls + super(GameAdmin, self).get_urls()
+
+    def conflicts_view(self, request):
+        context = dict(self.admin_site.each_context(request),
+                       title="Schedule Conflicts",
+                       opts=self.model._meta,
+                       conflicts=get_schedule_conflicts())
+        return TemplateResponse(request, 'admin/convention/game/conflicts.html', context)
 
 
 @admin.register(PaymentOption)
@@ -60,3 +84,26 @@ class ReferralAdmin(CompareVersionAdmin):
     model = Referral
     ordering = ['user']
     readonly_fields = ['code']
+
+
+@admin.register(Announcement)
+class AnnouncementAdmin(admin.ModelAdmin):
+    model = Announcement
+    form = AnnouncementForm
+    list_display = ('subject', 'audience', 'status', 'queued', 'finished')
+    actions = ['send']
+
+    # a failed announcement can be fixed and sent again, carrying on after the registrations already queued
+    editable_statuses = [Announcement.STATUS_DRAFT, Announcement.STATUS_FAILED]
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None and obj.status not in self.editable_statuses:
+            return ['subject', 'body', 'audience', 'status', 'queued', 'finished', 'last_error']
+        return ['status', 'queued', 'finished', 'last_error']
+
+    def send(self, request, queryset):
+        # the e-mails are rendered and queued by the send_queued_email worker, not in the request
+        count = queryset.filter(status__in=self.editable_statuses) \
+            .update(status=Announcement.STATUS_SENDING, finished=None, last_error="")
+        self.message_user(request, "%d announcement(s) will be sent" % count)
+    send.short_description = "Send the selected announcements"
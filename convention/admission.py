@@ -0,0 +1,94 @@
+from contact.utils import mail_users
+from django.db import transaction
+
+from .models import ConInfo, Registration, RegistrationCounter
+from .utils import friendly_username, get_con_value
+
+
+def is_con_full():
+    """
+    Whether the confirmed places are all taken.  This reads at most as many index entries as the convention has
+    places, however long the wait list is.
+    """
+    capacity = get_con_value('max_attendees')
+    if capacity <= 0:
+        return True
+    return Registration.objects.filter(status=Registration.STATUS_CONFIRMED).order_by('sequence')[capacity - 1:] \
+        .exists()
+
+
+def reconcile_admission():
+    """
+    Confirms the registrations numbered within the convention's capacity and wait lists the rest, for when the
+    capacity changes or a registration is removed.  Holds the same lock as admitting a registration, so the two can't
+    interleave.  Returns the ids of the registrations that were confirmed and of those that were wait listed.
+    """
+    with transaction.atomic():
+        RegistrationCounter.lock()
+        capacity = ConInfo.objects.values_list('max_attendees', flat=True).first() or 0
+
+        # the sequence number of the last registration that fits, or None when everyone does
+        cutoff = 0
+        if capacity > 0:
+            sequences = Registration.objects.order_by('sequence').values_list('sequence', flat=True)
+            last = list(sequences[capacity - 1:capacity])
+            cutoff = last[0] if last else None
+
+        within = Registration.objects.all() if cutoff is None else Registration.objects.filter(sequence__lte=cutoff)
+        beyond = Registration.objects.none() if cutoff is None else Registration.objects.filter(sequence__gt=cutoff)
+        promoted = list(within.filter(status=Registration.STATUS_WAIT_LISTED).order_by('sequence')
+                        .values_list('id', flat=True))
+        demoted = list(beyond.filter(status=Registration.STATUS_CONFIRMED).order_by('sequence')
+                       .values_list('id', flat=True))
+
+        Registration.objects.filter(id__in=promoted).update(status=Registration.STATUS_CONFIRMED)
+        Registration.objects.filter(id__in=demoted).update(status=Registration.STATUS_WAIT_LISTED)
+        return promoted, demoted
+
+
+def promotion_message(registration):
+    return "\n".join(["%s,",
+                      "",
+                      "A place has opened up at ShadowCon and your registration has moved off the wait list, so "
+                      "you're now confirmed.  Your attendance and donation choices are unchanged, and you can review "
+                      "them on your profile page.",
+                      "",
+                      "We look forward to seeing you!"]) % friendly_username(registration.user)
+
+
+def demotion_message(registration):
+    return "\n".join(["%s,",
+                      "",
+                      "The number of places at ShadowCon has been reduced and your registration has moved back onto "
+                      "the wait list.  Your attendance and donation choices are kept, and we'll e-mail you if a place "
+                      "opens up for you.  You can see your place on the wait list on your profile page.",
+                      "",
+                      "We're sorry for the change."]) % friendly_username(registration.user)
+
+
+def notify_admission(registration_ids, subject_details, message):
+    """
+    Queues an e-mail to each of the registrations, with the message made for its registration.  Returns the number
+    queued.
+    """
+    if not registration_ids:
+        return 0
+    registrations = Registration.objects.select_related('user').filter(id__in=registration_ids).order_by('sequence')
+    return mail_users("Registration", subject_details,
+                      [(registration.user, message(registration)) for registration in registrations])
+
+
+def notify_promoted(registration_ids):
+    """
+    Queues an e-mail to everyone whose registration was confirmed off the wait list, one message each.  Returns the
+    number queued.
+    """
+    return notify_admission(registration_ids, "You're off the wait list", promotion_message)
+
+
+def notify_demoted(registration_ids):
+    """
+    Queues an e-mail to everyone whose confirmed registration was moved back onto the wait list, one message each.
+    Returns the number queued.
+    """
+    return notify_admission(registration_ids, "You're back on the wait list", demotion_message)
@@ -0,0 +1,118 @@
+from contact.outbox import queue_emails
+from contact.utils import FROM_EMAIL, format_subject
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template import Context, Template, TemplateSyntaxError
+from django.utils import timezone
+
+from .models import Announcement, BlockRegistration
+from .reports import attendance_text
+from .utils import friendly_username
+
+# registrations rendered and queued per transaction
+ANNOUNCEMENT_BATCH_SIZE = 200
+
+
+def announcement_context(registration):
+    # the e-mails are plain text, so nothing is escaped
+    return Context({'name': friendly_username(registration.user),
+                    'user': registration.user,
+                    'registration': registration,
+                    'attendance': [(entry.time_block.text, attendance_text(entry.attendance))
+                                   for entry in registration.blockregistration_set.all()],
+                    }, autoescape=False)
+
+
+def render_announcement(announcement, registrations, template=None):
+    """
+    The announcement as an e-mail to each of the registrations with an e-mail address
+    """
+    template = template or Template(announcement.body)
+    subject = format_subject("Announcement", announcement.subject)
+    return [EmailMessage(subject=subject, body=template.render(announcement_context(registration)),
+                         from_email=FROM_EMAIL, to=[registration.user.email])
+            for registration in registrations if registration.user.email]
+
+
+def fail_announcement(announcement, error):
+    """
+    Sets the announcement aside with the error, so the worker moves on to the others instead of stopping on it every
+    time it runs
+    """
+    announcement.status = Announcement.STATUS_FAILED
+    announcement.finished = timezone.now()
+    announcement.last_error = "%s: %s" % (error.__class__.__name__, error)
+    Announcement.objects.filter(pk=announcement.pk, status=Announcement.STATUS_SENDING) \
+        .update(status=announcement.status, finished=announcement.finished, last_error=announcement.last_error)
+
+
+def compile_announcement(announcement):
+    """
+    The announcement's body as a template, or None when it isn't a valid one, which fails the announcement
+    """
+    try:
+        return Template(announcement.body)
+    except TemplateSyntaxError as e:
+        fail_announcement(announcement, e)
+        return None
+
+
+def queue_announcement_batch(announcement_id, batch_size=ANNOUNCEMENT_BATCH_SIZE, template=None):
+    """
+    Queues the announcement to the next batch of its registrations, returning the announcement, or None when it isn't
+    being sent.  Progress is saved in the same transaction as the e-mails, so stopping part way neither loses nor
+    repeats any.
+    """
+    with transaction.atomic():
+        announcement = Announcement.objects.select_for_update().filter(pk=announcement_id,
+                                                                       status=Announcement.STATUS_SENDING).first()
+        if announcement is None:
+            return None
+        template = template or compile_announcement(announcement)
+        if template is None:
+            return announcement
+
+        entries = BlockRegistration.objects.select_related('time_block').order_by('time_block__sort_id')
+        registrations = list(announcement.get_registrations().filter(id__gt=announcement.last_registration)
+                             .select_related('user').prefetch_related(Prefetch('blockregistration_set', entries))
+                             .order_by('id')[:batch_size])
+        if registrations:
+            try:
+                # a tag can fail while rendering, such as a url that doesn't resolve, and may leave a query broken
+                with transaction.atomic():
+                    emails = render_announcement(announcement, registrations, template)
+            except Exception as e:
+                fail_announcement(announcement, e)
+                return announcement
+            announcement.queued += queue_emails(emails)
+            announcement.last_registration = registrations[-1].id
+        else:
+            announcement.status = Announcement.STATUS_SENT
+            announcement.finished = timezone.now()
+        announcement.save(update_fields=['queued', 'last_registration', 'status', 'finished'])
+        return announcement
+
+
+def describe_announcement(announcement):
+    if announcement.status == Announcement.STATUS_FAILED:
+        return "%s: failed, %s" % (announcement.subject, announcement.last_error)
+    return "%s: queued %d e-mail(s)" % (announcement.subject, announcement.queued)
+
+
+def queue_announcements(batch_size=ANNOUNCEMENT_BATCH_SIZE):
+    """
+    Queues every announcement being sent to all of its registrations.  Returns the announcements finished, including
+    any that failed.
+    """
+    finished = []
+    for announcement in Announcement.objects.filter(status=Announcement.STATUS_SENDING).order_by('id'):
+        template = compile_announcement(announcement)
+        if template is None:
+            finished.append(announcement)
+            continue
+        while announcement is not None and announcement.status == Announcement.STATUS_SENDING:
+            announcement = queue_announcement_batch(announcement.id, batch_size, template)
+        if announcement is not None:
+            finished.append(announcement)
+    return finished
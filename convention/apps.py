@@ -5,3 +5,6 @@ from django.apps import AppConfig
 
 class ConConfig(AppConfig):
     name = 'convention'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,5 @@
+from .utils import get_convention_context
+
+
+def convention(request):
+    return {'convention': get_convention_context(request)}
@@ -1,16 +1,17 @@
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.forms import CharField, ChoiceField, Form
+from django.forms import CharField, ChoiceField, Form, ModelForm
+from django.template import Template, TemplateSyntaxError
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 from registration.forms import RegistrationForm as BaseRegistrationForm, get_user_model
-from reversion import revisions as reversion
 
-from .models import BlockRegistration, TimeBlock, Registration, PaymentOption, Referral
-from .utils import get_registration, friendly_username
+from .models import BlockRegistration, TimeBlock, Registration, PaymentOption, Referral, Announcement
+from .summary import apply_changes, combined_changes, counted
+from .utils import get_registration, friendly_username, save_revision
 from contact.utils import mail_list
 
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 import pytz
 
 
@@ -51,7 +52,7 @@ class AttendanceForm(Form):
     def __init__(self, user=None, *args, **kwargs):
         super(AttendanceForm, self).__init__(*args, **kwargs)
 
-        registration = Registration.objects.filter(user=user)
+        registration = Registration.objects.filter(user=user).select_related('user', 'payment')
         if registration:
             self.registration = registration[0]
             date = self.registration.registration_date.astimezone(pytz.timezone('US/Pacific'))
@@ -62,13 +63,12 @@ class AttendanceForm(Form):
         if 'data' not in kwargs:
             kwargs['data'] = {}
             if registration:
-                entries = BlockRegistration.objects.filter(registration=self.registration)
-                for entry in entries:
-                    time_block = TimeBlock.objects.filter(text__exact=entry.time_block)
-                    if time_block:
-                        kwargs['data']["block_%s" % time_block[0].id] = entry.attendance
+                for entry in BlockRegistration.objects.filter(registration=self.registration):
+                    kwargs['data']["block_%s" % entry.time_block_id] = entry.attendance
 
-        for time_block in TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id'):
+        self.time_blocks = OrderedDict((time_block.id, time_block) for time_block in
+                                       TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id'))
+        for time_block in self.time_blocks.values():
             initial = kwargs['data'].get("block_%s" % time_block.id, BlockRegistration.ATTENDANCE_YES)
             self.fields["block_%s" % time_block.id] = ChoiceField(choices=BlockRegistration.ATTENDANCE_CHOICES,
                                                                   label=time_block.text,
@@ -95,31 +95,61 @@ class AttendanceForm(Form):
                                              registration_date=timezone.now(),
                                              payment=PaymentOption.objects.all()[0])
 
-        with transaction.atomic(), reversion.create_revision():
-            reversion.set_user(self.user)
-            reversion.set_comment("Form Submission - %s" % ("Initial" if new_entry else "Update"))
-
+        with transaction.atomic():
             self.registration.last_updated = timezone.now()
             self.registration.save()
 
-            old_regs = {}
-            for reg in BlockRegistration.objects.filter(registration=self.registration):
-                old_regs[reg.time_block] = reg
-
+            # compare with what's stored in memory, so the writes take the same number of queries for any number of
+            # time blocks
+            old_regs = dict((reg.time_block_id, reg)
+                            for reg in BlockRegistration.objects.filter(registration=self.registration))
+            entries = []
+            added = []
+            changed = defaultdict(list)
+            counts = []
             for key, field in self.time_block_fields().iteritems():
-                time_block = TimeBlock.objects.filter(id=key.split("_")[1])[0].text
-                if time_block in old_regs:
-                    old_regs[time_block].attendance = field.initial
-                    old_regs[time_block].save()
-                    del old_regs[time_block]
-                else:
-                    BlockRegistration(registration=self.registration, time_block=time_block,
-                                      attendance=field.initial).save()
-
-            for obsolete in old_regs.values():
-                obsolete.delete()
-
-        self.send_mail(self.registration, new_entry)
+                time_block = self.time_blocks[int(key.split("_")[1])]
+                entry = old_regs.pop(time_block.id, None)
+                if entry is None:
+                    entry = BlockRegistration(registration=self.registration, time_block=time_block,
+                                              attendance=field.initial)
+                    added.append(entry)
+                    counts.append((None, counted(entry)))
+                elif entry.attendance != field.initial:
+                    previous = counted(entry)
+                    entry.attendance = field.initial
+                    changed[entry.attendance].append(entry.id)
+                    counts.append((previous, counted(entry)))
+
+                # the versions describe each entry by its registration and time block
+                entry.registration = self.registration
+                entry.time_block = time_block
+                entries.append(entry)
+
+            BlockRegistration.objects.bulk_create(added)
+            for attendance, ids in changed.items():
+                BlockRegistration.objects.filter(id__in=ids).update(attendance=attendance)
+
+            # bulk writes don't send the signals that keep the summary up to date, and the ones the delete sends are
+            # combined with them
+            with combined_changes():
+                apply_changes(counts)
+                if old_regs:
+                    BlockRegistration.objects.filter(id__in=[reg.id for reg in old_regs.values()]).delete()
+
+            if added and added[0].pk is None:
+                # only some databases return the ids of bulk inserted rows
+                ids = dict(BlockRegistration.objects.filter(registration=self.registration,
+                                                            time_block__in=[reg.time_block_id for reg in added])
+                           .values_list('time_block', 'id'))
+                for entry in added:
+                    entry.pk = ids[entry.time_block_id]
+
+            save_revision([self.registration] + entries, user=self.user,
+                          comment="Form Submission - %s" % ("Initial" if new_entry else "Update"))
+
+            # queued in the same transaction, so the staff are told about exactly the registrations that are saved
+            self.send_mail(self.registration, new_entry)
 
     def clean(self):
         result = super(AttendanceForm, self).clean()
@@ -133,3 +163,19 @@ class AttendanceForm(Form):
                                     "unregister, please use the contact us at the bottom of the page."),
                                   code="invalid data")
         return result
+
+
+class AnnouncementForm(ModelForm):
+    class Meta:
+        model = Announcement
+        fields = ['subject', 'body', 'audience']
+
+    def clean_body(self):
+        # the worker compiles the body when it's sent, so a bad one is caught while it can still be fixed
+        body = self.cleaned_data['body']
+        try:
+            Template(body)
+        except TemplateSyntaxError as e:
+            raise ValidationError(_("The body is not a valid template: %(error)s"), code="invalid template",
+                                  params={'error': e})
+        return body
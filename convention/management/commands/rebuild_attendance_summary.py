@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from convention.summary import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = "Recounts the attendance summary from the registrations, repairing counts that drifted after changes " \
+           "made without signals, such as bulk updates or loading fixtures."
+
+    def handle(self, *args, **options):
+        rows = rebuild_summary()
+        for row in sorted(rows, key=lambda x: x.time_block.sort_id):
+            self.stdout.write("%s: %d yes, %d maybe, %d no, %d missing" % (row.time_block.text, row.yes, row.maybe,
+                                                                           row.no, row.missing))
+        self.stdout.write("Rebuilt %d time block(s)" % len(rows))
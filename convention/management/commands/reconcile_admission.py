@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from convention.admission import notify_demoted, notify_promoted, reconcile_admission
+from convention.models import Registration
+from convention.utils import friendly_username
+
+
+class Command(BaseCommand):
+    help = "Confirms the registrations that fit within the convention's capacity and wait lists the rest, e-mailing " \
+           "everyone moved on or off the wait list.  Use it after changes made without signals, such as bulk deletes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-email', action='store_false', dest='email', default=True,
+                            help="Don't e-mail the people moved on or off the wait list")
+
+    def handle(self, *args, **options):
+        promoted, demoted = reconcile_admission()
+
+        names = dict((registration.id, friendly_username(registration.user)) for registration in
+                     Registration.objects.select_related('user').filter(id__in=promoted + demoted))
+        for registration_id in promoted:
+            self.stdout.write("Confirmed %s" % names[registration_id])
+        for registration_id in demoted:
+            self.stdout.write("Wait listed %s" % names[registration_id])
+
+        queued = notify_promoted(promoted) + notify_demoted(demoted) if options['email'] else 0
+        self.stdout.write("Confirmed %d, wait listed %d, e-mails queued %d" % (len(promoted), len(demoted), queued))
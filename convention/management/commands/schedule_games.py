@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from convention.solver import apply_proposals, get_schedule_solver
+
+
+class Command(BaseCommand):
+    help = "Proposes a time block, time slot and location for every game that isn't fully scheduled, avoiding room " \
+           "and GM conflicts and following the games' preferences where possible."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true', default=False,
+                            help="Save the proposed schedule instead of only printing it")
+        parser.add_argument('--seed', type=int, default=0, help="Seed for breaking ties between placements")
+        parser.add_argument('--time-limit', type=float, default=10, help="Seconds to spend improving the schedule")
+
+    def handle(self, *args, **options):
+        solver = get_schedule_solver(seed=options['seed'], time_limit=options['time_limit'])
+        proposals = solver.solve()
+
+        for proposal in proposals:
+            if proposal.time_block is None:
+                self.stdout.write("%s: no placement found" % proposal.game.title)
+            else:
+                self.stdout.write("%s: %s, %s" % (proposal.game.title,
+                                                  proposal.time_block.get_combined(proposal.time_slot),
+                                                  proposal.location))
+
+        self.stdout.write("Proposed %d game(s), %d conflict(s) left" % (
+            len([x for x in proposals if x.time_block is not None]), solver.conflict_count()))
+
+        if options['apply']:
+            self.stdout.write("Saved %d game(s)" % apply_proposals(proposals))
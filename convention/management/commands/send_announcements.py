@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+import time
+
+from convention.announcements import ANNOUNCEMENT_BATCH_SIZE, describe_announcement, queue_announcements
+
+
+class Command(BaseCommand):
+    help = "Queues the announcements being sent as an e-mail to each person, carrying on from where any earlier run " \
+           "stopped.  The send_queued_email worker does this too, then delivers them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ANNOUNCEMENT_BATCH_SIZE,
+                            help="Registrations queued per transaction")
+        parser.add_argument('--loop', action='store_true', default=False,
+                            help="Keep checking for announcements until stopped")
+        parser.add_argument('--interval', type=float, default=10,
+                            help="Seconds to wait between checks when looping")
+
+    def handle(self, *args, **options):
+        while True:
+            for announcement in queue_announcements(options['batch_size']):
+                self.stdout.write(describe_announcement(announcement))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
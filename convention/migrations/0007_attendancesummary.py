@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0006_referral_admin_form'),
+    ]
+
+    # the counts are filled in by 0009, once each entry is linked to its time block
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSummary',
+            fields=[
+                ('time_block', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='convention.TimeBlock')),
+                ('yes', models.IntegerField(default=0)),
+                ('maybe', models.IntegerField(default=0)),
+                ('no', models.IntegerField(default=0)),
+                ('missing', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
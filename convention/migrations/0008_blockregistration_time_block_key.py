@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_time_blocks(apps, schema_editor):
+    TimeBlock = apps.get_model('convention', 'TimeBlock')
+    BlockRegistration = apps.get_model('convention', 'BlockRegistration')
+
+    for block in TimeBlock.objects.all():
+        BlockRegistration.objects.filter(time_block=block.text).update(block=block)
+
+    # copies of the same answer lose nothing when dropped, but anything else is attendee data for staff to sort out
+    problems = ["%s answered %s for '%s', which isn't a time block" %
+                (entry.registration.user.username, entry.attendance, entry.time_block)
+                for entry in BlockRegistration.objects.filter(block__isnull=True).select_related('registration__user')]
+    answers = {}
+    copies = []
+    for entry in BlockRegistration.objects.filter(block__isnull=False).select_related('registration__user') \
+            .order_by('id'):
+        key = (entry.registration_id, entry.block_id)
+        if key not in answers:
+            answers[key] = entry
+        elif answers[key].attendance == entry.attendance:
+            copies.append(entry.id)
+        else:
+            problems.append("%s answered both %s and %s for '%s'" % (entry.registration.user.username,
+                                                                      answers[key].attendance, entry.attendance,
+                                                                      entry.time_block))
+
+    if problems:
+        raise ValueError("Fix or remove these attendance entries before migrating:\n" + "\n".join(problems))
+    BlockRegistration.objects.filter(id__in=copies).delete()
+
+
+def copy_time_block_text(apps, schema_editor):
+    TimeBlock = apps.get_model('convention', 'TimeBlock')
+    BlockRegistration = apps.get_model('convention', 'BlockRegistration')
+
+    for block in TimeBlock.objects.all():
+        BlockRegistration.objects.filter(block=block).update(time_block=block.text)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0007_attendancesummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockregistration',
+            name='block',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='convention.TimeBlock'),
+        ),
+        # lets the text column be added back empty when migrating backwards
+        migrations.AlterField(
+            model_name='blockregistration',
+            name='time_block',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.RunPython(link_time_blocks, copy_time_block_text),
+    ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def count_attendance(apps, schema_editor):
+    TimeBlock = apps.get_model('convention', 'TimeBlock')
+    Registration = apps.get_model('convention', 'Registration')
+    BlockRegistration = apps.get_model('convention', 'BlockRegistration')
+    AttendanceSummary = apps.get_model('convention', 'AttendanceSummary')
+
+    counts = {}
+    for row in BlockRegistration.objects.values('time_block', 'attendance').annotate(count=Count('id')):
+        counts[(row['time_block'], row['attendance'])] = row['count']
+    total = Registration.objects.count()
+
+    for block in TimeBlock.objects.all():
+        values = dict((field, counts.get((block.id, attendance), 0))
+                      for attendance, field in [('Y', 'yes'), ('M', 'maybe'), ('N', 'no')])
+        AttendanceSummary.objects.create(time_block=block, missing=total - sum(values.values()), **values)
+
+
+def clear_attendance(apps, schema_editor):
+    apps.get_model('convention', 'AttendanceSummary').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0008_blockregistration_time_block_key'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='blockregistration',
+            name='time_block',
+        ),
+        migrations.RenameField(
+            model_name='blockregistration',
+            old_name='block',
+            new_name='time_block',
+        ),
+        migrations.AlterField(
+            model_name='blockregistration',
+            name='time_block',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='convention.TimeBlock'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='blockregistration',
+            unique_together=set([('registration', 'time_block')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='blockregistration',
+            index_together=set([('time_block', 'attendance')]),
+        ),
+        migrations.RunPython(count_attendance, clear_attendance),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from shadowcon.sqlite import keep_foreign_keys
+
+
+def number_registrations(apps, schema_editor):
+    ConInfo = apps.get_model('convention', 'ConInfo')
+    Registration = apps.get_model('convention', 'Registration')
+    RegistrationCounter = apps.get_model('convention', 'RegistrationCounter')
+
+    info = ConInfo.objects.first()
+    capacity = info.max_attendees if info else 0
+
+    sequence = 0
+    for registration in Registration.objects.order_by('registration_date', 'id'):
+        sequence += 1
+        registration.sequence = sequence
+        registration.status = 'C' if sequence <= capacity else 'W'
+        registration.save(update_fields=['sequence', 'status'])
+
+    RegistrationCounter.objects.create(pk=1, last_sequence=sequence)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0009_blockregistration_time_block_fk'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_foreign_keys, keep_foreign_keys),
+        migrations.CreateModel(
+            name='RegistrationCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_sequence', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='sequence',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='status',
+            field=models.CharField(choices=[('C', 'Confirmed'), ('W', 'Wait Listed')], default='C', max_length=1),
+        ),
+        migrations.RunPython(number_registrations, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='registration',
+            name='sequence',
+            field=models.PositiveIntegerField(editable=False, unique=True),
+        ),
+    ]
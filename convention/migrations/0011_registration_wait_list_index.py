@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from shadowcon.sqlite import keep_foreign_keys
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0010_registration_admission'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_foreign_keys, keep_foreign_keys),
+        migrations.AlterIndexTogether(
+            name='registration',
+            index_together=set([('status', 'sequence')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 17:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0011_registration_wait_list_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Announcement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=256)),
+                ('body', models.TextField(help_text='Rendered for each person as a Django template with name, user, registration and attendance, a list of time blocks with their attendance choice.')),
+                ('audience', models.CharField(choices=[('A', 'Everyone Registered'), ('C', 'Confirmed'), ('W', 'Wait Listed')], default='A', max_length=1)),
+                ('status', models.CharField(choices=[('D', 'Draft'), ('S', 'Sending'), ('F', 'Sent')], default='D', editable=False, max_length=1)),
+                ('last_registration', models.PositiveIntegerField(default=0, editable=False)),
+                ('queued', models.PositiveIntegerField(default=0, editable=False)),
+                ('finished', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import re
+
+
+def slug_games(apps, schema_editor):
+    Game = apps.get_model('convention', 'Game')
+
+    # the earliest game with a title keeps the plain slug, matching the anchor it had before
+    taken = set()
+    for game in Game.objects.order_by('id'):
+        base = re.sub('[^A-Za-z0-9]', '_', game.title.strip().lower())[:256] or "game"
+        slug = base
+        number = 2
+        while slug in taken:
+            slug = "%s_%d" % (base, number)
+            number += 1
+        taken.add(slug)
+        game.slug = slug
+        game.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0012_announcement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='slug',
+            field=models.SlugField(editable=False, max_length=300, null=True),
+        ),
+        migrations.RunPython(slug_games, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='game',
+            name='slug',
+            field=models.SlugField(editable=False, max_length=300, unique=True),
+        ),
+    ]
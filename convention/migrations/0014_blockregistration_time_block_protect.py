@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0013_game_slug'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blockregistration',
+            name='time_block',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='convention.TimeBlock'),
+        ),
+    ]
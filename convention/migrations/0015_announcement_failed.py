@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('convention', '0014_blockregistration_time_block_protect'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcement',
+            name='last_error',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AlterField(
+            model_name='announcement',
+            name='status',
+            field=models.CharField(choices=[('D', 'Draft'), ('S', 'Sending'), ('F', 'Sent'), ('E', 'Failed')], default='D', editable=False, max_length=1),
+        ),
+    ]
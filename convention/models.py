@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 from ckeditor.fields import RichTextField
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.template.defaultfilters import slugify
 from django.utils.html import strip_tags
 from django.conf import settings
@@ -113,6 +113,31 @@ class Location(models.Model):
         return self.text
 
 
+def header_target(title):
+    return re.sub('[^A-Za-z0-9]', '_', (title or "").strip().lower())
+
+
+def slug_base(title):
+    return header_target(title)[:256] or "game"
+
+
+# times a new game looks for a free slug when games with the same title are saved together
+SLUG_ATTEMPTS = 5
+
+
+def unique_slug(base, taken):
+    """
+    The base, or the base numbered from 2 when that's taken
+    """
+    taken = set(taken)
+    slug = base
+    number = 2
+    while slug in taken:
+        slug = "%s_%d" % (base, number)
+        number += 1
+    return slug
+
+
 @reversion.register()
 class Trigger(models.Model):
     text = models.CharField(max_length=256)
@@ -139,6 +164,27 @@ class Game(models.Model):
                                         help_text="(e.g. preferred room)", default="")
     last_modified = models.DateTimeField()
     last_scheduled = models.DateTimeField(blank=True, null=True)
+    slug = models.SlugField(max_length=300, unique=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        # the slug is the game's address, so it's chosen once from the first title and kept when the title changes
+        if self.slug:
+            super(Game, self).save(*args, **kwargs)
+            return
+
+        base = slug_base(self.title)
+        for attempt in range(SLUG_ATTEMPTS):
+            self.slug = unique_slug(base, Game.objects.filter(slug__startswith=base).values_list('slug', flat=True))
+            try:
+                with transaction.atomic():
+                    super(Game, self).save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # another game with the same title may have been saved since the slug was chosen
+                taken = Game.objects.filter(slug=self.slug).exists()
+                self.slug = ""
+                if not taken or attempt == SLUG_ATTEMPTS - 1:
+                    raise
 
     def __str__(self):
         format_str = "Title: %s, GM: %s, Time Block: %s, Time Slot: %s, Location: %s, " + \
@@ -173,7 +219,10 @@ class Game(models.Model):
                                     get_absolute_url(request, "admin:convention_game_change", args=(self.id,)))
 
     def header_target(self):
-        return re.sub('[^A-Za-z0-9]', '_', str(self.title).strip().lower())
+        return self.slug or header_target(self.title)
+
+    def get_absolute_url(self):
+        return reverse('convention:game_detail', args=(self.slug,))
 
     def friendly_block(self):
         if self.time_block is not None:
@@ -202,13 +251,76 @@ class PaymentOption(models.Model):
         super(PaymentOption, self).save(*args, **kwargs)
 
 
+class RegistrationCounter(models.Model):
+    """
+    The last sequence number given to a registration.  Its single row is locked while a registration is admitted, so
+    registrations submitted together are numbered and admitted one at a time.
+    """
+    last_sequence = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def lock(cls, take=0):
+        """
+        Locks the row until the end of the transaction, first adding the given count to the last sequence number.  The
+        row is written before it's read, which holds the lock on every database, where select_for_update does nothing
+        on SQLite.
+        """
+        if not cls.objects.filter(pk=1).update(last_sequence=models.F('last_sequence') + take):
+            # the migration creates the row, so only a flushed database is missing it
+            last = Registration.objects.aggregate(models.Max('sequence'))['sequence__max'] or 0
+            return cls.objects.create(pk=1, last_sequence=last + take)
+        return cls.objects.get(pk=1)
+
+
 @reversion.register()
 class Registration(models.Model):
+    STATUS_CONFIRMED = 'C'
+    STATUS_WAIT_LISTED = 'W'
+    STATUS_CHOICES = (
+        (STATUS_CONFIRMED, 'Confirmed'),
+        (STATUS_WAIT_LISTED, 'Wait Listed'),
+    )
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     registration_date = models.DateTimeField()
     last_updated = models.DateTimeField()
     payment = models.ForeignKey(PaymentOption)
     payment_received = models.BooleanField(default=False)
+    sequence = models.PositiveIntegerField(unique=True, editable=False)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_CONFIRMED)
+
+    class Meta:
+        # the wait list in order, so a position is counted from the index
+        index_together = ('status', 'sequence')
+
+    def save(self, *args, **kwargs):
+        if self.pk is None and self.sequence is None:
+            with transaction.atomic():
+                self.admit()
+                super(Registration, self).save(*args, **kwargs)
+        else:
+            super(Registration, self).save(*args, **kwargs)
+
+    def admit(self):
+        """
+        Numbers a new registration and confirms it while the convention has room, otherwise wait lists it
+        """
+        self.sequence = RegistrationCounter.lock(take=1).last_sequence
+
+        capacity = ConInfo.objects.values_list('max_attendees', flat=True).first() or 0
+        confirmed = Registration.objects.filter(status=self.STATUS_CONFIRMED).count()
+        self.status = self.STATUS_CONFIRMED if confirmed < capacity else self.STATUS_WAIT_LISTED
+
+    @property
+    def is_wait_listed(self):
+        return self.status == self.STATUS_WAIT_LISTED
+
+    def wait_list_position(self):
+        """
+        Where the registration is on the wait list, starting from 1, or None when it's confirmed
+        """
+        if not self.is_wait_listed:
+            return None
+        return Registration.objects.filter(status=self.STATUS_WAIT_LISTED, sequence__lt=self.sequence).count() + 1
 
     def __str__(self):
         return "User: %s, Registration Date: %s, Payment: %s, Payment Received: %s, Last Updated: %s" % \
@@ -225,17 +337,45 @@ class BlockRegistration(models.Model):
         (ATTENDANCE_YES, 'Yes'),
         (ATTENDANCE_NO, 'No'),
     )
-    time_block = models.CharField(max_length=64)
+    # a time block people have answered for can't be deleted, so their answers are never lost with it
+    time_block = models.ForeignKey(TimeBlock, on_delete=models.PROTECT)
     registration = models.ForeignKey(Registration, on_delete=models.CASCADE)
     attendance = models.CharField(max_length=1, choices=ATTENDANCE_CHOICES, default=ATTENDANCE_YES)
 
+    class Meta:
+        unique_together = ('registration', 'time_block')
+        index_together = ('time_block', 'attendance')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(BlockRegistration, cls).from_db(db, field_names, values)
+        # the attendance summary needs to know what a changed entry counted towards before
+        if 'time_block_id' in field_names and 'attendance' in field_names:
+            instance._counted = (instance.time_block_id, instance.attendance)
+        return instance
+
     def __str__(self):
         return "Registration: %s, Time Block: %s, Attendance: %s" % \
                (self.registration,
-                self.time_block,
+                self.time_block.text,
                 get_choice(self.attendance, self.ATTENDANCE_CHOICES))
 
 
+class AttendanceSummary(models.Model):
+    """
+    Running attendance counts for a time block, kept up to date as registrations change
+    """
+    time_block = models.OneToOneField(TimeBlock, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    yes = models.IntegerField(default=0)
+    maybe = models.IntegerField(default=0)
+    no = models.IntegerField(default=0)
+    missing = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "Time Block: %s, Yes: %s, Maybe: %s, No: %s, Missing: %s" % \
+               (self.time_block, self.yes, self.maybe, self.no, self.missing)
+
+
 def generate_code():
     while True:
         code = crypto.get_random_string(8, "ABCDEFGHJKLMNPRSTUVWXY345679")
@@ -252,3 +392,47 @@ class Referral(models.Model):
     def __str__(self):
         return "From: %s, Referral code: %s, To: %s" % \
             (self.user, self.code, self.referred_user if self.referred_user else "unredeemed")
+
+
+class Announcement(models.Model):
+    """
+    An e-mail sent to each registrant separately, with the body rendered for them.  Once it's sent, a worker queues
+    the e-mails a batch at a time, recording how far it got so it can carry on after being stopped.  A body the worker
+    can't compile or render fails the announcement, so it can be fixed and sent again.
+    """
+    AUDIENCE_ALL = 'A'
+    AUDIENCE_CONFIRMED = Registration.STATUS_CONFIRMED
+    AUDIENCE_WAIT_LISTED = Registration.STATUS_WAIT_LISTED
+    AUDIENCE_CHOICES = (
+        (AUDIENCE_ALL, 'Everyone Registered'),
+        (AUDIENCE_CONFIRMED, 'Confirmed'),
+        (AUDIENCE_WAIT_LISTED, 'Wait Listed'),
+    )
+    STATUS_DRAFT = 'D'
+    STATUS_SENDING = 'S'
+    STATUS_SENT = 'F'
+    STATUS_FAILED = 'E'
+    STATUS_CHOICES = (
+        (STATUS_DRAFT, 'Draft'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    subject = models.CharField(max_length=256)
+    body = models.TextField(help_text="Rendered for each person as a Django template with name, user, registration "
+                                      "and attendance, a list of time blocks with their attendance choice.")
+    audience = models.CharField(max_length=1, choices=AUDIENCE_CHOICES, default=AUDIENCE_ALL)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_DRAFT, editable=False)
+    last_registration = models.PositiveIntegerField(default=0, editable=False)
+    queued = models.PositiveIntegerField(default=0, editable=False)
+    finished = models.DateTimeField(null=True, blank=True, editable=False)
+    last_error = models.TextField(blank=True, default="", editable=False)
+
+    def get_registrations(self):
+        registrations = Registration.objects.all()
+        if self.audience != self.AUDIENCE_ALL:
+            registrations = registrations.filter(status=self.audience)
+        return registrations
+
+    def __str__(self):
+        return self.subject
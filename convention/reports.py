@@ -0,0 +1,215 @@
+from django.contrib.auth.models import User
+from django.db.models import Count
+from django.utils.encoding import force_bytes
+from django.utils.functional import cached_property
+
+import csv
+
+from .models import BlockRegistration, Registration, TimeBlock, get_choice
+from .summary import attendance_fields, get_summary
+from .utils import friendly_username
+
+MISSING = "Missing"
+
+# rows read per query by the exports, which bounds their memory use
+EXPORT_BATCH_SIZE = 500
+
+attendance_order = [BlockRegistration.ATTENDANCE_YES, BlockRegistration.ATTENDANCE_MAYBE,
+                    BlockRegistration.ATTENDANCE_NO]
+
+
+def attendance_text(attendance):
+    return get_choice(attendance, BlockRegistration.ATTENDANCE_CHOICES)
+
+
+class AttendanceReport(object):
+    """
+    Everything the attendance list shows, read with a fixed number of queries however many people registered
+    """
+
+    @cached_property
+    def time_blocks(self):
+        return list(TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id'))
+
+    @cached_property
+    def registrations(self):
+        return list(Registration.objects.select_related('user', 'payment').prefetch_related('blockregistration_set')
+                    .order_by('id'))
+
+    @cached_property
+    def totals(self):
+        """
+        Rows of (label, [count per time block]) for each attendance choice and for missing entries, read from the
+        attendance summary
+        """
+        summary = get_summary(self.time_blocks)
+        rows = [(attendance_text(attendance), [getattr(row, attendance_fields[attendance]) for row in summary])
+                for attendance in attendance_order]
+        rows.append((MISSING, [row.missing for row in summary]))
+        return rows
+
+    @cached_property
+    def details(self):
+        """
+        Rows of (name, [attendance per time block]) for each registration
+        """
+        rows = []
+        for registration in self.registrations:
+            entries = dict((entry.time_block_id, entry.attendance)
+                           for entry in registration.blockregistration_set.all())
+            rows.append((friendly_username(registration.user),
+                         [attendance_text(entries[block.id]) if block.id in entries else MISSING
+                          for block in self.time_blocks]))
+        return rows
+
+    @cached_property
+    def payments(self):
+        """
+        Rows of (name, payment option, received) for each registration
+        """
+        return [(friendly_username(registration.user), registration.payment.name,
+                 "Yes" if registration.payment_received else "No") for registration in self.registrations]
+
+    @cached_property
+    def contact_info(self):
+        """
+        Every user, with registered set when they have a registration
+        """
+        users = list(User.objects.annotate(registration_count=Count('registration')).order_by('id'))
+        for user in users:
+            user.registered = user.registration_count > 0
+        return users
+
+
+def batches(queryset, size=EXPORT_BATCH_SIZE):
+    """
+    Yields lists of the queryset's objects in primary key order, with one query per batch.  Unlike iterator(), this
+    keeps memory flat on every database backend, and prefetch_related still works for each batch.
+    """
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        batch = list((queryset if last is None else queryset.filter(pk__gt=last))[:size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1].pk
+
+
+def each(queryset, size=EXPORT_BATCH_SIZE):
+    for batch in batches(queryset, size):
+        for obj in batch:
+            yield obj
+
+
+def csv_value(value):
+    # spreadsheets run cells starting with these as formulas
+    value = force_bytes(value)
+    if value[:1] in ("=", "+", "-", "@"):
+        value = "'" + value
+    return value
+
+
+class Echo(object):
+    """
+    File-like object that hands back what the csv writer writes, so each row can be streamed as it's made
+    """
+
+    def write(self, value):
+        return value
+
+
+class CsvExport(object):
+    """
+    A spreadsheet of one row per object.  Subclasses list their columns as (key, header, value function) and the
+    objects the rows come from.
+    """
+    filename = None
+    batch_size = EXPORT_BATCH_SIZE
+
+    def get_columns(self):
+        raise NotImplementedError
+
+    def get_objects(self):
+        raise NotImplementedError
+
+    def select(self, keys=None):
+        """
+        The columns for the given keys in the order given, or every column when no keys are given
+        """
+        columns = self.get_columns()
+        if not keys:
+            return columns
+
+        lookup = dict((column[0], column) for column in columns)
+        unknown = [key for key in keys if key not in lookup]
+        if unknown:
+            raise ValueError("Unknown column(s): %s" % ", ".join(unknown))
+        return [lookup[key] for key in keys]
+
+    def stream(self, keys=None):
+        columns = self.select(keys)
+        writer = csv.writer(Echo())
+        yield writer.writerow([force_bytes(header) for key, header, value in columns])
+        for obj in self.get_objects():
+            yield writer.writerow([csv_value(value(obj)) for key, header, value in columns])
+
+
+def user_columns(get_user):
+    return [("name", "Name", lambda x: friendly_username(get_user(x))),
+            ("username", "Username", lambda x: get_user(x).username),
+            ("email", "E-mail", lambda x: get_user(x).email)]
+
+
+class AttendanceExport(CsvExport):
+    filename = "attendance.csv"
+
+    def get_columns(self):
+        columns = user_columns(lambda x: x.user)
+        for block in TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id'):
+            columns.append(("block_%s" % block.id, block.text, lambda x, block=block: self.attendance(x, block)))
+        return columns
+
+    def attendance(self, registration, block):
+        for entry in registration.blockregistration_set.all():
+            if entry.time_block_id == block.id:
+                return attendance_text(entry.attendance)
+        return MISSING
+
+    def get_objects(self):
+        queryset = Registration.objects.select_related('user').prefetch_related('blockregistration_set')
+        return each(queryset, self.batch_size)
+
+
+class DonationExport(CsvExport):
+    filename = "donations.csv"
+
+    def get_columns(self):
+        return user_columns(lambda x: x.user) + [
+            ("payment", "Donation Option", lambda x: x.payment.name),
+            ("received", "Donation Received", lambda x: "Yes" if x.payment_received else "No"),
+            ("registration_date", "Registration Date", lambda x: x.registration_date.isoformat())]
+
+    def get_objects(self):
+        return each(Registration.objects.select_related('user', 'payment'), self.batch_size)
+
+
+class ContactExport(CsvExport):
+    filename = "contact_info.csv"
+
+    def get_columns(self):
+        return [("first_name", "First Name", lambda x: x.first_name),
+                ("last_name", "Last Name", lambda x: x.last_name),
+                ("username", "Username", lambda x: x.username),
+                ("email", "E-mail", lambda x: x.email),
+                ("registered", "Registered", lambda x: "Yes" if x.registration_count else "No")]
+
+    def get_objects(self):
+        return each(User.objects.annotate(registration_count=Count('registration')), self.batch_size)
+
+
+exports = {
+    "attendance": AttendanceExport,
+    "donations": DonationExport,
+    "contact_info": ContactExport,
+}
@@ -0,0 +1,103 @@
+from collections import defaultdict, namedtuple
+
+from .models import Game
+
+offsets = {u'friday': -18,
+           u'saturday': 6,
+           u'sunday': 30,
+           }
+
+# games starting at or after this hour aren't placed on the schedule
+UNSCHEDULED = 100
+
+ScheduledGame = namedtuple('ScheduledGame', ['id', 'title', 'location', 'user', 'start', 'width'])
+Conflict = namedtuple('Conflict', ['kind', 'key', 'games'])
+
+
+def get_block_offset(time_block):
+    offset = offsets.get(unicode(time_block.first_word().lower()), UNSCHEDULED)
+    if time_block.has_second_word() and "midnight" == time_block.second_word().lower():
+        offset += 24
+    return offset
+
+
+def get_start(game):
+    if game.time_block and game.time_slot:
+        return get_block_offset(game.time_block) + game.time_slot.start
+    else:
+        return UNSCHEDULED
+
+
+def get_width(time_slot):
+    if time_slot:
+        width = time_slot.stop - time_slot.start
+        if width < 0:
+            width += 24
+        return width
+    else:
+        return 0
+
+
+def is_placed(game):
+    return game.width > 0 and game.start < UNSCHEDULED
+
+
+class IntervalIndex(object):
+    """
+    Placed games grouped by a key, such as the location or the GM, with each group sorted by start time.
+    """
+
+    def __init__(self, games, key):
+        self.groups = defaultdict(list)
+        for game in games:
+            value = key(game)
+            if value is not None and is_placed(game):
+                self.groups[value].append(game)
+
+        for group in self.groups.values():
+            group.sort(key=lambda x: (x.start, x.id))
+
+    def overlaps(self):
+        """
+        Yields (key, games) for each run of games in a group joined by overlapping times, so every game in the run
+        overlaps at least one other.  Games that end when the next starts don't overlap.  Reporting runs rather than
+        pairs keeps this O(n log n) even when many games pile up in one place.
+        """
+        for value in sorted(self.groups):
+            run = []
+            stop = None
+            for game in self.groups[value]:
+                if run and game.start < stop:
+                    run.append(game)
+                    stop = max(stop, game.start + game.width)
+                else:
+                    if len(run) > 1:
+                        yield value, run
+                    run = [game]
+                    stop = game.start + game.width
+            if len(run) > 1:
+                yield value, run
+
+
+def find_conflicts(games):
+    """
+    Finds games sharing a location or a GM at the same time
+    """
+    conflicts = []
+    for kind, key in [("location", lambda x: x.location), ("gm", lambda x: x.user)]:
+        for value, run in IntervalIndex(games, key).overlaps():
+            conflicts.append(Conflict(kind, value, run))
+    return conflicts
+
+
+def get_schedule_conflicts():
+    """
+    Conflicts between the saved games, with the games' model objects in place of the scheduled entries
+    """
+    games = dict((game.id, game) for game in
+                 Game.objects.select_related('time_block', 'time_slot', 'location', 'user').order_by('id'))
+    entries = [ScheduledGame(game.id, game.title, game.location_id, game.user_id, get_start(game),
+                             get_width(game.time_slot)) for game in games.values()]
+
+    return [conflict._replace(games=[games[entry.id] for entry in conflict.games])
+            for conflict in find_conflicts(entries)]
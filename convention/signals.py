@@ -0,0 +1,80 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from shadowcon.versions import invalidate_on_commit
+
+from .admission import notify_demoted, notify_promoted, reconcile_admission
+from .models import BlockRegistration, ConInfo, Registration, TimeBlock
+from .summary import entry_deleted, entry_saved, previous_entry, rebuild_summary, registration_added, \
+    registration_removed
+from .utils import invalidate_con_info, invalidate_headcounts
+
+
+@receiver(post_save, sender=ConInfo)
+@receiver(post_delete, sender=ConInfo)
+def con_info_changed(sender, **kwargs):
+    invalidate_on_commit(invalidate_con_info)
+
+
+# the attendance summary is changed in the same transaction as the registrations it counts.  Fixtures are loaded
+# raw, with rows that may refer to others not loaded yet, so rebuild_summary() is run after them instead.
+
+
+@receiver(pre_save, sender=BlockRegistration)
+def block_registration_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._previous = previous_entry(instance)
+
+
+@receiver(post_save, sender=BlockRegistration)
+def block_registration_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        entry_saved(instance, instance._previous)
+
+
+@receiver(post_delete, sender=BlockRegistration)
+def block_registration_deleted(sender, instance, **kwargs):
+    entry_deleted(instance)
+
+
+@receiver(post_save, sender=Registration)
+def registration_saved(sender, created, raw=False, **kwargs):
+    if created and not raw:
+        registration_added()
+
+
+@receiver(post_delete, sender=Registration)
+def registration_deleted(sender, **kwargs):
+    registration_removed()
+
+
+@receiver(post_save, sender=TimeBlock)
+def time_block_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rebuild_summary([instance])
+
+
+# every change to the summary saves or deletes one of these, the attendance form's bulk writes included, as it saves
+# the registration.  Only this process drops its headcounts straight away, others see them after HEADCOUNTS_TIMEOUT.
+@receiver(post_save, sender=BlockRegistration)
+@receiver(post_delete, sender=BlockRegistration)
+@receiver(post_save, sender=Registration)
+@receiver(post_delete, sender=Registration)
+@receiver(post_save, sender=TimeBlock)
+@receiver(post_delete, sender=TimeBlock)
+def headcounts_changed(sender, **kwargs):
+    invalidate_on_commit(invalidate_headcounts)
+
+
+@receiver(post_save, sender=ConInfo)
+@receiver(post_delete, sender=Registration)
+def capacity_changed(sender, raw=False, **kwargs):
+    # fixtures are loaded raw, and the registrations may not all be loaded yet
+    if raw:
+        return
+
+    # a new capacity or a freed place moves people on or off the wait list
+    promoted, demoted = reconcile_admission()
+
+    # queued in the same transaction, so a change that's rolled back tells no one
+    notify_promoted(promoted)
+    notify_demoted(demoted)
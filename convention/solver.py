@@ -0,0 +1,303 @@
+from django.db import transaction
+from django.utils import timezone
+from reversion import revisions as reversion
+
+from collections import defaultdict, namedtuple
+import random
+import re
+import time
+
+from .models import Game, Location, TimeBlock, TimeSlot
+from .scheduling import UNSCHEDULED, get_block_offset, get_width
+
+# weights of the score the solver minimizes
+CONFLICT_COST = 1000
+AVOIDED_BLOCK_COST = 30
+UNPREFERRED_BLOCK_COST = 10
+AVOIDED_LOCATION_COST = 15
+UNPREFERRED_LOCATION_COST = 5
+SPREAD_COST = 1
+
+negations = {u'not', u'no', u'avoid', u'except', u'never', u'without'}
+
+# words people use for times that don't appear in the time block names
+synonyms = {u'day': {u'morning', u'afternoon'},
+            u'daytime': {u'morning', u'afternoon'},
+            u'night': {u'evening', u'midnight'},
+            u'late': {u'midnight'},
+            u'early': {u'morning'},
+            }
+
+Proposal = namedtuple('Proposal', ['game', 'time_block', 'time_slot', 'location'])
+
+
+def words(text):
+    return re.findall(r"[a-z]+", unicode(text).lower())
+
+
+def clauses(text):
+    return [clause for clause in re.split(r"[,;/&]|\band\b|\bor\b|\bbut\b", unicode(text).lower()) if clause.strip()]
+
+
+class Preferences(object):
+    """
+    The time blocks and locations a game's preferred_time and special_requests ask for or ask to avoid, parsed from
+    the free text.  Text that doesn't name a block or location is ignored.
+    """
+
+    def __init__(self, blocks=(), avoid_blocks=(), locations=(), avoid_locations=()):
+        self.blocks = set(blocks)
+        self.avoid_blocks = set(avoid_blocks)
+        self.locations = set(locations)
+        self.avoid_locations = set(avoid_locations)
+
+    @classmethod
+    def parse(cls, game, blocks, locations):
+        block_words = dict((block.id, set(words(block.text))) for block in blocks)
+        vocabulary = set(synonyms)
+        for value in block_words.values():
+            vocabulary.update(value)
+        location_names = [(location.id, u" ".join(words(location.text))) for location in locations]
+
+        preferences = cls()
+        for clause in clauses(game.preferred_time) + clauses(game.special_requests):
+            clause_words = words(clause)
+            negated = bool(negations.intersection(clause_words))
+
+            terms = [word for word in clause_words if word in vocabulary]
+            if terms:
+                matched = [block_id for block_id, value in block_words.items()
+                           if all(value.intersection({term} | synonyms.get(term, set())) for term in terms)]
+                (preferences.avoid_blocks if negated else preferences.blocks).update(matched)
+
+            text = u" %s " % u" ".join(clause_words)
+            matched = [location_id for location_id, name in location_names if name and u" %s " % name in text]
+            (preferences.avoid_locations if negated else preferences.locations).update(matched)
+
+        preferences.blocks -= preferences.avoid_blocks
+        preferences.locations -= preferences.avoid_locations
+        return preferences
+
+    def cost(self, block_id, location_id):
+        cost = 0
+        if block_id in self.avoid_blocks:
+            cost += AVOIDED_BLOCK_COST
+        elif self.blocks and block_id not in self.blocks:
+            cost += UNPREFERRED_BLOCK_COST
+
+        if location_id in self.avoid_locations:
+            cost += AVOIDED_LOCATION_COST
+        elif self.locations and location_id not in self.locations:
+            cost += UNPREFERRED_LOCATION_COST
+        return cost
+
+
+class ScheduleSolver(object):
+    """
+    Proposes a time block, time slot and location for every game that isn't fully placed, keeping games that are.
+    Room and GM conflicts are avoided first, then the score favors each game's preferences and games spread evenly
+    over the time blocks.
+
+    Times come from the block and slot pairs already used by other games, or every pair when nothing is placed.
+    Each placement is scored incrementally against per location and per GM counts of the pairs in use, so moving
+    a game only looks at the pairs overlapping the candidate.
+    """
+
+    def __init__(self, games, blocks, slots, locations, seed=0, time_limit=10, max_passes=50):
+        self.games = list(games)
+        self.blocks = dict((block.id, block) for block in blocks)
+        self.slots = dict((slot.id, slot) for slot in slots)
+        self.locations = dict((location.id, location) for location in locations)
+        self.random = random.Random(seed)
+        self.time_limit = time_limit
+        self.max_passes = max_passes
+
+        self.fixed = [game for game in self.games if self.is_fixed(game)]
+        self.free = [game for game in self.games if not self.is_fixed(game)]
+
+        used = set((game.time_block_id, game.time_slot_id) for game in self.games
+                   if game.time_block_id is not None and game.time_slot_id is not None)
+        every_pair = [(block_id, slot_id) for block_id in self.blocks for slot_id in self.slots]
+        if not used:
+            used = set(every_pair)
+
+        # a game with only its block or slot set can go with any slot or block
+        for game in self.free:
+            if (game.time_block_id is None) != (game.time_slot_id is None):
+                used.update(pair for pair in every_pair if self.matches(game, pair))
+
+        self.pairs = [pair for pair in sorted(used) if self.pair_times(pair)]
+        self.pair_index = dict((pair, index) for index, pair in enumerate(self.pairs))
+
+        times = [self.pair_times(pair) for pair in self.pairs]
+        self.overlapping = [[other for other, (other_start, other_stop) in enumerate(times)
+                             if start < other_stop and other_start < stop] for start, stop in times]
+
+        self.location_counts = defaultdict(lambda: [0] * len(self.pairs))
+        self.user_counts = defaultdict(lambda: [0] * len(self.pairs))
+        self.block_counts = defaultdict(int)
+        self.assignment = {}
+
+        for game in self.fixed:
+            pair = self.pair_index.get((game.time_block_id, game.time_slot_id))
+            if pair is not None:
+                self.add(game, (pair, game.location_id))
+
+        self.candidates = dict((game.id, self.get_candidates(game)) for game in self.free)
+
+    def is_fixed(self, game):
+        return game.time_block_id is not None and game.time_slot_id is not None and game.location_id is not None
+
+    def matches(self, game, pair):
+        return game.time_block_id in (None, pair[0]) and game.time_slot_id in (None, pair[1])
+
+    def pair_times(self, pair):
+        block = self.blocks.get(pair[0])
+        slot = self.slots.get(pair[1])
+        if block is None or slot is None:
+            return None
+
+        start = get_block_offset(block) + slot.start
+        width = get_width(slot)
+        if width <= 0 or start >= UNSCHEDULED:
+            return None
+        return start, start + width
+
+    def get_candidates(self, game):
+        """
+        Every (pair, location, preference cost) the game could be given, honoring the parts already assigned
+        """
+        preferences = Preferences.parse(game, self.blocks.values(), self.locations.values())
+        candidates = []
+        for index, (block_id, slot_id) in enumerate(self.pairs):
+            if not self.matches(game, (block_id, slot_id)):
+                continue
+            for location_id in sorted(self.locations):
+                if game.location_id not in (None, location_id):
+                    continue
+                candidates.append((index, location_id, preferences.cost(block_id, location_id)))
+        return candidates
+
+    def add(self, game, placement):
+        pair, location_id = placement
+        self.assignment[game.id] = placement
+        self.location_counts[location_id][pair] += 1
+        self.user_counts[game.user_id][pair] += 1
+        self.block_counts[self.pairs[pair][0]] += 1
+
+    def remove(self, game):
+        pair, location_id = self.assignment.pop(game.id)
+        self.location_counts[location_id][pair] -= 1
+        self.user_counts[game.user_id][pair] -= 1
+        self.block_counts[self.pairs[pair][0]] -= 1
+
+    def conflicts(self, game, pair, location_id):
+        overlapping = self.overlapping[pair]
+        location_counts = self.location_counts[location_id]
+        user_counts = self.user_counts[game.user_id]
+        return sum(location_counts[other] + user_counts[other] for other in overlapping)
+
+    def cost(self, game, candidate):
+        pair, location_id, preference_cost = candidate
+        return (CONFLICT_COST * self.conflicts(game, pair, location_id) + preference_cost +
+                SPREAD_COST * self.block_counts[self.pairs[pair][0]])
+
+    def best_candidate(self, game):
+        best = None
+        best_cost = None
+        for candidate in self.candidates[game.id]:
+            cost = self.cost(game, candidate)
+            # random tie breaking keeps equally good games from piling into the first room
+            if best is None or cost < best_cost or (cost == best_cost and self.random.random() < 0.5):
+                best = candidate
+                best_cost = cost
+        return best, best_cost
+
+    def solve(self):
+        """
+        Returns a Proposal for each game that wasn't fully placed, or None for its parts when nothing fits
+        """
+        deadline = time.time() + self.time_limit
+
+        # place the games with the fewest good options first
+        order = sorted(self.free, key=lambda x: (sum(1 for c in self.candidates[x.id] if c[2] == 0), x.id))
+        for game in order:
+            best, cost = self.best_candidate(game)
+            if best is not None:
+                self.add(game, best[:2])
+
+        # move single games to their best placement until nothing improves
+        placed = [game for game in self.free if game.id in self.assignment]
+        for _ in range(self.max_passes):
+            improved = False
+            self.random.shuffle(placed)
+            for game in placed:
+                pair, location_id = self.assignment[game.id]
+                self.remove(game)
+                current = [c for c in self.candidates[game.id] if c[:2] == (pair, location_id)][0]
+                current_cost = self.cost(game, current)
+
+                best, cost = self.best_candidate(game)
+                if cost < current_cost:
+                    self.add(game, best[:2])
+                    improved = True
+                else:
+                    self.add(game, (pair, location_id))
+
+            if not improved or time.time() > deadline:
+                break
+
+        proposals = []
+        for game in self.free:
+            if game.id in self.assignment:
+                pair, location_id = self.assignment[game.id]
+                block_id, slot_id = self.pairs[pair]
+                proposals.append(Proposal(game, self.blocks[block_id], self.slots[slot_id],
+                                          self.locations[location_id]))
+            else:
+                proposals.append(Proposal(game, None, None, None))
+        return proposals
+
+    def conflict_count(self):
+        """
+        Number of placed games sharing a room or GM with an earlier placed game
+        """
+        count = 0
+        games = dict((game.id, game) for game in self.games)
+        seen_locations = defaultdict(lambda: [0] * len(self.pairs))
+        seen_users = defaultdict(lambda: [0] * len(self.pairs))
+        for game_id, (pair, location_id) in sorted(self.assignment.items()):
+            user_id = games[game_id].user_id
+            if any(seen_locations[location_id][other] or seen_users[user_id][other]
+                   for other in self.overlapping[pair]):
+                count += 1
+            seen_locations[location_id][pair] += 1
+            seen_users[user_id][pair] += 1
+        return count
+
+
+def get_schedule_solver(**kwargs):
+    return ScheduleSolver(Game.objects.order_by('id'), TimeBlock.objects.all(), TimeSlot.objects.all(),
+                          Location.objects.all(), **kwargs)
+
+
+def apply_proposals(proposals, comment="Automatic Schedule"):
+    """
+    Saves the placements found by the solver as a single revision, skipping games nothing was found for
+    """
+    now = timezone.now()
+    with transaction.atomic(), reversion.create_revision():
+        reversion.set_comment(comment)
+        count = 0
+        for proposal in proposals:
+            if proposal.time_block is None:
+                continue
+
+            game = proposal.game
+            game.time_block = proposal.time_block
+            game.time_slot = proposal.time_slot
+            game.location = proposal.location
+            game.last_scheduled = now
+            game.save()
+            count += 1
+    return count
@@ -108,6 +108,15 @@ function drawSchedule(svgId, data) {
   }
   svg.text(0, hourHeader.y, text, {class: "header"});
 
+  // games the server found sharing a room or GM
+  var conflicted = {};
+  var conflicts = data.conflicts || [];
+  for (i = 0; i < conflicts.length; i++) {
+    for (j = 0; j < conflicts[i].games.length; j++) {
+      conflicted[conflicts[i].games[j]] = true;
+    }
+  }
+
   // create the game objects
   for (i = 0; i < data.games.length; i++) {
     x = grid.x + hour.width * data.games[i].start
@@ -117,7 +126,7 @@ function drawSchedule(svgId, data) {
     if (0 === width || data.games[i].start > 99 || data.games[i].location < 0) { continue; }
 
     var subSvg = svg.svg(x, y, width, gameHeight, {"data-toggle": "tooltip", title: data.games[i].title});
-    svg.rect(subSvg, 1, 0, width - 2, gameHeight, {class: "game"});
+    svg.rect(subSvg, 1, 0, width - 2, gameHeight, {class: data.games[i].id in conflicted ? "game conflict" : "game"});
     svg.text(subSvg, textOffset, 19, data.games[i].title, {class: "game_title", clip:"rect(0,0,10,20)"});
   }
 
@@ -127,9 +136,10 @@ function drawSchedule(svgId, data) {
   });
 }
 
-function registerSchedule(svgId, dataLoc, tableId) {
+function registerSchedule(svgId, dataLoc, tableId, saveLoc, suggestLoc) {
   $(svgId).svg()
   ajaxGet(dataLoc, function(content) {
+    markSaved(content);
     drawSchedule("#schedule", content);
 
     if (typeof tableId != 'undefined') {
@@ -141,44 +151,125 @@ function registerSchedule(svgId, dataLoc, tableId) {
     });
 
     $("#save").click(function() {
-      save(content, 0, dataLoc);
+      save(content, saveLoc);
     });
     $("#revert").click(function() {
-      revert(svgId, dataLoc, tableId);
+      revert(svgId, dataLoc, tableId, saveLoc, suggestLoc);
+    });
+    $("#suggest").click(function() {
+      suggest(svgId, tableId, content, suggestLoc);
     });
   });
 }
 
-function revert(svgId, dataLoc, tableId) {
+function revert(svgId, dataLoc, tableId, saveLoc, suggestLoc) {
   console.log("Revert Run")
   $("#save").prop('disabled', true)
   $("#revert").prop('disabled', true)
-  $("#save").off("click", "#schedule-save")
-  $("#revert").off("click", "#schedule-revert")
-  registerSchedule(svgId, dataLoc, tableId)
+  $("#save").off("click")
+  $("#revert").off("click")
+  $("#suggest").off("click")
+  registerSchedule(svgId, dataLoc, tableId, saveLoc, suggestLoc)
 }
 
-function save(content, i, dataLoc) {
-  if (i >= content.games.length) {
-      console.log("Save Finished")
-      $("#save").prop('disabled', true)
-      $("#revert").prop('disabled', true)
-      return;
+function indexOfId(list, id) {
+  for (j = 0; j < list.length; j++) {
+    if (list[j].id == id) {
+      return j;
+    }
   }
+  return -1;
+}
 
-  game = content.games[i]
-  var data = {"id": game.id}
-  if (game.location >= 0) {
-    data["location"] = content.locations[game.location].id;
-  }
-  if (game.time_block >= 0) {
-    data["time_block"] = content.blocks[game.time_block].id;
+// fill in the server's proposals for games that haven't been edited since loading
+function suggest(svgId, tableId, content, suggestLoc) {
+  $("#suggest").prop('disabled', true)
+  ajaxGet(suggestLoc, function(result) {
+    $("#suggest").prop('disabled', false)
+    var proposals = {};
+    for (i = 0; i < result.proposals.length; i++) {
+      proposals[result.proposals[i].id] = result.proposals[i];
+    }
+
+    var applied = 0;
+    for (i = 0; i < content.games.length; i++) {
+      var game = content.games[i];
+      var proposal = proposals[game.id];
+      if (typeof proposal == 'undefined' || game.location != game.saved.location ||
+          game.time_block != game.saved.time_block || game.time_slot != game.saved.time_slot) {
+        continue;
+      }
+
+      game.location = indexOfId(content.locations, proposal.location);
+      game.time_block = indexOfId(content.blocks, proposal.time_block);
+      game.time_slot = indexOfId(content.slots, proposal.time_slot);
+      updateStart(game, content);
+      applied++;
+    }
+
+    if (applied > 0) {
+      $("#save").prop('disabled', false);
+      $("#revert").prop('disabled', false);
+      constructEditTable(svgId, tableId, content);
+      drawSchedule(svgId, content);
+    }
+    if (result.conflicts > 0) {
+      alert("The suggested schedule still has " + result.conflicts + " conflicting game(s).");
+    }
+  });
+}
+
+// remember what the server has, so only games that change afterwards are sent
+function markSaved(content) {
+  for (i = 0; i < content.games.length; i++) {
+    var game = content.games[i];
+    game.saved = {location: game.location, time_block: game.time_block, time_slot: game.time_slot};
   }
-  if (game.time_slot >= 0) {
-    data["time_slot"] = content.slots[game.time_slot].id;
+}
+
+function selectedId(list, index) {
+  return index >= 0 ? list[index].id : null;
+}
+
+function save(content, saveLoc) {
+  var changed = [];
+  for (i = 0; i < content.games.length; i++) {
+    var game = content.games[i];
+    if (game.location == game.saved.location && game.time_block == game.saved.time_block &&
+        game.time_slot == game.saved.time_slot) {
+      continue;
+    }
+
+    changed.push({"id": game.id,
+                  "version": game.version,
+                  "location": selectedId(content.locations, game.location),
+                  "time_block": selectedId(content.blocks, game.time_block),
+                  "time_slot": selectedId(content.slots, game.time_slot)});
   }
-  ajaxPost(dataLoc, data, function() {
-    save(content, i + 1, dataLoc);
+
+  ajaxPost(saveLoc, {"games": JSON.stringify(changed)}, function(result) {
+    console.log("Save Finished")
+    var versions = {};
+    for (i = 0; i < result.saved.length; i++) {
+      versions[result.saved[i].id] = result.saved[i].version;
+    }
+    for (i = 0; i < content.games.length; i++) {
+      if (content.games[i].id in versions) {
+        content.games[i].version = versions[content.games[i].id];
+      }
+    }
+
+    if (result.conflicts.length > 0) {
+      var titles = $.map(result.conflicts, function(conflict) { return conflict.title; });
+      alert("These games were scheduled by someone else while you were editing and have not been saved:\n\n" +
+            titles.join("\n") + "\n\nThe schedule will now be reloaded.");
+      $("#revert").click();
+      return;
+    }
+
+    markSaved(content);
+    $("#save").prop('disabled', true)
+    $("#revert").prop('disabled', true)
   });
 }
 
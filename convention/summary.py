@@ -0,0 +1,160 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+
+from collections import defaultdict
+from contextlib import contextmanager
+import threading
+
+from .models import AttendanceSummary, BlockRegistration, Registration, TimeBlock
+
+# the summary column counting each attendance choice
+attendance_fields = {BlockRegistration.ATTENDANCE_YES: 'yes',
+                     BlockRegistration.ATTENDANCE_MAYBE: 'maybe',
+                     BlockRegistration.ATTENDANCE_NO: 'no',
+                     }
+
+# changes held back by combined_changes() in this thread, or None when they're applied straight away
+_pending = threading.local()
+
+
+def counted(entry):
+    return entry.time_block_id, entry.attendance
+
+
+def apply_changes(changes):
+    """
+    Applies (previous, current) pairs of what entries counted towards, with None for an entry that didn't exist
+    before or doesn't any more.  However many entries changed, this is a single UPDATE, so it suits the bulk writes
+    that skip the signals, and concurrent changes can't lose each other's counts.
+    """
+    pending = getattr(_pending, 'changes', None)
+    if pending is not None:
+        pending.extend(changes)
+        return
+
+    deltas = defaultdict(int)
+    for previous, current in changes:
+        if previous != current:
+            if previous is not None:
+                deltas[previous] -= 1
+            if current is not None:
+                deltas[current] += 1
+
+    columns = defaultdict(dict)
+    for (time_block_id, attendance), change in deltas.items():
+        if change:
+            field = attendance_fields[attendance]
+            columns[field][time_block_id] = columns[field].get(time_block_id, 0) + change
+            columns['missing'][time_block_id] = columns['missing'].get(time_block_id, 0) - change
+    if not columns:
+        return
+
+    updates = {}
+    for field, changed in columns.items():
+        cases = [When(time_block_id=time_block_id, then=Value(change))
+                 for time_block_id, change in sorted(changed.items()) if change]
+        if cases:
+            updates[field] = F(field) + Case(*cases, default=Value(0), output_field=IntegerField())
+    AttendanceSummary.objects.filter(time_block_id__in=columns['missing'].keys()).update(**updates)
+
+
+@contextmanager
+def combined_changes():
+    """
+    Holds back the changes made inside the block, such as those from the signals a bulk delete sends for each row, and
+    applies them all in a single UPDATE at the end
+    """
+    if getattr(_pending, 'changes', None) is not None:
+        yield
+        return
+
+    _pending.changes = []
+    try:
+        yield
+        changes = _pending.changes
+    finally:
+        _pending.changes = None
+    apply_changes(changes)
+
+
+def previous_entry(entry):
+    """
+    What the entry counted towards as stored in the database, or None if it isn't stored yet
+    """
+    if hasattr(entry, '_counted'):
+        return entry._counted
+    if entry.pk is None:
+        return None
+    return BlockRegistration.objects.filter(pk=entry.pk).values_list('time_block', 'attendance').first()
+
+
+def entry_saved(entry, previous):
+    current = counted(entry)
+    apply_changes([(previous, current)])
+    entry._counted = current
+
+
+def entry_deleted(entry):
+    apply_changes([(getattr(entry, '_counted', counted(entry)), None)])
+    entry._counted = None
+
+
+def registration_added():
+    AttendanceSummary.objects.update(missing=F('missing') + 1)
+
+
+def registration_removed():
+    AttendanceSummary.objects.update(missing=F('missing') - 1)
+
+
+def rebuild_summary(time_blocks=None):
+    """
+    Recounts the summary for the time blocks, or all of them, from the registrations.  This repairs drift from changes
+    that don't send signals, such as bulk updates.  The rows are locked first, so changes made while the counts are
+    read wait and apply on top of them.  Returns the rebuilt rows.
+    """
+    with transaction.atomic():
+        time_blocks = list(TimeBlock.objects.all() if time_blocks is None else time_blocks)
+        existing = dict((row.time_block_id, row) for row in AttendanceSummary.objects.select_for_update().filter(
+            time_block__in=[block.id for block in time_blocks]))
+
+        counts = defaultdict(int)
+        for row in BlockRegistration.objects.filter(time_block__in=[block.id for block in time_blocks]) \
+                .values('time_block', 'attendance').annotate(count=Count('id')):
+            counts[(row['time_block'], row['attendance'])] = row['count']
+        total = Registration.objects.count()
+
+        rows = []
+        for block in time_blocks:
+            values = dict((field, counts[(block.id, attendance)]) for attendance, field in attendance_fields.items())
+            values['missing'] = total - sum(values.values())
+
+            row = existing.get(block.id)
+            if row is None:
+                row = AttendanceSummary.objects.create(time_block=block, **values)
+            elif any(getattr(row, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(row, field, value)
+                row.save()
+            row.time_block = block
+            rows.append(row)
+        return rows
+
+
+def get_summary(time_blocks):
+    """
+    The summary rows for the time blocks in the same order, with one query however many people registered
+    """
+    rows = AttendanceSummary.objects.in_bulk([block.id for block in time_blocks])
+    missing = [block for block in time_blocks if block.id not in rows]
+    if missing:
+        rows.update((row.time_block_id, row) for row in rebuild_summary(missing))
+    return [rows[block.id] for block in time_blocks]
+
+
+def get_headcounts():
+    """
+    The summary rows for the time blocks people register for, with their time blocks, in a single query
+    """
+    return list(AttendanceSummary.objects.select_related('time_block').exclude(time_block__text__startswith='Not')
+                .order_by('time_block__sort_id'))
@@ -3,52 +3,64 @@ from django.utils import dateformat, html
 from datetime import date
 import pytz
 
-from ..utils import get_con_value, is_pre_reg_open, is_registration_open
+from ..utils import ConventionContext
 from ..models import Trigger
 
 register = template.Library()
 
 
-@register.simple_tag
-def con_date():
-    start = get_con_value("date")
+def get_convention(context):
+    # supplied by the convention context processor, templates rendered without a request look it up themselves
+    convention = context.get('convention')
+    if convention is None:
+        convention = ConventionContext()
+    return convention
+
+
+def get_info(context):
+    return get_convention(context).info
+
+
+@register.simple_tag(takes_context=True)
+def con_date(context):
+    start = get_info(context).date
     end = date(start.year, start.month, start.day + 2)
     return str(dateformat.format(start, "F jS - ") + dateformat.format(end, "jS, Y"))
 
 
-@register.simple_tag
-def con_year():
-    return str(get_con_value("date").year)
+@register.simple_tag(takes_context=True)
+def con_year(context):
+    return str(get_info(context).date.year)
 
 
-@register.simple_tag
-def con_pre_reg_deadline():
-    return dateformat.format(get_con_value("pre_reg_deadline"), "F jS, Y")
+@register.simple_tag(takes_context=True)
+def con_pre_reg_deadline(context):
+    return dateformat.format(get_info(context).pre_reg_deadline, "F jS, Y")
 
 
-@register.simple_tag
-def con_game_sub_deadline():
-    return dateformat.format(get_con_value("game_sub_deadline"), "F jS, Y")
+@register.simple_tag(takes_context=True)
+def con_game_sub_deadline(context):
+    return dateformat.format(get_info(context).game_sub_deadline, "F jS, Y")
 
 
-@register.simple_tag
-def con_game_reg_deadline():
-    return html.format_html(get_datetime_as_string(get_con_value("game_reg_deadline"), "<br />"))
+@register.simple_tag(takes_context=True)
+def con_game_reg_deadline(context):
+    return html.format_html(get_datetime_as_string(get_info(context).game_reg_deadline, "<br />"))
 
 
-@register.simple_tag
-def con_location():
-    return get_con_value("location")
+@register.simple_tag(takes_context=True)
+def con_location(context):
+    return get_info(context).location
 
 
-@register.simple_tag
-def con_door_cost():
-    return "$%.2f" % get_con_value("door_cost")
+@register.simple_tag(takes_context=True)
+def con_door_cost(context):
+    return "$%.2f" % get_info(context).door_cost
 
 
-@register.simple_tag
-def con_pre_reg_cost():
-    return "$%.2f" % get_con_value("pre_reg_cost")
+@register.simple_tag(takes_context=True)
+def con_pre_reg_cost(context):
+    return "$%.2f" % get_info(context).pre_reg_cost
 
 
 def get_datetime_as_string(value, date_time_sep):
@@ -56,18 +68,20 @@ def get_datetime_as_string(value, date_time_sep):
     return dateformat.format(local, "F jS, Y") + date_time_sep + dateformat.format(local, "g:i:s A T")
 
 
-@register.inclusion_tag('convention/register_sidebar_links.html')
-def register_links(user):
-    raw_open_date = get_con_value("registration_opens")
+@register.inclusion_tag('convention/register_sidebar_links.html', takes_context=True)
+def register_links(context, user):
+    convention = get_convention(context)
+    if convention.user != user:
+        convention = ConventionContext(user)
 
-    return {'is_registration_open': is_registration_open(),
-            'is_pre_reg_open': is_pre_reg_open(user),
-            'open_date': get_datetime_as_string(raw_open_date, "<br>")}
+    return {'is_registration_open': convention.is_registration_open,
+            'is_pre_reg_open': convention.is_pre_reg_open,
+            'open_date': get_datetime_as_string(convention.info.registration_opens, "<br>")}
 
 
-@register.simple_tag
-def con_registration_opens():
-    return get_datetime_as_string(get_con_value("registration_opens"), " at ")
+@register.simple_tag(takes_context=True)
+def con_registration_opens(context):
+    return get_datetime_as_string(get_info(context).registration_opens, " at ")
 
 
 @register.inclusion_tag('convention/trigger_list.html')
@@ -2,7 +2,7 @@ from django import template
 from django.core.urlresolvers import reverse
 from django.utils import html
 
-from ..utils import get_registration
+from ..utils import get_convention_context, get_registration
 from ..models import Registration
 
 register = template.Library()
@@ -38,3 +38,8 @@ def attendance_list_link(user):
                                 reverse('convention:attendance_list'))
     else:
         return ""
+
+
+@register.inclusion_tag('convention/headcounts.html')
+def attendance_headcounts(request):
+    return {'headcounts': get_convention_context(request).headcounts}
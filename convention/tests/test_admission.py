@@ -0,0 +1,316 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection, connections, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+from shadowcon.tests.utils import ShadowConTestCase, register
+import threading
+
+from ..admission import is_con_full, notify_demoted, notify_promoted, reconcile_admission
+from ..models import ConInfo, PaymentOption, Registration, RegistrationCounter
+
+
+def set_capacity(max_attendees):
+    info = ConInfo.objects.all()[0]
+    info.max_attendees = max_attendees
+    info.save()
+
+
+def statuses():
+    return list(Registration.objects.order_by('sequence').values_list('sequence', 'status'))
+
+
+class AdmissionTest(ShadowConTestCase):
+    def test_sequence(self):
+        self.assertEquals(register("first").sequence, 3)
+        self.assertEquals(register("second").sequence, 4)
+        self.assertEquals(RegistrationCounter.objects.get().last_sequence, 4)
+
+    def test_sequence_not_reused(self):
+        register("first").delete()
+        self.assertEquals(register("second").sequence, 4)
+
+    def test_confirmed(self):
+        registration = register("first")
+        self.assertEquals(registration.status, Registration.STATUS_CONFIRMED)
+        self.assertFalse(registration.is_wait_listed)
+
+    def test_wait_listed(self):
+        set_capacity(3)
+        self.assertEquals(register("first").status, Registration.STATUS_CONFIRMED)
+        registration = register("second")
+        self.assertEquals(registration.status, Registration.STATUS_WAIT_LISTED)
+        self.assertTrue(registration.is_wait_listed)
+
+    def test_update_keeps_admission(self):
+        set_capacity(2)
+        registration = register("first")
+        registration.payment_received = True
+        registration.save()
+        self.assertEquals((registration.sequence, registration.status), (3, Registration.STATUS_WAIT_LISTED))
+
+    def test_capacity_lowered(self):
+        set_capacity(1)
+        self.assertEquals(statuses(), [(1, Registration.STATUS_CONFIRMED), (2, Registration.STATUS_WAIT_LISTED)])
+        self.assertEquals(self.get_email().subject, "ShadowCon [Registration]: You're back on the wait list")
+
+    def test_fixture_load(self):
+        # loading fixtures leaves admission alone, as the registrations may not all be loaded yet
+        Registration.objects.update(status=Registration.STATUS_WAIT_LISTED)
+        call_command("loaddata", "initial", verbosity=0)
+        self.assertEquals(statuses(), [(1, Registration.STATUS_WAIT_LISTED), (2, Registration.STATUS_WAIT_LISTED)])
+        self.assertEquals(len(self.get_emails()), 0)
+
+    def test_capacity_raised(self):
+        set_capacity(0)
+        register("first")
+        set_capacity(2)
+        self.assertEquals(statuses(), [(1, Registration.STATUS_CONFIRMED), (2, Registration.STATUS_CONFIRMED),
+                                       (3, Registration.STATUS_WAIT_LISTED)])
+
+    def test_place_freed(self):
+        set_capacity(2)
+        register("first")
+        Registration.objects.get(sequence=1).delete()
+        self.assertEquals(statuses(), [(2, Registration.STATUS_CONFIRMED), (3, Registration.STATUS_CONFIRMED)])
+
+    def test_reconcile(self):
+        set_capacity(2)
+        first = register("first")
+        second = register("second")
+        Registration.objects.filter(sequence__lte=2).update(status=Registration.STATUS_WAIT_LISTED)
+        Registration.objects.filter(sequence__gt=2).update(status=Registration.STATUS_CONFIRMED)
+
+        promoted, demoted = reconcile_admission()
+        self.assertEquals(promoted, [1, 2])
+        self.assertEquals(demoted, [first.id, second.id])
+        self.assertEquals(reconcile_admission(), ([], []))
+
+    def test_counter_missing(self):
+        RegistrationCounter.objects.all().delete()
+        self.assertEquals(register("first").sequence, 3)
+
+    def first_write(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return [query['sql'] for query in context.captured_queries if "SAVEPOINT" not in query['sql']][0]
+
+    def test_admission_locks_first(self):
+        # writing the counter row before reading anything holds a lock until the transaction ends on every database,
+        # so registrations submitted together can't both see the same count
+        user = User.objects.create(username="first")
+        payment = PaymentOption.objects.all()[0]
+        sql = self.first_write(lambda: Registration.objects.create(user=user, registration_date=timezone.now(),
+                                                                   last_updated=timezone.now(), payment=payment))
+        self.assertTrue(sql.startswith("UPDATE"), sql)
+        self.assertIn("convention_registrationcounter", sql)
+
+    def test_reconcile_locks_first(self):
+        sql = self.first_write(reconcile_admission)
+        self.assertTrue(sql.startswith("UPDATE"), sql)
+        self.assertIn("convention_registrationcounter", sql)
+
+    def test_payment_wait_listed(self):
+        Registration.objects.filter(user__username="admin").update(status=Registration.STATUS_WAIT_LISTED)
+        self.client.login(username="admin", password="123")
+        response = self.client.get(reverse('convention:payment'))
+        self.assertSectionContains(response, "Wait List Registration Recorded", "h2")
+
+
+class WaitListPositionTest(ShadowConTestCase):
+    def test_confirmed(self):
+        self.assertIsNone(Registration.objects.get(sequence=1).wait_list_position())
+
+    def test_positions(self):
+        set_capacity(1)
+        first = register("first")
+        second = register("second")
+        self.assertEquals([Registration.objects.get(sequence=2).wait_list_position(), first.wait_list_position(),
+                           second.wait_list_position()], [1, 2, 3])
+
+    def test_position_moves_up(self):
+        set_capacity(1)
+        first = register("first")
+        second = register("second")
+        first.delete()
+        self.assertEquals(second.wait_list_position(), 2)
+        Registration.objects.get(sequence=1).delete()
+        self.assertEquals(Registration.objects.get(pk=second.pk).wait_list_position(), 1)
+
+    def test_position_queries(self):
+        set_capacity(1)
+        for index in range(20):
+            register("racer%d" % index)
+        registration = Registration.objects.order_by('sequence').last()
+        with self.assertNumQueries(1):
+            self.assertEquals(registration.wait_list_position(), 21)
+
+    def test_con_full(self):
+        self.assertFalse(is_con_full())
+        set_capacity(2)
+        self.assertTrue(is_con_full())
+        set_capacity(0)
+        self.assertTrue(is_con_full())
+
+    def test_profile(self):
+        set_capacity(1)
+        self.client.login(username="staff", password="123")
+        response = self.client.get(reverse('convention:user_profile'))
+        self.assertContains(response, "Wait List Position: 1<br />")
+
+    def test_profile_confirmed(self):
+        self.client.login(username="admin", password="123")
+        response = self.client.get(reverse('convention:user_profile'))
+        self.assertNotContains(response, "Wait List Position")
+
+    def test_submission_queries(self):
+        set_capacity(1)
+        for index in range(20):
+            register("racer%d" % index)
+        self.client.login(username="staff", password="123")
+        self.client.get(reverse('convention:submit_game'))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('convention:submit_game'))
+        self.assertSectionContains(response, "On Wait List", "h2")
+        self.assertFalse([query for query in context.captured_queries
+                          if "convention_registration" in query['sql'] and "LIMIT" not in query['sql']])
+
+
+class PromotionTest(ShadowConTestCase):
+    def test_notify(self):
+        staff = Registration.objects.get(user__username="staff")
+        self.assertEquals(notify_promoted([staff.id]), 1)
+        self.assertEmail(['staff-test@mg.shadowcon.net'],
+                         "staff,\n\nA place has opened up at ShadowCon and your registration has moved off the wait "
+                         "list, so you're now confirmed.  Your attendance and donation choices are unchanged, and you "
+                         "can review them on your profile page.\n\nWe look forward to seeing you!",
+                         subject_source="Registration", subject_details="You're off the wait list")
+
+    def test_notify_none(self):
+        self.assertEquals(notify_promoted([]), 0)
+        self.assertEquals(notify_demoted([]), 0)
+        self.assertEquals(len(self.get_emails()), 0)
+
+    def test_notify_demoted(self):
+        staff = Registration.objects.get(user__username="staff")
+        self.assertEquals(notify_demoted([staff.id]), 1)
+        self.assertEmail(['staff-test@mg.shadowcon.net'],
+                         "staff,\n\nThe number of places at ShadowCon has been reduced and your registration has "
+                         "moved back onto the wait list.  Your attendance and donation choices are kept, and we'll "
+                         "e-mail you if a place opens up for you.  You can see your place on the wait list on your "
+                         "profile page.\n\nWe're sorry for the change.",
+                         subject_source="Registration", subject_details="You're back on the wait list")
+
+    def test_command(self):
+        Registration.objects.filter(sequence=2).update(status=Registration.STATUS_WAIT_LISTED)
+        out = StringIO()
+        call_command("reconcile_admission", stdout=out)
+        self.assertEquals(out.getvalue(), "Confirmed staff\nConfirmed 1, wait listed 0, e-mails queued 1\n")
+        self.assertEquals(self.get_email().to, ['staff-test@mg.shadowcon.net'])
+
+    def test_command_wait_lists(self):
+        Registration.objects.filter(sequence=2).update(status=Registration.STATUS_CONFIRMED)
+        ConInfo.objects.update(max_attendees=1)
+        out = StringIO()
+        call_command("reconcile_admission", stdout=out)
+        self.assertEquals(out.getvalue(), "Wait listed staff\nConfirmed 0, wait listed 1, e-mails queued 1\n")
+        self.assertEquals(self.get_email().to, ['staff-test@mg.shadowcon.net'])
+
+    def test_command_no_email(self):
+        Registration.objects.update(status=Registration.STATUS_WAIT_LISTED)
+        out = StringIO()
+        call_command("reconcile_admission", "--no-email", stdout=out)
+        self.assertIn("Confirmed 2, wait listed 0, e-mails queued 0", out.getvalue())
+        self.assertEquals(len(self.get_emails()), 0)
+
+
+class PromotionNotificationTest(ShadowConTestCase):
+    demoted = "ShadowCon [Registration]: You're back on the wait list"
+    promoted = "ShadowCon [Registration]: You're off the wait list"
+
+    def subjects(self):
+        return [(email.to, email.subject) for email in self.get_emails()]
+
+    def test_place_freed(self):
+        set_capacity(1)
+        self.assertEquals(self.subjects(), [(['staff-test@mg.shadowcon.net'], self.demoted)])
+
+        Registration.objects.get(user__username="admin").delete()
+        self.assertEquals(self.subjects(), [(['staff-test@mg.shadowcon.net'], self.demoted),
+                                            (['staff-test@mg.shadowcon.net'], self.promoted)])
+
+    def test_capacity_raised(self):
+        set_capacity(2)
+        for index in range(30):
+            user = User.objects.create(username="waiting%d" % index, email="waiting%d@test.com" % index)
+            Registration.objects.create(user=user, registration_date=timezone.now(), last_updated=timezone.now(),
+                                        payment=PaymentOption.objects.all()[0])
+        self.assertEquals(Registration.objects.filter(status=Registration.STATUS_WAIT_LISTED).count(), 30)
+
+        set_capacity(22)
+        self.assertEquals(Registration.objects.filter(status=Registration.STATUS_WAIT_LISTED).count(), 10)
+        self.assertEquals([email.to for email in self.get_emails()],
+                          [["waiting%d@test.com" % index] for index in range(20)])
+
+    def test_rolled_back(self):
+        set_capacity(1)
+        try:
+            with transaction.atomic():
+                Registration.objects.get(user__username="admin").delete()
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEquals(self.subjects(), [(['staff-test@mg.shadowcon.net'], self.demoted)])
+
+
+class AdmissionConcurrencyTest(TransactionTestCase):
+    fixtures = ['auth', 'initial']
+    registrations = 40
+    max_attendees = 15
+
+    def setUp(self):
+        # threads can't share the in-memory SQLite test database, but a file or server database works
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db(connection.settings_dict['NAME']):
+            self.skipTest("Needs a test database other connections can open")
+
+    def test_parallel_registrations(self):
+        set_capacity(self.max_attendees)
+        # flushing between tests removes the counter the migration made
+        RegistrationCounter.objects.get_or_create(pk=1)
+        users = [User.objects.create(username="racer%d" % index) for index in range(self.registrations)]
+        payment = PaymentOption.objects.all()[0]
+        start = threading.Event()
+        errors = []
+
+        def submit(user):
+            try:
+                start.wait()
+                Registration.objects.create(user=user, registration_date=timezone.now(),
+                                            last_updated=timezone.now(), payment=payment)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=submit, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(errors, [])
+        self.assertEquals(Registration.objects.count(), self.registrations)
+        self.assertEquals(Registration.objects.filter(status=Registration.STATUS_CONFIRMED).count(),
+                          self.max_attendees)
+        self.assertEquals(sorted(Registration.objects.values_list('sequence', flat=True)),
+                          range(1, self.registrations + 1))
+
+        # the first numbered are the ones confirmed
+        self.assertEquals(statuses(), [(sequence, Registration.STATUS_CONFIRMED if sequence <= self.max_attendees
+                                        else Registration.STATUS_WAIT_LISTED)
+                                       for sequence in range(1, self.registrations + 1)])
@@ -0,0 +1,165 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+from contact.models import QueuedEmail
+from shadowcon.tests.utils import ShadowConTestCase, register
+
+from ..announcements import queue_announcement_batch, queue_announcements
+from ..models import Announcement, Registration
+
+BODY = "{{ name }}, you're {{ registration.get_status_display }}.\n" \
+       "{% for block, attendance in attendance %}{{ block }}: {{ attendance }}\n{% endfor %}"
+
+
+class AnnouncementTest(ShadowConTestCase):
+    def announce(self, audience=Announcement.AUDIENCE_ALL, status=Announcement.STATUS_SENDING, body=BODY):
+        return Announcement.objects.create(subject="Schedule posted", body=body, audience=audience, status=status)
+
+    def test_rendered(self):
+        self.announce()
+        queue_announcements()
+
+        emails = self.get_emails()
+        self.assertEquals([email.to for email in emails],
+                          [['admin-test@mg.shadowcon.net'], ['staff-test@mg.shadowcon.net']])
+        self.assertEquals(emails[0].subject, "ShadowCon [Announcement]: Schedule posted")
+        self.assertEquals(emails[0].from_email, self.from_address)
+        self.assertEquals(emails[0].body.splitlines()[:3], ["Adrian Barnes, you're Confirmed.", "Friday Night: Maybe",
+                                                            "Friday Midnight: Maybe"])
+
+    def test_not_escaped(self):
+        User.objects.filter(username="admin").update(first_name="Pat", last_name="O'Brien")
+        self.announce()
+        queue_announcements()
+        self.assertTrue(self.get_emails()[0].body.startswith("Pat O'Brien, you're Confirmed."))
+
+    def test_audience(self):
+        register("waiting")
+        Registration.objects.filter(user__username="waiting").update(status=Registration.STATUS_WAIT_LISTED)
+        self.announce(Announcement.AUDIENCE_WAIT_LISTED)
+        queue_announcements()
+        self.assertEquals([email.to for email in self.get_emails()], [['waiting@test.com']])
+
+    def test_without_email(self):
+        register("nomail", email="")
+        announcement = self.announce()
+        queue_announcements()
+        self.assertEquals(Announcement.objects.get(pk=announcement.pk).queued, 2)
+
+    def test_draft(self):
+        self.announce(status=Announcement.STATUS_DRAFT)
+        self.assertEquals(queue_announcements(), [])
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_invalid_body(self):
+        # a body that doesn't compile is failed, and the announcements after it are still sent
+        invalid = self.announce(body="{% for block in %}")
+        valid = self.announce()
+        finished = queue_announcements()
+        self.assertEquals([(x.pk, x.status) for x in finished], [(invalid.pk, Announcement.STATUS_FAILED),
+                                                                 (valid.pk, Announcement.STATUS_SENT)])
+
+        invalid = Announcement.objects.get(pk=invalid.pk)
+        self.assertEquals((invalid.status, invalid.queued), (Announcement.STATUS_FAILED, 0))
+        self.assertTrue(invalid.last_error.startswith("TemplateSyntaxError: "), invalid.last_error)
+        self.assertIsNotNone(invalid.finished)
+        self.assertEquals(len(self.get_emails()), 2)
+        self.assertEquals(queue_announcements(), [])
+
+    def test_invalid_body_batch(self):
+        announcement = self.announce(body="{% for block in %}")
+        self.assertEquals(queue_announcement_batch(announcement.id).status, Announcement.STATUS_FAILED)
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_resumes(self):
+        for index in range(3):
+            register("person%d" % index)
+        announcement = self.announce()
+
+        announcement = queue_announcement_batch(announcement.id, batch_size=2)
+        self.assertEquals((announcement.status, announcement.queued), (Announcement.STATUS_SENDING, 2))
+        self.assertEquals(QueuedEmail.objects.count(), 2)
+
+        # a later run picks up after the registrations already queued
+        finished = queue_announcements(batch_size=2)
+        self.assertEquals([(x.status, x.queued) for x in finished], [(Announcement.STATUS_SENT, 5)])
+        self.assertIsNotNone(finished[0].finished)
+        self.assertEquals(sorted(QueuedEmail.objects.values_list('to', flat=True)),
+                          ['admin-test@mg.shadowcon.net', 'person0@test.com', 'person1@test.com',
+                           'person2@test.com', 'staff-test@mg.shadowcon.net'])
+        self.assertIsNone(queue_announcement_batch(announcement.id))
+
+    def test_batch_queries(self):
+        for index in range(10):
+            register("person%d" % index)
+
+        counts = []
+        for batch_size in [2, 8]:
+            announcement = self.announce()
+            with CaptureQueriesContext(connection) as context:
+                queue_announcement_batch(announcement.id, batch_size=batch_size)
+            counts.append(len(context))
+        self.assertEquals(counts[0], counts[1])
+
+    def test_command(self):
+        self.announce()
+        out = StringIO()
+        call_command("send_announcements", stdout=out)
+        self.assertEquals(out.getvalue(), "Schedule posted: queued 2 e-mail(s)\n")
+
+    def test_command_invalid_body(self):
+        self.announce(body="{% for block in %}")
+        out = StringIO()
+        call_command("send_announcements", stdout=out)
+        self.assertTrue(out.getvalue().startswith("Schedule posted: failed, TemplateSyntaxError: "), out.getvalue())
+
+    def test_render_error(self):
+        # errors raised while rendering fail the announcement too, rather than the worker
+        invalid = self.announce(body="{% url 'missing' %}")
+        valid = self.announce()
+        self.assertEquals([(x.pk, x.status) for x in queue_announcements()],
+                          [(invalid.pk, Announcement.STATUS_FAILED), (valid.pk, Announcement.STATUS_SENT)])
+
+        invalid = Announcement.objects.get(pk=invalid.pk)
+        self.assertEquals((invalid.status, invalid.queued), (Announcement.STATUS_FAILED, 0))
+        self.assertTrue(invalid.last_error.startswith("NoReverseMatch: "), invalid.last_error)
+        self.assertEquals(len(self.get_emails()), 2)
+
+    def test_outbox_worker(self):
+        self.announce()
+        out = StringIO()
+        call_command("send_queued_email", stdout=out)
+        self.assertEquals(out.getvalue(), "Schedule posted: queued 2 e-mail(s)\nSent 2, will retry 0, failed 0\n")
+        self.assertEquals(len(self.get_emails()), 2)
+
+    def test_admin_invalid_body(self):
+        self.client.login(username="admin", password="123")
+        response = self.client.post(reverse('admin:convention_announcement_add'),
+                                    {'subject': "Schedule posted", 'body': "{% for block in %}",
+                                     'audience': Announcement.AUDIENCE_ALL})
+        self.assertContains(response, "The body is not a valid template")
+        self.assertFalse(Announcement.objects.exists())
+
+    def test_admin_send_failed(self):
+        announcement = self.announce(body="{% for block in %}")
+        queue_announcements()
+        Announcement.objects.filter(pk=announcement.pk).update(body=BODY)
+
+        self.client.login(username="admin", password="123")
+        self.client.post(reverse('admin:convention_announcement_changelist'),
+                         {'action': 'send', '_selected_action': [announcement.pk]}, follow=True)
+        self.assertEquals([(x.status, x.queued) for x in queue_announcements()], [(Announcement.STATUS_SENT, 2)])
+
+    def test_admin_send(self):
+        announcement = self.announce(status=Announcement.STATUS_DRAFT)
+        self.client.login(username="admin", password="123")
+        response = self.client.post(reverse('admin:convention_announcement_changelist'),
+                                    {'action': 'send', '_selected_action': [announcement.pk]}, follow=True)
+        self.assertContains(response, "1 announcement(s) will be sent")
+        self.assertEquals(Announcement.objects.get(pk=announcement.pk).status, Announcement.STATUS_SENDING)
+
+        # the e-mails are left for the worker
+        self.assertFalse(QueuedEmail.objects.exists())
@@ -1,12 +1,17 @@
+from contact.models import EmailList
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from ..forms import AttendanceForm
-from ..models import Registration, BlockRegistration, TimeBlock, PaymentOption
+from ..models import AttendanceSummary, Registration, BlockRegistration, TimeBlock, PaymentOption
+from ..summary import rebuild_summary
 from ..utils import friendly_username
 from datetime import timedelta
 from django.utils import timezone
 from shadowcon.tests.utils import ShadowConTestCase, data_func
 from ddt import ddt
+from reversion import revisions as reversion
 import pytz
 import json
 import os
@@ -29,11 +34,16 @@ def get_user_registration(user_id):
 
 
 def set_registration(registration, time_block, attendance):
-    reg = BlockRegistration(time_block=time_block, registration=registration, attendance=attendance)
+    reg = BlockRegistration(time_block=TimeBlock.objects.get(text=time_block), registration=registration,
+                            attendance=attendance)
     reg.save()
     return reg
 
 
+def summary_counts(rows):
+    return dict((row.time_block_id, (row.yes, row.maybe, row.no, row.missing)) for row in rows)
+
+
 @ddt
 class FormsTest(ShadowConTestCase):
     # Test code for NewUserForm is in shadowcon/tests/test_registration
@@ -92,8 +102,7 @@ class FormsTest(ShadowConTestCase):
 
         user = User.objects.get(id=1)
         form = AttendanceForm(user=user)
-        time_block = TimeBlock.objects.get(text=block_reg.time_block)
-        self.assertEquals(form.fields["block_%d" % time_block.id].initial, block_reg.attendance)
+        self.assertEquals(form.fields["block_%d" % block_reg.time_block_id].initial, block_reg.attendance)
 
     def test_attendance_form_time_block_function_order(self):
         TimeBlock(text="Before Everything", sort_id=0).save()
@@ -193,7 +202,8 @@ class FormsTest(ShadowConTestCase):
 
         init_sat_night = set_registration(registration, "Saturday Evening", BlockRegistration.ATTENDANCE_NO)
         init_sat_mid = set_registration(registration, "Saturday Midnight", BlockRegistration.ATTENDANCE_NO)
-        init_bad = set_registration(registration, "Sunday DNE", BlockRegistration.ATTENDANCE_NO)
+        TimeBlock.objects.create(text="Not Scheduled", sort_id=20)
+        init_bad = set_registration(registration, "Not Scheduled", BlockRegistration.ATTENDANCE_NO)
 
         self.assertEquals(len(BlockRegistration.objects.filter(registration=registration)), 3)
 
@@ -216,6 +226,89 @@ class FormsTest(ShadowConTestCase):
                           BlockRegistration.ATTENDANCE_MAYBE)
         self.assertEquals(len(BlockRegistration.objects.filter(id=init_bad.id)), 0)
 
+    def count_save_queries(self, username, attendance=None):
+        user = User.objects.get_or_create(username=username)[0]
+        form = AttendanceForm(user=user)
+        if attendance is not None:
+            for k in form.time_block_fields().keys():
+                form.fields[k].initial = attendance
+        with CaptureQueriesContext(connection) as context:
+            form.save()
+        return len(context.captured_queries)
+
+    def test_attendance_form_save_constant_queries_initial(self):
+        # the first revision also looks up the content types
+        self.count_save_queries("warm up")
+        few = self.count_save_queries("first")
+        for index in range(10):
+            TimeBlock.objects.create(text="Monday %d" % index, sort_id=10 + index)
+        self.assertEquals(self.count_save_queries("second"), few)
+
+    def test_attendance_form_save_constant_queries_update(self):
+        self.count_save_queries("first")
+        few = self.count_save_queries("first", BlockRegistration.ATTENDANCE_MAYBE)
+        for index in range(10):
+            TimeBlock.objects.create(text="Monday %d" % index, sort_id=10 + index)
+        self.count_save_queries("second")
+        self.assertEquals(self.count_save_queries("second", BlockRegistration.ATTENDANCE_MAYBE), few)
+
+    def test_attendance_form_save_constant_queries_removed(self):
+        for index in range(10):
+            TimeBlock.objects.create(text="Monday %d" % index, sort_id=10 + index)
+        self.count_save_queries("first")
+        self.count_save_queries("second")
+
+        # blocks starting "Not" aren't on the form, so their entries are removed
+        TimeBlock.objects.filter(text="Monday 0").update(text="Not Monday 0")
+        few = self.count_save_queries("first")
+        TimeBlock.objects.filter(text__startswith="Monday").update(text="Not Monday")
+        self.assertEquals(self.count_save_queries("second"), few)
+
+        self.assertFalse(BlockRegistration.objects.filter(registration__user__username="second",
+                                                          time_block__text__startswith="Not").exists())
+        self.assertEquals(summary_counts(AttendanceSummary.objects.all()),
+                          summary_counts(rebuild_summary()))
+
+    def test_attendance_form_save_single_revision(self):
+        user = User.objects.get(username="admin")
+        registration = Registration.objects.get(user=user)
+        form = AttendanceForm(user=user)
+        for k in form.time_block_fields().keys():
+            form.fields[k].initial = BlockRegistration.ATTENDANCE_NO
+        form.save()
+
+        revision = reversion.get_for_object(registration)[0].revision
+        self.assertEquals(revision.user, user)
+        self.assertEquals(revision.comment, "Form Submission - Update")
+        self.assertEquals(revision.version_set.count(), 8)
+        for block_reg in BlockRegistration.objects.filter(registration=registration):
+            version = reversion.get_for_object(block_reg)[0]
+            self.assertEquals(version.revision, revision)
+            self.assertEquals(version.field_dict["attendance"], BlockRegistration.ATTENDANCE_NO)
+            self.assertEquals(version.object_repr, str(block_reg))
+
+    def test_attendance_form_save_summary(self):
+        user = User.objects.get(username="admin")
+        form = AttendanceForm(user=user)
+        for k in form.time_block_fields().keys():
+            form.fields[k].initial = BlockRegistration.ATTENDANCE_NO
+        form.save()
+
+        form = AttendanceForm(user=User.objects.create(username="username"))
+        form.save()
+
+        summary = AttendanceSummary.objects.get(time_block__text="Friday Night")
+        self.assertEquals((summary.yes, summary.maybe, summary.no, summary.missing), (1, 1, 1, 0))
+        self.assertEquals(summary_counts(rebuild_summary()),
+                          summary_counts(AttendanceSummary.objects.all()))
+
+    def test_attendance_form_save_mail_in_transaction(self):
+        # the staff e-mail is queued with the registration, so neither is saved without the other
+        EmailList.objects.filter(name="registration").delete()
+        form = AttendanceForm(user=User.objects.create(username="username"))
+        self.assertRaises(EmailList.DoesNotExist, form.save)
+        self.assertFalse(Registration.objects.filter(user__username="username").exists())
+
     def test_unregister_fail(self):
         user = User(username="username")
         user.save()
@@ -1,11 +1,14 @@
 from ddt import data, ddt
 from django.http.request import HttpRequest
 from django.test.utils import override_settings
+from django.utils import timezone
 from django.utils.html import strip_tags
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from shadowcon.tests.utils import ShadowConTestCase
 from ..models import ConInfo, Game, BlockRegistration, TimeBlock, TimeSlot, PaymentOption, Registration, Location
 from ..models import get_absolute_url, am_pm_print, Trigger, Referral
+from .. import models
 from ..utils import get_choice
 
 
@@ -188,6 +191,58 @@ class ModelsTest(ShadowConTestCase):
         game = Game(title="++ALTERNATE_game-title++")
         self.assertEquals("__alternate_game_title__", game.header_target())
 
+    def create_game(self, title):
+        return Game.objects.create(title=title, gm="GM", user=User.objects.get(username="user"),
+                                   last_modified=timezone.now())
+
+    def test_game_slug(self):
+        self.assertEquals(self.create_game("This is a test!").slug, "this_is_a_test_")
+
+    def test_game_slug_unique(self):
+        titles = ["Midnight Game", "Midnight-Game", "MIDNIGHT game"]
+        self.assertEquals([self.create_game(title).slug for title in titles],
+                          ["midnight_game_2", "midnight_game_3", "midnight_game_4"])
+
+    def test_game_slug_kept(self):
+        game = self.create_game("Midnight Game")
+        game.gm = "Someone else"
+        game.save()
+        self.assertEquals(Game.objects.get(pk=game.pk).slug, "midnight_game_2")
+
+    def test_game_slug_title_changed(self):
+        game = Game.objects.get(title="Midnight Game")
+        game.title = "Dawn Game"
+        game.save()
+        self.assertEquals(Game.objects.get(pk=game.pk).slug, "midnight_game")
+        self.assertEquals(self.create_game("Midnight Game").slug, "midnight_game_2")
+
+    def test_game_slug_taken_meanwhile(self):
+        # as if another game with the title was saved between choosing the slug and inserting the row
+        choices = iter(["midnight_game"])
+        original = models.unique_slug
+        models.unique_slug = lambda base, taken: next(choices, None) or original(base, taken)
+        try:
+            game = self.create_game("Midnight Game")
+        finally:
+            models.unique_slug = original
+        self.assertEquals(Game.objects.get(pk=game.pk).slug, "midnight_game_2")
+
+    def test_game_slug_other_error(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Game.objects.create(title="No GM", gm=None, user=User.objects.get(username="user"),
+                                    last_modified=timezone.now())
+
+    def test_game_slug_not_ascii(self):
+        self.assertEquals(self.create_game(u"Caf\xe9 Noir").slug, "caf__noir")
+
+    def test_game_slug_empty_title(self):
+        self.assertEquals(self.create_game("").slug, "game")
+
+    def test_game_slug_header_target(self):
+        game = self.create_game("Midnight Game")
+        self.assertEquals(game.header_target(), "midnight_game_2")
+
     def test_game_friendly_block_with_time_block(self):
         block = TimeBlock(text="Monday Test", sort_id=1)
         game = Game(title="++ALTERNATE_game-title++", time_block=block)
@@ -257,7 +312,7 @@ class ModelsTest(ShadowConTestCase):
         item = BlockRegistration.objects.all()[0]
         string = str(item)
         self.assertTrue("Registration: %s" % item.registration in string)
-        self.assertTrue("Time Block: %s" % item.time_block in string)
+        self.assertTrue("Time Block: %s" % item.time_block.text in string)
         self.assertTrue("Attendance: %s" % get_choice(item.attendance, BlockRegistration.ATTENDANCE_CHOICES) in string)
 
     def test_block_registration_user_delete(self):
@@ -268,6 +323,17 @@ class ModelsTest(ShadowConTestCase):
         items = Registration.objects.filter(id=reg_id)
         self.assertEquals(0, len(items))
 
+    def test_block_registration_unique(self):
+        item = BlockRegistration.objects.all()[0]
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BlockRegistration.objects.create(registration=item.registration, time_block=item.time_block)
+
+    def test_block_registration_time_block_renamed(self):
+        item = BlockRegistration.objects.all()[0]
+        item.time_block.text = "Renamed"
+        item.time_block.save()
+        self.assertEquals(BlockRegistration.objects.get(id=item.id).time_block.text, "Renamed")
+
     def test_referral_string_unredeemed(self):
         item = Referral.objects.all()[0]
         string = str(item)
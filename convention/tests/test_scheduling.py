@@ -0,0 +1,142 @@
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from shadowcon.tests.utils import ShadowConTestCase, benchmark, time_call
+from unittest import TestCase
+import random
+
+from ..models import Game, Location
+from ..scheduling import ScheduledGame, IntervalIndex, find_conflicts, get_schedule_conflicts
+
+
+def entry(game_id, start, width, location=1, user=1):
+    return ScheduledGame(game_id, "Game %d" % game_id, location, user, start, width)
+
+
+class IntervalIndexTest(TestCase):
+    def overlaps(self, games, key=lambda x: x.location):
+        return [(value, [game.id for game in run]) for value, run in IntervalIndex(games, key).overlaps()]
+
+    def test_no_games(self):
+        self.assertEquals(self.overlaps([]), [])
+
+    def test_apart(self):
+        self.assertEquals(self.overlaps([entry(1, 0, 4), entry(2, 10, 4)]), [])
+
+    def test_touching(self):
+        self.assertEquals(self.overlaps([entry(1, 0, 4), entry(2, 4, 4)]), [])
+
+    def test_overlap(self):
+        self.assertEquals(self.overlaps([entry(2, 3, 4), entry(1, 0, 4)]), [(1, [1, 2])])
+
+    def test_contained(self):
+        self.assertEquals(self.overlaps([entry(1, 0, 10), entry(2, 2, 2), entry(3, 6, 2)]), [(1, [1, 2, 3])])
+
+    def test_chain(self):
+        # the first and last don't overlap each other, but both overlap the middle game
+        self.assertEquals(self.overlaps([entry(1, 0, 4), entry(2, 3, 4), entry(3, 6, 4), entry(4, 20, 4)]),
+                          [(1, [1, 2, 3])])
+
+    def test_separate_runs(self):
+        games = [entry(1, 0, 4), entry(2, 2, 4), entry(3, 10, 4), entry(4, 12, 4)]
+        self.assertEquals(self.overlaps(games), [(1, [1, 2]), (1, [3, 4])])
+
+    def test_separate_locations(self):
+        games = [entry(1, 0, 4, location=1), entry(2, 2, 4, location=2), entry(3, 2, 4, location=2)]
+        self.assertEquals(self.overlaps(games), [(2, [2, 3])])
+
+    def test_unplaced(self):
+        games = [entry(1, 0, 4), entry(2, 100, 4), entry(3, 2, 0), entry(4, 2, 4, location=None)]
+        self.assertEquals(self.overlaps(games), [])
+
+    def test_same_start(self):
+        self.assertEquals(self.overlaps([entry(2, 0, 4), entry(1, 0, 4)]), [(1, [1, 2])])
+
+
+class FindConflictsTest(TestCase):
+    def test_location_and_gm(self):
+        games = [entry(1, 0, 4, location=1, user=1), entry(2, 2, 4, location=1, user=2),
+                 entry(3, 2, 4, location=2, user=1), entry(4, 2, 4, location=None, user=3)]
+        conflicts = [(x.kind, x.key, [game.id for game in x.games]) for x in find_conflicts(games)]
+        self.assertEquals(conflicts, [("location", 1, [1, 2]), ("gm", 1, [1, 3])])
+
+    def test_no_conflicts(self):
+        self.assertEquals(find_conflicts([entry(1, 0, 4, user=1), entry(2, 2, 4, location=2, user=2)]), [])
+
+
+class ScheduleConflictsTest(ShadowConTestCase):
+    def test_fixture_conflicts(self):
+        # admin runs "Down with the sun" on Saturday evening until 2 and the "Midnight Game" from midnight
+        conflicts = get_schedule_conflicts()
+        self.assertEquals(len(conflicts), 1)
+        self.assertEquals(conflicts[0].kind, "gm")
+        self.assertEquals(conflicts[0].key, User.objects.get(username="admin").id)
+        self.assertEquals([game.title for game in conflicts[0].games], ["Down with the sun", "Midnight Game"])
+
+    def test_location_conflict(self):
+        game = Game.objects.get(title="Staff Game")
+        game.location = Location.objects.get(text="Dungeon")
+        game.save()
+
+        conflicts = get_schedule_conflicts()
+        self.assertEquals([(x.kind, [y.title for y in x.games]) for x in conflicts],
+                          [("location", ["Created with a view", "Staff Game"]),
+                           ("gm", ["Down with the sun", "Midnight Game"])])
+
+    def test_query_count(self):
+        with self.assertNumQueries(1):
+            get_schedule_conflicts()
+
+    def test_admin_report(self):
+        self.client.login(username="admin", password="123")
+        response = self.client.get(reverse('admin:convention_game_conflicts'))
+        self.assertSectionContains(response, "Down with the sun", 'table id="conflicts"', "/table")
+        self.assertSectionContains(response, "Midnight Game", 'table id="conflicts"', "/table")
+        self.assertSectionContains(response, "GM", 'table id="conflicts"', "/table")
+
+    def test_admin_report_empty(self):
+        game = Game.objects.get(title="Midnight Game")
+        game.time_block = None
+        game.save()
+
+        self.client.login(username="admin", password="123")
+        response = self.client.get(reverse('admin:convention_game_conflicts'))
+        self.assertContains(response, "No games share a room or a GM.")
+
+    def test_admin_report_not_staff(self):
+        self.client.login(username="user", password="123")
+        response = self.client.get(reverse('admin:convention_game_conflicts'))
+        self.assertEquals(response.status_code, 302)
+
+    def test_admin_change_list_link(self):
+        self.client.login(username="admin", password="123")
+        response = self.client.get(reverse('admin:convention_game_changelist'))
+        self.assertContains(response, reverse('admin:convention_game_conflicts'))
+
+
+@benchmark
+class ConflictBenchmark(TestCase):
+    def make_games(self, count, locations):
+        generator = random.Random(count)
+        return [entry(i, generator.randrange(-18, 48), generator.choice([4, 6, 8]),
+                      location=generator.randrange(locations), user=generator.randrange(count // 3))
+                for i in range(count)]
+
+    def test_find_conflicts(self):
+        timings = []
+        for count in [300, 3000]:
+            games = self.make_games(count, count // 10)
+            timings.append(time_call(lambda: find_conflicts(games), 10))
+            print("\nConflicts between %d games: %.2fms" % (count, timings[-1] * 1000))
+
+        # ten times the games should cost roughly ten times as much, not a hundred
+        self.assertLess(timings[1] / timings[0], 20)
+
+    def test_crowded(self):
+        # everything in one room by one GM, the worst case for reporting pairs
+        timings = []
+        for count in [1000, 10000]:
+            games = [entry(i, i % 48, 8) for i in range(count)]
+            timings.append(time_call(lambda: find_conflicts(games), 10))
+            print("\nConflicts between %d crowded games: %.2fms" % (count, timings[-1] * 1000))
+
+        self.assertLess(timings[1] / timings[0], 20)
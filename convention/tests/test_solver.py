@@ -0,0 +1,275 @@
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import Client
+from django.utils.six import StringIO
+from ddt import ddt, data, unpack
+from reversion import revisions as reversion
+from shadowcon.tests.utils import ShadowConTestCase, benchmark
+from unittest import TestCase
+import json
+import random
+import time
+
+from ..models import Game, Location, TimeBlock, TimeSlot
+from ..scheduling import ScheduledGame, find_conflicts, get_block_offset, get_width
+from ..solver import Preferences, ScheduleSolver, get_schedule_solver
+
+block_texts = ["Friday Night", "Friday Midnight", "Saturday Morning", "Saturday Afternoon", "Saturday Evening",
+               "Saturday Midnight", "Sunday Morning"]
+location_texts = ["Boiler Room", "Dance Floor", "Dungeon"]
+
+
+def blocks():
+    return [TimeBlock(id=index + 1, text=text, sort_id=index) for index, text in enumerate(block_texts)]
+
+
+def locations():
+    return [Location(id=index + 1, text=text) for index, text in enumerate(location_texts)]
+
+
+def block_ids(*texts):
+    return set(block_texts.index(text) + 1 for text in texts)
+
+
+@ddt
+class PreferencesTest(TestCase):
+    def parse(self, preferred_time, special_requests=""):
+        game = Game(preferred_time=preferred_time, special_requests=special_requests)
+        return Preferences.parse(game, blocks(), locations())
+
+    @data(("", []),
+          ("Whenever", []),
+          ("No preference", []),
+          ("Saturday Morning", ["Saturday Morning"]),
+          ("saturday", ["Saturday Morning", "Saturday Afternoon", "Saturday Evening", "Saturday Midnight"]),
+          ("Morning", ["Saturday Morning", "Sunday Morning"]),
+          ("Friday or Sunday morning", ["Friday Night", "Friday Midnight", "Sunday Morning"]),
+          ("Daytime", ["Saturday Morning", "Saturday Afternoon", "Sunday Morning"]),
+          ("Saturday night", ["Saturday Evening", "Saturday Midnight"]),
+          ("late", ["Friday Midnight", "Saturday Midnight"]))
+    @unpack
+    def test_blocks(self, text, expected):
+        preferences = self.parse(text)
+        self.assertEquals(preferences.blocks, block_ids(*expected))
+        self.assertEquals(preferences.avoid_blocks, set())
+
+    def test_avoid_blocks(self):
+        preferences = self.parse("Saturday, but not Saturday morning")
+        self.assertEquals(preferences.blocks, block_ids("Saturday Afternoon", "Saturday Evening", "Saturday Midnight"))
+        self.assertEquals(preferences.avoid_blocks, block_ids("Saturday Morning"))
+
+    @data(("In the dungeon", [3], []),
+          ("Dance floor please", [2], []),
+          ("Not the boiler room", [], [1]),
+          ("Quiet room", [], []),
+          ("Dungeon or boiler room", [1, 3], []))
+    @unpack
+    def test_locations(self, text, expected, avoided):
+        preferences = self.parse("", text)
+        self.assertEquals(preferences.locations, set(expected))
+        self.assertEquals(preferences.avoid_locations, set(avoided))
+
+    def test_cost(self):
+        preferences = self.parse("Saturday morning, not friday", "In the dungeon")
+        self.assertEquals(preferences.cost(3, 3), 0)
+        self.assertEquals(preferences.cost(4, 3), 10)
+        self.assertEquals(preferences.cost(1, 3), 30)
+        self.assertEquals(preferences.cost(3, 1), 5)
+        self.assertEquals(preferences.cost(1, 1), 35)
+
+    def test_no_preferences_cost(self):
+        self.assertEquals(self.parse("").cost(1, 1), 0)
+
+
+def conflicts(solver, proposals):
+    games = dict((game.id, game) for game in solver.games)
+    placements = dict((game.id, (game.time_block, game.time_slot, game.location)) for game in solver.fixed)
+    for proposal in proposals:
+        if proposal.time_block is not None:
+            placements[proposal.game.id] = (proposal.time_block, proposal.time_slot, proposal.location)
+
+    entries = [ScheduledGame(game_id, games[game_id].title, location.id, games[game_id].user_id,
+                             get_block_offset(block) + slot.start, get_width(slot))
+               for game_id, (block, slot, location) in placements.items()]
+    return find_conflicts(entries)
+
+
+def synthetic_convention(game_count, location_count, seed=0):
+    generator = random.Random(seed)
+    time_blocks = blocks()
+    slots = dict((name, TimeSlot(id=index + 1, start=start, stop=start + 4)) for index, (name, start) in
+                 enumerate([("morning", 9), ("afternoon", 14), ("night", 19), ("evening", 19), ("midnight", 0)]))
+    rooms = [Location(id=index + 1, text="Room %d" % index) for index in range(location_count)]
+    preferences = ["", "Saturday", "Morning", "Friday night", "Not sunday", "Daytime", "Late"]
+
+    games = []
+    for index in range(game_count):
+        game = Game(id=index + 1, title="Game %d" % index, user_id=generator.randrange(game_count // 2 + 1),
+                    preferred_time=generator.choice(preferences),
+                    special_requests=generator.choice(["", "", rooms[generator.randrange(location_count)].text]))
+        # one game in each block is already placed by hand, which also tells the solver the block's slot
+        if index < len(time_blocks):
+            game.time_block = time_blocks[index]
+            game.time_slot = slots[time_blocks[index].second_word().lower()]
+            game.location = rooms[index % location_count]
+        games.append(game)
+
+    return games, time_blocks, sorted(slots.values(), key=lambda x: x.id), rooms
+
+
+class ScheduleSolverTest(TestCase):
+    def test_no_conflicts(self):
+        games, time_blocks, slots, rooms = synthetic_convention(40, 8)
+        solver = ScheduleSolver(games, time_blocks, slots, rooms)
+        proposals = solver.solve()
+
+        self.assertEquals(len(proposals), len(solver.free))
+        self.assertTrue(all(proposal.time_block is not None for proposal in proposals))
+        self.assertEquals(conflicts(solver, proposals), [])
+        self.assertEquals(solver.conflict_count(), 0)
+
+    def test_keeps_placed_games(self):
+        games, time_blocks, slots, rooms = synthetic_convention(40, 8)
+        solver = ScheduleSolver(games, time_blocks, slots, rooms)
+        proposed = set(proposal.game.id for proposal in solver.solve())
+        self.assertEquals(proposed, set(game.id for game in games if game.location is None))
+
+    def test_preferences(self):
+        games, time_blocks, slots, rooms = synthetic_convention(10, 3)
+        games[-2].preferred_time = "Sunday morning"
+        games[-2].special_requests = "Room 2 please"
+        games[-1].preferred_time = "Not saturday, not sunday"
+
+        proposals = dict((proposal.game.id, proposal) for proposal in
+                         ScheduleSolver(games, time_blocks, slots, rooms).solve())
+        self.assertEquals(proposals[games[-2].id].time_block.text, "Sunday Morning")
+        self.assertEquals(proposals[games[-2].id].location.text, "Room 2")
+        self.assertEquals(proposals[games[-1].id].time_block.first_word(), "Friday")
+
+    def test_partial_placement(self):
+        games, time_blocks, slots, rooms = synthetic_convention(10, 3)
+        games[-2].time_slot = slots[4]
+        games[-1].location = rooms[2]
+
+        proposals = dict((proposal.game.id, proposal) for proposal in
+                         ScheduleSolver(games, time_blocks, slots, rooms).solve())
+        self.assertEquals(proposals[games[-2].id].time_slot, slots[4])
+        self.assertEquals(proposals[games[-1].id].location, rooms[2])
+
+    def test_no_room(self):
+        games, time_blocks, slots, rooms = synthetic_convention(10, 3)
+        for game in games:
+            game.location = None
+
+        proposals = ScheduleSolver(games, time_blocks, slots, []).solve()
+        self.assertEquals([(x.time_block, x.time_slot, x.location) for x in proposals], [(None, None, None)] * 10)
+
+    def test_spread(self):
+        # with room to spare, games without preferences shouldn't pile into one block
+        games, time_blocks, slots, rooms = synthetic_convention(30, 10)
+        for game in games:
+            game.preferred_time = ""
+            game.special_requests = ""
+
+        proposals = ScheduleSolver(games, time_blocks, slots, rooms).solve()
+        self.assertGreater(len(set(proposal.time_block.id for proposal in proposals)), 3)
+
+    def test_overbooked(self):
+        # one GM running more games than there are blocks can't avoid a conflict
+        games, time_blocks, slots, rooms = synthetic_convention(30, 10)
+        for game in games:
+            game.user_id = 1
+
+        solver = ScheduleSolver(games, time_blocks, slots, rooms)
+        solver.solve()
+        self.assertGreater(solver.conflict_count(), 0)
+
+
+class ScheduleSolverDatabaseTest(ShadowConTestCase):
+    def test_fixture(self):
+        solver = get_schedule_solver()
+        proposals = dict((proposal.game.title, proposal) for proposal in solver.solve())
+
+        self.assertEquals(sorted(proposals), ["Missing Location", "Missing Time Block", "Missing Time Slot"])
+        self.assertEquals(proposals["Missing Location"].time_block.text, "Friday Night")
+        self.assertEquals(proposals["Missing Location"].time_slot.id, 9)
+        self.assertEquals(proposals["Missing Time Block"].time_slot.id, 1)
+        self.assertEquals(proposals["Missing Time Block"].location.text, "Dungeon")
+        self.assertEquals(proposals["Missing Time Slot"].time_block.text, "Friday Night")
+        self.assertEquals(proposals["Missing Time Slot"].location.text, "Boiler Room")
+
+        # admin's two Saturday night games were placed by hand and still overlap
+        self.assertEquals(solver.conflict_count(), 1)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("schedule_games", stdout=out)
+        self.assertIn("Missing Location: Friday ", out.getvalue())
+        self.assertIn("Proposed 3 game(s), 1 conflict(s) left", out.getvalue())
+        self.assertIsNone(Game.objects.get(title="Missing Location").location)
+
+    def test_command_apply(self):
+        out = StringIO()
+        call_command("schedule_games", "--apply", stdout=out)
+        self.assertIn("Saved 3 game(s)", out.getvalue())
+
+        game = Game.objects.get(title="Missing Location")
+        self.assertIsNotNone(game.location)
+        self.assertIsNotNone(game.last_scheduled)
+
+        versions = reversion.get_for_object(game)
+        self.assertEquals(len(versions), 1)
+        self.assertEquals(versions[0].revision.comment, "Automatic Schedule")
+        other = Game.objects.get(title="Missing Time Slot")
+        self.assertEquals(versions[0].revision, reversion.get_for_object(other)[0].revision)
+
+
+class ScheduleSuggestTest(ShadowConTestCase):
+    url = reverse('convention:ajax_schedule_suggest')
+
+    def setUp(self):
+        self.client = Client(HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.client.login(username="staff", password="123")
+
+    def test_suggest(self):
+        json_data = json.loads(self.client.get(self.url).content)
+        self.assertEquals(json_data["status"], 200)
+
+        proposals = json_data["content"]["proposals"]
+        titles = [Game.objects.get(id=proposal["id"]).title for proposal in proposals]
+        self.assertEquals(sorted(titles), ["Missing Location", "Missing Time Block", "Missing Time Slot"])
+        for proposal in proposals:
+            self.assertTrue(Location.objects.filter(id=proposal["location"]).exists())
+            self.assertTrue(TimeBlock.objects.filter(id=proposal["time_block"]).exists())
+            self.assertTrue(TimeSlot.objects.filter(id=proposal["time_slot"]).exists())
+        self.assertEquals(json_data["content"]["conflicts"], 1)
+
+        # nothing is saved until the editor does
+        self.assertIsNone(Game.objects.get(title="Missing Location").location)
+
+    def test_not_staff(self):
+        self.client.logout()
+        self.client.login(username="user", password="123")
+        json_data = json.loads(self.client.get(self.url).content)
+        self.assertEquals(json_data["status"], 500)
+
+    def test_not_logged_in(self):
+        self.client.logout()
+        json_data = json.loads(self.client.get(self.url).content)
+        self.assertEquals(json_data["status"], 500)
+
+
+@benchmark
+class ScheduleSolverBenchmark(TestCase):
+    def test_solve(self):
+        for game_count, location_count in [(50, 10), (150, 30), (300, 60), (300, 48)]:
+            games, time_blocks, slots, rooms = synthetic_convention(game_count, location_count)
+            start = time.time()
+            solver = ScheduleSolver(games, time_blocks, slots, rooms, time_limit=30)
+            proposals = solver.solve()
+            elapsed = time.time() - start
+
+            print("\nScheduled %d games in %d rooms: %.2fs, %d conflict(s)" %
+                  (game_count, location_count, elapsed, len(conflicts(solver, proposals))))
+            self.assertLess(elapsed, 10)
+            self.assertEquals(conflicts(solver, proposals), [])
@@ -0,0 +1,172 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db.models import Count, ProtectedError
+from django.utils import timezone
+from django.utils.six import StringIO
+from shadowcon.tests.utils import ShadowConTestCase
+
+from ..forms import AttendanceForm
+from ..models import AttendanceSummary, BlockRegistration, PaymentOption, Registration, TimeBlock
+from ..summary import get_headcounts, rebuild_summary
+
+
+def recount():
+    counts = {}
+    for row in BlockRegistration.objects.values('time_block__text', 'attendance').annotate(count=Count('id')):
+        counts[(row['time_block__text'], row['attendance'])] = row['count']
+    total = Registration.objects.count()
+
+    result = {}
+    for block in TimeBlock.objects.all():
+        yes, maybe, no = [counts.get((block.text, attendance), 0) for attendance in ['Y', 'M', 'N']]
+        result[block.text] = (yes, maybe, no, total - yes - maybe - no)
+    return result
+
+
+def summary():
+    return dict((row.time_block.text, (row.yes, row.maybe, row.no, row.missing))
+                for row in AttendanceSummary.objects.select_related('time_block'))
+
+
+class AttendanceSummaryTest(ShadowConTestCase):
+    def assertSummaryCorrect(self):
+        self.assertEquals(summary(), recount())
+
+    def register(self, username, attendance, **changes):
+        user = User.objects.get(username=username)
+        data = dict(("block_%s" % block.id, changes.get(block.text.replace(" ", "_"), attendance))
+                    for block in TimeBlock.objects.all())
+        form = AttendanceForm(user=user, data=data)
+        self.assertTrue(form.is_valid())
+        form.save()
+
+    def test_fixture(self):
+        self.assertEquals(summary()["Friday Night"], (0, 2, 0, 0))
+        self.assertEquals(summary()["Sunday Morning"], (0, 0, 2, 0))
+        self.assertSummaryCorrect()
+
+    def test_new_registration(self):
+        self.register("user", BlockRegistration.ATTENDANCE_YES)
+        self.assertEquals(summary()["Friday Night"], (1, 2, 0, 0))
+        self.assertSummaryCorrect()
+
+    def test_changed_registration(self):
+        self.register("admin", BlockRegistration.ATTENDANCE_NO, Sunday_Morning=BlockRegistration.ATTENDANCE_YES)
+        self.assertEquals(summary()["Friday Night"], (0, 1, 1, 0))
+        self.assertEquals(summary()["Saturday Morning"], (0, 1, 1, 0))
+        self.assertEquals(summary()["Sunday Morning"], (1, 0, 1, 0))
+        self.assertSummaryCorrect()
+
+    def test_registration_without_entries(self):
+        Registration.objects.create(user=User.objects.get(username="user"), registration_date=timezone.now(),
+                                    last_updated=timezone.now(), payment=PaymentOption.objects.all()[0])
+        self.assertEquals(summary()["Friday Night"], (0, 2, 0, 1))
+        self.assertSummaryCorrect()
+
+    def test_deleted_entry(self):
+        BlockRegistration.objects.get(registration__user__username="admin", time_block__text="Friday Night").delete()
+        self.assertEquals(summary()["Friday Night"], (0, 1, 0, 1))
+        self.assertSummaryCorrect()
+
+    def test_moved_entry(self):
+        BlockRegistration.objects.get(registration__user__username="admin", time_block__text="Saturday Midnight") \
+            .delete()
+        entry = BlockRegistration.objects.get(registration__user__username="admin", time_block__text="Friday Night")
+        entry.time_block = TimeBlock.objects.get(text="Saturday Midnight")
+        entry.attendance = BlockRegistration.ATTENDANCE_NO
+        entry.save()
+        self.assertEquals(summary()["Friday Night"], (0, 1, 0, 1))
+        self.assertEquals(summary()["Saturday Midnight"], (0, 1, 1, 0))
+        self.assertSummaryCorrect()
+
+    def test_entry_saved_without_loading(self):
+        entry = BlockRegistration.objects.get(registration__user__username="admin", time_block__text="Friday Night")
+        BlockRegistration(id=entry.id, registration=entry.registration, time_block=entry.time_block,
+                          attendance=BlockRegistration.ATTENDANCE_YES).save()
+        self.assertEquals(summary()["Friday Night"], (1, 1, 0, 0))
+        self.assertSummaryCorrect()
+
+    def test_deleted_registration(self):
+        Registration.objects.get(user__username="admin").delete()
+        self.assertEquals(summary()["Friday Night"], (0, 1, 0, 0))
+        self.assertSummaryCorrect()
+
+    def test_deleted_user(self):
+        User.objects.get(username="staff").delete()
+        self.assertSummaryCorrect()
+
+    def test_new_time_block(self):
+        TimeBlock.objects.create(text="Sunday Afternoon", sort_id=20)
+        self.assertEquals(summary()["Sunday Afternoon"], (0, 0, 0, 2))
+        self.assertSummaryCorrect()
+
+    def test_renamed_time_block(self):
+        block = TimeBlock.objects.get(text="Sunday Morning")
+        block.text = "Sunday Brunch"
+        block.save()
+        self.assertEquals(summary()["Sunday Brunch"], (0, 0, 2, 0))
+        self.assertSummaryCorrect()
+
+    def test_deleted_time_block(self):
+        TimeBlock.objects.create(text="Sunday Afternoon", sort_id=20).delete()
+        self.assertNotIn("Sunday Afternoon", summary())
+
+    def test_answered_time_block_kept(self):
+        self.assertRaises(ProtectedError, TimeBlock.objects.get(text="Sunday Morning").delete)
+        self.assertEquals(BlockRegistration.objects.filter(time_block__text="Sunday Morning").count(), 2)
+        self.assertSummaryCorrect()
+
+    def test_rebuild(self):
+        BlockRegistration.objects.filter(time_block__text="Friday Night") \
+            .update(attendance=BlockRegistration.ATTENDANCE_YES)
+        AttendanceSummary.objects.update(missing=5)
+        self.assertNotEquals(summary(), recount())
+
+        rebuild_summary()
+        self.assertSummaryCorrect()
+
+    def test_rebuild_command(self):
+        AttendanceSummary.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_attendance_summary", stdout=out)
+        self.assertSummaryCorrect()
+        self.assertIn("Friday Night: 0 yes, 2 maybe, 0 no, 0 missing", out.getvalue())
+        self.assertIn("Rebuilt 7 time block(s)", out.getvalue())
+
+    def test_fixture_load(self):
+        # the entries loaded are counted by rebuilding afterwards, not by the signals sent for each one
+        BlockRegistration.objects.all().delete()
+        counts = summary()
+        call_command("loaddata", "test", verbosity=0)
+        self.assertEquals(summary(), counts)
+
+        rebuild_summary()
+        self.assertSummaryCorrect()
+
+    def test_headcounts(self):
+        with self.assertNumQueries(1):
+            headcounts = get_headcounts()
+        self.assertEquals([(row.time_block.text, row.yes, row.maybe) for row in headcounts][:3],
+                          [("Friday Night", 0, 2), ("Friday Midnight", 0, 2), ("Saturday Morning", 1, 1)])
+
+    def test_sidebar_staff(self):
+        self.client.login(username="staff", password="123")
+        response = self.client.get(reverse('convention:user_profile'))
+        self.assertSectionContains(response, "<li>Saturday Morning: 1 yes, 1 maybe</li>", 'li id="headcounts"',
+                                   "/ul")
+
+    def test_sidebar_not_modified(self):
+        self.client.login(username="staff", password="123")
+        etag = self.client.get('/')["ETag"]
+        self.assertEquals(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        entry = BlockRegistration.objects.filter(attendance=BlockRegistration.ATTENDANCE_MAYBE)[0]
+        entry.attendance = BlockRegistration.ATTENDANCE_YES
+        entry.save()
+        self.assertEquals(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_sidebar_not_staff(self):
+        self.client.login(username="user", password="123")
+        response = self.client.get(reverse('convention:user_profile'))
+        self.assertNotContains(response, "headcounts")
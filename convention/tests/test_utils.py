@@ -1,9 +1,15 @@
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test.utils import override_settings
 from ..utils import friendly_username, get_registration, get_con_value, is_registration_open, is_pre_reg_open
+from ..utils import get_con_info, get_file_version, invalidate_con_info, CON_INFO_CACHE_KEY
 from ..models import ConInfo, Registration, BlockRegistration
 from datetime import timedelta
 from django.utils import timezone
 from shadowcon.tests.utils import ShadowConTestCase
+import os
+import shutil
+import tempfile
 
 
 class UtilsTest(ShadowConTestCase):
@@ -97,3 +103,75 @@ class UtilsTest(ShadowConTestCase):
                            'Saturday Evening: Maybe',
                            'Saturday Midnight: Maybe',
                            '<b>Partially Registered: Please re-register</b>'])
+
+    def test_con_info_cached(self):
+        get_con_info()
+        with self.assertNumQueries(0):
+            self.assertEquals(get_con_value('location'), "Behind the tardis")
+            self.assertEquals(get_con_value('max_attendees'), 10)
+
+    def test_con_info_invalidated_on_save(self):
+        get_con_info()
+        con = ConInfo.objects.all()[0]
+        con.location = "Somewhere else"
+        con.save()
+        self.assertEquals(get_con_value('location'), "Somewhere else")
+
+    def test_con_info_invalidated_on_delete(self):
+        get_con_info()
+        ConInfo.objects.all()[0].delete()
+        with self.assertRaises(ValueError) as e:
+            get_con_value('location')
+        self.assertEquals(e.exception.message, "No con object found")
+
+    def test_con_info_cached_until_timeout(self):
+        get_con_info()
+        # an update from another worker doesn't send this one a signal
+        ConInfo.objects.update(location="Somewhere else")
+        self.assertEquals(get_con_value('location'), "Behind the tardis")
+
+    @override_settings(CON_INFO_TIMEOUT=0)
+    def test_con_info_expired(self):
+        get_con_info()
+        ConInfo.objects.update(location="Somewhere else")
+        self.assertEquals(get_con_value('location'), "Somewhere else")
+
+    def test_con_info_read_only(self):
+        with self.assertRaises(AttributeError):
+            get_con_info().location = "Somewhere else"
+        self.assertEquals(get_con_value('location'), "Behind the tardis")
+
+    @override_settings(CON_INFO_CACHE='default')
+    def test_con_info_shared_cache(self):
+        invalidate_con_info()
+        self.assertEquals(get_con_value('location'), "Behind the tardis")
+        self.assertEquals(cache.get(CON_INFO_CACHE_KEY)['location'], "Behind the tardis")
+        with self.assertNumQueries(0):
+            get_con_value('location')
+
+    @override_settings(CON_INFO_CACHE='default')
+    def test_con_info_shared_cache_invalidated_on_save(self):
+        get_con_info()
+        con = ConInfo.objects.all()[0]
+        con.location = "Somewhere else"
+        con.save()
+        self.assertIsNone(cache.get(CON_INFO_CACHE_KEY))
+        self.assertEquals(get_con_value('location'), "Somewhere else")
+
+    def test_file_version_stable(self):
+        self.assertEquals(get_file_version(), get_file_version())
+
+    def test_file_version_changes_with_files(self):
+        folder = tempfile.mkdtemp()
+        try:
+            with override_settings(STATICFILES_DIRS=[folder]):
+                version = get_file_version()
+                with open(os.path.join(folder, "site.css"), "w") as css:
+                    css.write("body {}")
+                changed = get_file_version()
+                self.assertNotEquals(changed, version)
+
+                os.utime(os.path.join(folder, "site.css"), (0, 0))
+                self.assertNotEquals(get_file_version(), changed)
+        finally:
+            shutil.rmtree(folder)
@@ -1,13 +1,18 @@
+from contact.models import EmailList
+from django.contrib import admin
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import Client
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils.html import escape
 from django.utils import timezone
+from convention.admin import GameAdmin
 from convention.models import Game, TimeBlock, TimeSlot, Location, ConInfo, Registration
 from convention.utils import friendly_username
-from convention.views.games import get_block_offset, get_start, get_width, get_index
-from shadowcon.tests.utils import ShadowConTestCase, data_func
+from convention.scheduling import get_start
+from convention.views.games import get_block_offset, get_width, get_schedule_data
+from shadowcon.tests.utils import ShadowConTestCase, data_func, benchmark, time_call
 from ddt import ddt, data, unpack
 from datetime import timedelta
 from reversion import revisions as reversion
@@ -352,6 +357,15 @@ class NewGameTest(ShadowConTestCase):
     def test_create_logged_in_post(self):
         self.run_create_post_test('staff')
 
+    def test_create_mail_in_transaction(self):
+        # the e-mail is queued with the game, so neither is saved without the other
+        EmailList.objects.filter(name="game_submission").delete()
+        self.client.login(username='staff', password='123')
+        game = Game()
+        modify_game(game)
+        self.assertRaises(EmailList.DoesNotExist, self.client.post, self.url, game.__dict__)
+        self.assertFalse(Game.objects.filter(title="Unit Test Title").exists())
+
     def test_create_before_con_open_post(self):
         info = ConInfo.objects.all()[0]
         info.registration_opens = timezone.now() + timedelta(days=1)
@@ -524,6 +538,108 @@ class GameListTest(ShadowConTestCase):
                                   'div id="%s"' % game.header_target(), '/div')
 
 
+class GameListCacheTest(ShadowConTestCase):
+    def get_section_for(self, game):
+        response = self.client.get(reverse('convention:games_list'))
+        return self.get_section(response, 'div id="%s"' % game.header_target(), '/div')
+
+    def test_cached(self):
+        game = Game.objects.get(id=2)
+        self.get_section_for(game)
+        Game.objects.filter(id=game.id).update(description="Changed behind the cache's back")
+        self.assertNotIn("Changed behind the cache's back", self.get_section_for(game))
+
+    def test_modified(self):
+        game = Game.objects.get(id=2)
+        other = Game.objects.get(id=3)
+        self.get_section_for(game)
+        Game.objects.filter(id=other.id).update(description="Stale description")
+        Game.objects.filter(id=game.id).update(description="New description",
+                                               last_modified=game.last_modified + timedelta(seconds=1))
+
+        self.assertIn("New description", self.get_section_for(game))
+        # the other games are still served from the cache
+        self.assertNotIn("Stale description", self.get_section_for(other))
+
+    def test_scheduled(self):
+        game = Game.objects.get(id=2)
+        self.get_section_for(game)
+        Game.objects.filter(id=game.id).update(time_block=TimeBlock.objects.get(text="Sunday Morning"),
+                                               last_scheduled=timezone.now())
+        self.assertIn("Time Slot: Sunday", self.get_section_for(game))
+
+    def test_time_block_renamed(self):
+        game = Game.objects.filter(time_block__isnull=False, time_slot__isnull=False)[0]
+        self.get_section_for(game)
+        block = game.time_block
+        block.text = "Caturday Morning"
+        block.save()
+        self.assertIn("Time Slot: Caturday Morning : ", self.get_section_for(game))
+
+    def test_queries(self):
+        self.client.get(reverse('convention:games_list'))
+        user = User.objects.get(username="user")
+        block = TimeBlock.objects.all()[0]
+        slot = TimeSlot.objects.all()[0]
+
+        counts = []
+        for count in [5, 20]:
+            Game.objects.bulk_create([Game(title="Extra %d" % i, gm="GM", user=user, last_modified=timezone.now(),
+                                           time_block=block, time_slot=slot, description="Extra",
+                                           slug="extra_%d_%d" % (count, i))
+                                      for i in range(count)])
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(reverse('convention:games_list'))
+            counts.append(len(context))
+        self.assertEquals(counts[0], counts[1])
+
+    def test_admin_save_modifies(self):
+        game = Game.objects.get(id=2)
+        modified = game.last_modified
+        form = type("Form", (object,), {"changed_data": ["description"]})()
+        GameAdmin(Game, admin.site).save_model(None, game, form, True)
+        self.assertGreater(Game.objects.get(id=2).last_modified, modified)
+
+    def test_admin_keeps_last_modified(self):
+        game = Game.objects.get(id=2)
+        game.last_modified = timezone.now() - timedelta(days=30)
+        form = type("Form", (object,), {"changed_data": ["description", "last_modified"]})()
+        GameAdmin(Game, admin.site).save_model(None, game, form, True)
+        self.assertEquals(Game.objects.get(id=2).last_modified, game.last_modified)
+
+
+class GameDetailTest(ShadowConTestCase):
+    def test_detail(self):
+        game = Game.objects.get(title="Midnight Game")
+        response = self.client.get(reverse('convention:game_detail', args=(game.slug,)))
+        self.assertSectionContains(response, "ShadowCon 2016 - Midnight Game", "title")
+        section = self.get_section(response, 'div id="midnight_game"', '/div')
+        self.assertStringContains(section, "Time Slot: %s<br />" % game.combined_time(), "p")
+        self.assertStringContains(section, "GM: %s<br />" % game.gm, "p")
+
+    def test_url(self):
+        self.assertEquals(Game.objects.get(title="Midnight Game").get_absolute_url(),
+                          "/games/description/midnight_game/")
+
+    def test_missing(self):
+        self.assertEquals(self.client.get(reverse('convention:game_detail', args=("no_such_game",))).status_code, 404)
+
+    def test_queries(self):
+        url = reverse('convention:game_detail', args=("midnight_game",))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        games = [query['sql'] for query in context.captured_queries
+                 if 'FROM "convention_game"' in query['sql'] and "COUNT" not in query['sql']]
+        self.assertEquals(len(games), 1)
+        self.assertIn('"convention_game"."slug" = ', games[0])
+
+    def test_not_modified(self):
+        url = reverse('convention:game_detail', args=("midnight_game",))
+        etag = self.client.get(url)["ETag"]
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
 @ddt
 class GameShowScheduleTest(ShadowConTestCase):
     def setUp(self):
@@ -545,7 +661,7 @@ class GameShowScheduleTest(ShadowConTestCase):
         pattern = '%s</a></td>\\s+<td>%s</td>\\s+<td>%s</td>\\s+<td>%s</td>' % \
                   (game.title, game.combined_time(), game.number_players, game.gm)
         self.assertStringContains(section, pattern,
-                                  'a href="%s#%s"' % (reverse('convention:games_list'), game.header_target()), "/tr")
+                                  'a href="%s"' % reverse('convention:game_detail', args=(game.slug,)), "/tr")
 
     def test_javascript_schedule(self):
         self.assertSectionContains(self.response, '<div id="schedule"></div>', 'h2', '/div')
@@ -555,6 +671,62 @@ class GameShowScheduleTest(ShadowConTestCase):
                                    reverse('convention:ajax_location_schedule_view'), 'head')
 
 
+class ScheduleViewCacheTest(ShadowConTestCase):
+    def get_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('convention:show_schedule'))
+        self.assertEquals(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries]
+
+    def add_games(self, count):
+        user = User.objects.get(username="user")
+        blocks = list(TimeBlock.objects.all())
+        slots = list(TimeSlot.objects.all())
+        first = Game.objects.count()
+        Game.objects.bulk_create([Game(title="Extra %d" % i, gm="GM", user=user, last_modified=timezone.now(),
+                                       time_block=blocks[i % len(blocks)], time_slot=slots[i % len(slots)],
+                                       slug="extra_%d" % i)
+                                  for i in range(first, first + count)])
+
+    def test_constant_queries(self):
+        self.client.get(reverse('convention:show_schedule'))
+        counts = []
+        for count in [5, 50]:
+            self.add_games(count)
+            counts.append(len(self.get_queries()))
+        self.assertEquals(counts[0], counts[1])
+
+    def test_single_game_query(self):
+        self.add_games(20)
+        games = [sql for sql in self.get_queries() if 'FROM "convention_game"' in sql and "COUNT" not in sql]
+        self.assertEquals(len(games), 1)
+
+    def test_cached(self):
+        self.get_queries()
+        games = [sql for sql in self.get_queries() if 'FROM "convention_game"' in sql and "COUNT" not in sql]
+        self.assertEquals(games, [])
+
+    def test_time_block_renamed(self):
+        self.client.get(reverse('convention:show_schedule'))
+        game = Game.objects.filter(time_block__isnull=False, time_slot__isnull=False)[0]
+        block = game.time_block
+        block.text = "Caturday Morning"
+        block.save()
+
+        response = self.client.get(reverse('convention:show_schedule'))
+        self.assertSectionContains(response, '%s</a></td>\\s+<td>Caturday Morning : ' % game.title,
+                                   'table id="Caturday Morning" class="schedule" border="1"', '/table')
+
+    def test_game_added(self):
+        self.client.get(reverse('convention:show_schedule'))
+        Game.objects.create(title="Late Arrival", gm="GM", user=User.objects.get(username="user"),
+                            last_modified=timezone.now())
+        response = self.client.get(reverse('convention:show_schedule'))
+        self.assertSectionContains(response, 'href="%s">Late Arrival</a>' %
+                                   reverse('convention:game_detail', args=("late_arrival",)),
+                                   'table id="Not Scheduled" class="schedule" border="1"', '/table')
+
+
 @ddt
 class GameEditScheduleTest(ShadowConTestCase):
     def setUp(self):
@@ -575,14 +747,21 @@ class GameEditScheduleTest(ShadowConTestCase):
         self.assertSectionContains(self.response, pattern, 'table id="schedule_edit" width="100%" border="1"', '/table')
 
     def test_ajax_hookup(self):
-        self.assertSectionContains(self.response, 'registerSchedule\\("#schedule",\\s+\'%s\',\\s+"#schedule_edit"\\);' %
-                                   reverse('convention:ajax_location_schedule_view'), 'head')
+        pattern = 'registerSchedule\\("#schedule",\\s+\'%s\',\\s+"#schedule_edit",\\s+\'%s\',\\s+\'%s\'\\);' % \
+                  (reverse('convention:ajax_location_schedule_view'), reverse('convention:ajax_schedule_save'),
+                   reverse('convention:ajax_schedule_suggest'))
+        self.assertSectionContains(self.response, pattern, 'head')
 
     def test_save_button(self):
         pattern = '<span class="glyphicon glyphicon-floppy-disk" aria-hidden="true"></span>&nbsp;Save'
         self.assertSectionContains(self.response, pattern,
                                    'button type="button" class="btn btn-default" id="save" disabled', '/button')
 
+    def test_suggest_button(self):
+        pattern = '<span class="glyphicon glyphicon-flash" aria-hidden="true"></span>&nbsp;Suggest'
+        self.assertSectionContains(self.response, pattern, 'button type="button" class="btn btn-default" id="suggest"',
+                                   '/button')
+
     def test_not_logged_in(self):
         self.client.logout()
         response = self.client.get(self.url)
@@ -654,6 +833,12 @@ class GameScheduleAjaxTest(ShadowConTestCase):
             self.assertEquals(get_start(game), game_data["start"])
             self.assertEquals(get_width(game.time_slot), game_data["width"])
 
+    def test_ajax_schedule_get_conflicts(self):
+        response = self.client.get(self.url)
+        json_data = json.loads(response.content)["content"]
+        games = [Game.objects.get(title="Down with the sun").id, Game.objects.get(title="Midnight Game").id]
+        self.assertEquals(json_data["conflicts"], [{"kind": "gm", "games": games}])
+
     @data(("Friday Night", -18), ("Friday MidniGHT", 6), ("Saturday day", 6), ("Saturday midnight", 30),
           ("Sunday Too early", 30), ("Unknown With Words", 100), ("Unknown", 100))
     @unpack
@@ -694,10 +879,36 @@ class GameScheduleAjaxTest(ShadowConTestCase):
     def test_get_width_none(self):
         self.assertEquals(get_width(None), 0)
 
-    @data(([1, 2, 3], 1, 0), ([1, 2, 3], 2, 1), ([1, 2, 3], 3, 2), ([1, 2, 3], 4, -1))
-    @unpack
-    def test_get_index(self, object_list, obj, expected):
-        self.assertEquals(get_index(obj, object_list), expected)
+    def add_games(self, count, scheduled=True):
+        user = User.objects.get(username="user")
+        blocks = list(TimeBlock.objects.all())
+        slots = list(TimeSlot.objects.all())
+        locations = list(Location.objects.all())
+        for i in range(count):
+            game = Game(title="Game %d" % i, gm="GM %d" % i, user=user, last_modified=timezone.now())
+            if scheduled:
+                game.time_block = blocks[i % len(blocks)]
+                game.time_slot = slots[i % len(slots)]
+                game.location = locations[i % len(locations)]
+            game.save()
+
+    def test_ajax_schedule_get_unscheduled_game(self):
+        self.add_games(1, scheduled=False)
+        game_data = filter(lambda x: x["title"] == "Game 0", get_schedule_data()["games"])[0]
+        self.assertEquals(game_data["location"], -1)
+        self.assertEquals(game_data["time_block"], -1)
+        self.assertEquals(game_data["time_slot"], -1)
+        self.assertEquals(game_data["start"], 100)
+        self.assertEquals(game_data["width"], 0)
+
+    def test_ajax_schedule_get_query_count(self):
+        with self.assertNumQueries(4):
+            get_schedule_data()
+
+        self.add_games(50)
+        expected = Game.objects.count()
+        with self.assertNumQueries(4):
+            self.assertEquals(len(get_schedule_data()["games"]), expected)
 
     @override_settings(DEBUG=True)
     def test_post_not_logged_in_debug(self):
@@ -814,3 +1025,232 @@ class GameScheduleAjaxTest(ShadowConTestCase):
         versions = reversion.get_for_object(game)
         self.assertEquals(len(versions), 1)
         self.assertEquals(versions[0].revision.comment, "AJAX Schedule Submission - %s Changed" % expected)
+
+
+@ddt
+class ConditionalGetTest(ShadowConTestCase):
+    def setUp(self):
+        self.client = Client(HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+
+    def get_etag(self, url):
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        return response["ETag"]
+
+    @data('convention:show_schedule', 'convention:games_list', 'convention:ajax_location_schedule_view')
+    def test_not_modified(self, name):
+        url = reverse(name)
+        etag = self.get_etag(url)
+        # the games, time blocks, time slots and locations
+        with self.assertNumQueries(4):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+
+    @data('convention:show_schedule', 'convention:games_list', 'convention:ajax_location_schedule_view')
+    def test_game_changed(self, name):
+        url = reverse(name)
+        etag = self.get_etag(url)
+        # every view and the admin record when they change a game
+        game = Game.objects.all()[0]
+        game.title = "A new title"
+        game.last_modified = timezone.now()
+        game.save()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @data('convention:show_schedule', 'convention:games_list', 'convention:ajax_location_schedule_view')
+    def test_time_block_changed(self, name):
+        url = reverse(name)
+        etag = self.get_etag(url)
+        block = TimeBlock.objects.all()[0]
+        block.text = "Friday Evening"
+        block.save()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @data('convention:show_schedule', 'convention:games_list', 'convention:ajax_location_schedule_view')
+    def test_changed_elsewhere(self, name):
+        # bulk updates send no signals, the same as a change made by another worker
+        url = reverse(name)
+        etag = self.get_etag(url)
+        TimeSlot.objects.filter(id=TimeSlot.objects.all()[0].id).update(start=1)
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.get_etag(url)
+        Location.objects.update(text="Somewhere else")
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @data('convention:show_schedule', 'convention:games_list')
+    def test_con_info_changed(self, name):
+        url = reverse(name)
+        etag = self.get_etag(url)
+        info = ConInfo.objects.all()[0]
+        info.location = "Somewhere else"
+        info.save()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @data('convention:show_schedule', 'convention:games_list')
+    def test_user_changed(self, name):
+        url = reverse(name)
+        etag = self.get_etag(url)
+        self.client.login(username="staff", password="123")
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_feed_same_for_users(self):
+        url = reverse('convention:ajax_location_schedule_view')
+        etag = self.get_etag(url)
+        self.client.login(username="staff", password="123")
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+@benchmark
+class ScheduleDataBenchmark(ShadowConTestCase):
+    def test_schedule_data(self):
+        user = User.objects.get(username="user")
+        blocks = list(TimeBlock.objects.all())
+        slots = list(TimeSlot.objects.all())
+        locations = list(Location.objects.all())
+
+        timings = []
+        for count in [100, 1000]:
+            Game.objects.bulk_create([Game(title="Game %d" % i, gm="GM", user=user, last_modified=timezone.now(),
+                                           time_block=blocks[i % len(blocks)], time_slot=slots[i % len(slots)],
+                                           location=locations[i % len(locations)], slug="game_%d_%d" % (count, i))
+                                      for i in range(count - Game.objects.count())])
+            timings.append(time_call(get_schedule_data, 10))
+            print("\nSchedule feed with %d games: %.2fms" % (count, timings[-1] * 1000))
+
+        # ten times the games should cost roughly ten times as much, not a hundred
+        self.assertLess(timings[1] / timings[0], 20)
+
+
+class ScheduleSaveTest(ShadowConTestCase):
+    url = reverse('convention:ajax_schedule_save')
+
+    def setUp(self):
+        self.client = Client(HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.client.login(username="staff", password="123")
+        self.games = list(Game.objects.order_by('id'))
+
+    def post(self, assignments):
+        response = self.client.post(self.url, {"games": json.dumps(assignments)})
+        return json.loads(response.content)
+
+    def assignment(self, game, location=None, time_block=None, time_slot=None):
+        return {"id": game.id, "location": location, "time_block": time_block, "time_slot": time_slot}
+
+    def current(self, game):
+        return self.assignment(game, game.location_id, game.time_block_id, game.time_slot_id)
+
+    def test_not_staff(self):
+        self.client.logout()
+        self.client.login(username="user", password="123")
+        json_data = self.post([self.assignment(self.games[0])])
+        self.assertEquals(json_data["status"], 500)
+        self.assertEquals(Game.objects.get(id=self.games[0].id).location, self.games[0].location)
+
+    def test_save(self):
+        modified_date = timezone.now()
+        changes = [self.assignment(self.games[0], 2, 4, 5), self.assignment(self.games[1])]
+        json_data = self.post(changes + [self.current(game) for game in self.games[2:]])
+
+        self.assertEquals(json_data["status"], 200)
+        self.assertEquals([x["id"] for x in json_data["content"]["saved"]], [self.games[0].id, self.games[1].id])
+        self.assertEquals(json_data["content"]["conflicts"], [])
+
+        game = Game.objects.get(id=self.games[0].id)
+        self.assertEquals(json_data["content"]["saved"][0]["version"], game.last_scheduled.isoformat())
+        self.assertEquals((game.location_id, game.time_block_id, game.time_slot_id), (2, 4, 5))
+        self.assertGreater(game.last_scheduled, modified_date)
+
+        game = Game.objects.get(id=self.games[1].id)
+        self.assertEquals((game.location, game.time_block, game.time_slot), (None, None, None))
+        self.assertGreater(game.last_scheduled, modified_date)
+
+        for original in self.games[2:]:
+            self.assertEquals(Game.objects.get(id=original.id).last_scheduled, original.last_scheduled)
+
+    def test_single_revision(self):
+        self.post([self.assignment(self.games[0], 2, 4, 5), self.assignment(self.games[1])])
+
+        versions = reversion.get_for_object(self.games[0])
+        self.assertEquals(len(versions), 1)
+        self.assertEquals(versions[0].revision, reversion.get_for_object(self.games[1])[0].revision)
+        self.assertEquals(versions[0].revision.comment,
+                          "AJAX Schedule Submission - %s: location, time_block, time_slot Changed; "
+                          "%s: location, time_block, time_slot Changed" % (self.games[0].title, self.games[1].title))
+
+    def test_nothing_changed(self):
+        json_data = self.post([self.current(game) for game in self.games])
+        self.assertEquals(json_data["content"], {"saved": [], "conflicts": []})
+        self.assertEquals(len(reversion.get_for_object(self.games[0])), 0)
+
+    def versioned(self, game, *args):
+        assignment = self.assignment(game, *args)
+        assignment["version"] = game.last_scheduled.isoformat() if game.last_scheduled else None
+        return assignment
+
+    def test_current_version(self):
+        json_data = self.post([self.versioned(self.games[0], 2, 4, 5)])
+        self.assertEquals([x["id"] for x in json_data["content"]["saved"]], [self.games[0].id])
+        self.assertEquals(json_data["content"]["conflicts"], [])
+
+        # the returned version is what the next save has to send
+        game = Game.objects.get(id=self.games[0].id)
+        assignment = self.assignment(game, 1, 4, 5)
+        assignment["version"] = json_data["content"]["saved"][0]["version"]
+        json_data = self.post([assignment])
+        self.assertEquals([x["id"] for x in json_data["content"]["saved"]], [self.games[0].id])
+        self.assertEquals(Game.objects.get(id=self.games[0].id).location_id, 1)
+
+    def test_stale_version(self):
+        stale = self.versioned(self.games[0], 2, 4, 5)
+        fresh = self.versioned(self.games[1], 3, 4, 5)
+
+        # someone else schedules the first game after it was loaded
+        self.post([self.assignment(self.games[0], 1, 3, 4)])
+        scheduled = Game.objects.get(id=self.games[0].id)
+
+        json_data = self.post([stale, fresh])
+        self.assertEquals(json_data["status"], 200)
+        self.assertEquals(json_data["content"]["conflicts"],
+                          [{"id": scheduled.id, "title": scheduled.title,
+                            "version": scheduled.last_scheduled.isoformat()}])
+        self.assertEquals([x["id"] for x in json_data["content"]["saved"]], [self.games[1].id])
+
+        game = Game.objects.get(id=self.games[0].id)
+        self.assertEquals((game.location_id, game.time_block_id, game.time_slot_id), (1, 3, 4))
+        self.assertEquals(game.last_scheduled, scheduled.last_scheduled)
+        self.assertEquals(Game.objects.get(id=self.games[1].id).location_id, 3)
+
+    def test_stale_version_not_in_revision(self):
+        stale = self.versioned(self.games[0], 2, 4, 5)
+        self.post([self.assignment(self.games[0], 1, 3, 4)])
+        self.post([stale, self.versioned(self.games[1], 3, 4, 5)])
+
+        self.assertEquals(len(reversion.get_for_object(self.games[0])), 1)
+        self.assertEquals(reversion.get_for_object(self.games[1])[0].revision.comment,
+                          "AJAX Schedule Submission - %s: location, time_block, time_slot Changed" %
+                          self.games[1].title)
+
+    def test_feed_version(self):
+        self.post([self.assignment(self.games[0], 2, 4, 5)])
+        game = Game.objects.get(id=self.games[0].id)
+
+        response = self.client.get(reverse('convention:ajax_location_schedule_view'))
+        games = dict((x["id"], x) for x in json.loads(response.content)["content"]["games"])
+        self.assertEquals(games[game.id]["version"], game.last_scheduled.isoformat())
+
+    def test_query_count(self):
+        # session, user and one in_bulk per model, with nothing to write, plus the transaction's savepoint
+        self.post([])
+        with self.assertNumQueries(2 + 4 + 2):
+            self.post([self.current(game) for game in self.games])
+
+    def test_invalid_game(self):
+        json_data = self.post([self.assignment(self.games[0], 2, 4, 5), {"id": 9999}])
+        self.assertEquals(json_data["status"], 500)
+        self.assertEquals(Game.objects.get(id=self.games[0].id).location, self.games[0].location)
+
+    def test_invalid_location(self):
+        json_data = self.post([self.assignment(self.games[1]), self.assignment(self.games[0], 9999, 3, 4)])
+        self.assertEquals(json_data["status"], 500)
+        self.assertEquals(Game.objects.get(id=self.games[1].id).location, self.games[1].location)
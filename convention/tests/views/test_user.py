@@ -1,12 +1,20 @@
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from convention.models import TimeBlock, Registration, PaymentOption, ConInfo, BlockRegistration, get_choice
-from shadowcon.tests.utils import ShadowConTestCase, data_func
+from convention.models import TimeBlock, Registration, PaymentOption, ConInfo, BlockRegistration, \
+    RegistrationCounter, get_choice
+from convention.admission import reconcile_admission
+from convention.reports import AttendanceExport
+from convention.summary import rebuild_summary
+from shadowcon.tests.utils import ShadowConTestCase, benchmark, data_func, time_call
 from ddt import ddt
 from datetime import timedelta
 from reversion import revisions as reversion
+from StringIO import StringIO
+import csv
 import os
 import json
 import pytz
@@ -357,6 +365,31 @@ class PaymentViewTest(ShadowConTestCase):
         self.assertSectionContains(response, "Registration Entry Not Found", "h2")
 
 
+def add_registrations(count):
+    payment = PaymentOption.objects.all()[0]
+    time_blocks = TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id')
+    last_user = User.objects.order_by('-id')[0].id
+    User.objects.bulk_create([User(username="attendee%d" % (last_user + i)) for i in range(count)])
+    users = User.objects.filter(id__gt=last_user)
+
+    # bulk_create skips the admission done by save, so number the registrations here
+    last = RegistrationCounter.lock(take=len(users)).last_sequence - len(users)
+    now = timezone.now()
+    Registration.objects.bulk_create([Registration(user=user, registration_date=now, last_updated=now,
+                                                   payment=payment, sequence=last + index + 1)
+                                      for index, user in enumerate(users)])
+    reconcile_admission()
+
+    BlockRegistration.objects.bulk_create([
+        BlockRegistration(time_block=block, registration=registration,
+                          attendance=BlockRegistration.ATTENDANCE_CHOICES[(registration.id + index) % 3][0])
+        for registration in Registration.objects.filter(user__in=users)
+        for index, block in enumerate(time_blocks)])
+
+    # it also skips the signals that keep the attendance summary
+    rebuild_summary()
+
+
 class AttendanceListTest(ShadowConTestCase):
     url = reverse('convention:attendance_list')
 
@@ -415,7 +448,7 @@ class AttendanceListTest(ShadowConTestCase):
         time_blocks = TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id')
         count = 0
         for block in time_blocks:
-            entry = BlockRegistration(time_block=block.text, registration=new_reg,
+            entry = BlockRegistration(time_block=block, registration=new_reg,
                                       attendance=BlockRegistration.ATTENDANCE_CHOICES[count % 3][0])
             entry.save()
             count += 1
@@ -460,7 +493,7 @@ class AttendanceListTest(ShadowConTestCase):
 
         count = 0
         for block in time_blocks:
-            entry = BlockRegistration(time_block=block.text, registration=new_reg,
+            entry = BlockRegistration(time_block=block, registration=new_reg,
                                       attendance=BlockRegistration.ATTENDANCE_CHOICES[count % 3][0])
             entry.save()
             count += 1
@@ -473,7 +506,7 @@ class AttendanceListTest(ShadowConTestCase):
 
         count = 0
         for block in time_blocks:
-            entry = BlockRegistration(time_block=block.text, registration=new_reg,
+            entry = BlockRegistration(time_block=block, registration=new_reg,
                                       attendance=BlockRegistration.ATTENDANCE_CHOICES[count % 3][0])
             entry.save()
             count += 1
@@ -524,7 +557,7 @@ class AttendanceListTest(ShadowConTestCase):
 
         count = 0
         for block in time_blocks:
-            entry = BlockRegistration(time_block=block.text, registration=new_reg,
+            entry = BlockRegistration(time_block=block, registration=new_reg,
                                       attendance=BlockRegistration.ATTENDANCE_CHOICES[count % 3][0])
             entry.save()
             count += 1
@@ -536,7 +569,7 @@ class AttendanceListTest(ShadowConTestCase):
         new_reg.save()
 
         for block in time_blocks:
-            entry = BlockRegistration(time_block=block.text, registration=new_reg,
+            entry = BlockRegistration(time_block=block, registration=new_reg,
                                       attendance=BlockRegistration.ATTENDANCE_CHOICES[1][0])
             entry.save()
 
@@ -587,7 +620,7 @@ class AttendanceListTest(ShadowConTestCase):
         time_blocks = TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id')
         count = 0
         for block in time_blocks:
-            entry = BlockRegistration(time_block=block.text, registration=new_reg,
+            entry = BlockRegistration(time_block=block, registration=new_reg,
                                       attendance=BlockRegistration.ATTENDANCE_CHOICES[count % 3][0])
             entry.save()
             count += 1
@@ -608,7 +641,7 @@ class AttendanceListTest(ShadowConTestCase):
         time_blocks = TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id')
         count = 0
         for block in time_blocks:
-            entry = BlockRegistration(time_block=block.text, registration=new_reg,
+            entry = BlockRegistration(time_block=block, registration=new_reg,
                                       attendance=BlockRegistration.ATTENDANCE_CHOICES[count % 3][0])
             entry.save()
             count += 1
@@ -628,3 +661,165 @@ class AttendanceListTest(ShadowConTestCase):
         self.assertSectionContains(response, "<tr><td>Adrian Barnes</td><td>Maybe</td><td>Yes</td><td>No</td>"
                                              "<td>Maybe</td><td>Yes</td><td>No</td><td>Maybe</td><td>Missing</td></tr>",
                                    self.details, "/table")
+
+    def count_queries(self):
+        # the first request also loads the con info
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_constant_queries(self):
+        add_registrations(2)
+        few = self.count_queries()
+        add_registrations(20)
+        self.assertEquals(self.count_queries(), few)
+
+    def test_totals_with_many(self):
+        add_registrations(30)
+        BlockRegistration.objects.filter(time_block__text="Friday Night").first().delete()
+
+        response = self.client.get(self.url)
+        friday_night = BlockRegistration.objects.filter(time_block__text="Friday Night")
+        self.assertSectionContains(response, "<tr><td>Yes</td><td>%d</td>" %
+                                   friday_night.filter(attendance=BlockRegistration.ATTENDANCE_YES).count(),
+                                   self.totals, "/table")
+        self.assertSectionContains(response, "<tr><td>Missing</td><td>1</td><td>0</td>", self.totals, "/table")
+        self.assertEquals(31, self.get_section(response, self.details, "/table").count("<tr>"))
+        self.assertEquals(34, self.get_section(response, self.contact_info, "/table").count("<tr>"))
+
+    def test_escaped(self):
+        User.objects.filter(username="admin").update(first_name="<b>Adrian</b>")
+        Registration(user=User.objects.get(username="admin"), registration_date=timezone.now(),
+                     last_updated=timezone.now(), payment=PaymentOption.objects.all()[0]).save()
+
+        response = self.client.get(self.url)
+        self.assertSectionContains(response, "<tr><td>&lt;b&gt;Adrian&lt;/b&gt; Barnes</td>", self.details, "/table")
+        self.assertSectionContains(response, "<tr><td>&lt;b&gt;Adrian&lt;/b&gt; Barnes</td>", self.contact_info,
+                                   "/table")
+
+
+@benchmark
+class AttendanceListBenchmark(ShadowConTestCase):
+    def test_attendance_list(self):
+        self.client.login(username="admin", password="123")
+        url = reverse('convention:attendance_list')
+        for count in [200, 2000]:
+            add_registrations(count - Registration.objects.count())
+            elapsed = time_call(lambda: self.client.get(url), 3)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEquals(response.status_code, 200)
+            print("\nAttendance list with %d registrations: %.2fms, %d queries" %
+                  (count, elapsed * 1000, len(context.captured_queries)))
+
+    def test_export(self):
+        self.client.login(username="staff", password="123")
+        url = reverse('convention:export_attendance')
+        for count in [200, 2000]:
+            add_registrations(count - Registration.objects.count())
+            elapsed = time_call(lambda: b"".join(self.client.get(url).streaming_content), 3)
+            print("\nAttendance export with %d registrations: %.2fms" % (count, elapsed * 1000))
+
+
+class ExportTest(ShadowConTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.client.login(username="staff", password="123")
+        Registration.objects.all().delete()
+
+    def get_rows(self, name, **params):
+        response = self.client.get(reverse('convention:export_%s' % name), params)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], "text/csv")
+        self.assertEquals(response['Content-Disposition'], 'attachment; filename="%s.csv"' % name)
+        self.assertTrue(response.streaming)
+        return list(csv.reader(StringIO(b"".join(response.streaming_content))))
+
+    def test_attendance(self):
+        add_registrations(2)
+        rows = self.get_rows("attendance")
+        self.assertEquals(rows[0], ["Name", "Username", "E-mail", "Friday Night", "Friday Midnight",
+                                    "Saturday Morning", "Saturday Afternoon", "Saturday Evening", "Saturday Midnight",
+                                    "Sunday Morning"])
+        self.assertEquals(len(rows), 3)
+
+        registration = Registration.objects.order_by('id')[0]
+        entries = BlockRegistration.objects.filter(registration=registration)
+        expected = [get_choice(entries.get(time_block__text=text).attendance, BlockRegistration.ATTENDANCE_CHOICES)
+                    for text in rows[0][3:]]
+        self.assertEquals(rows[1], [registration.user.username, registration.user.username, ""] + expected)
+
+    def test_attendance_missing(self):
+        add_registrations(1)
+        BlockRegistration.objects.filter(time_block__text="Sunday Morning").delete()
+        self.assertEquals(self.get_rows("attendance", columns="block_7")[1:], [["Missing"]])
+
+    def test_donations(self):
+        add_registrations(1)
+        Registration.objects.update(payment_received=True)
+        registration = Registration.objects.get()
+        rows = self.get_rows("donations", columns="username,payment,received")
+        self.assertEquals(rows, [["Username", "Donation Option", "Donation Received"],
+                                 [registration.user.username, registration.payment.name, "Yes"]])
+
+    def test_contact_info(self):
+        Registration(user=User.objects.get(username="admin"), registration_date=timezone.now(),
+                     last_updated=timezone.now(), payment=PaymentOption.objects.all()[0]).save()
+        rows = self.get_rows("contact_info")
+        self.assertEquals(rows, [["First Name", "Last Name", "Username", "E-mail", "Registered"],
+                                 ["Adrian", "Barnes", "admin", "admin-test@mg.shadowcon.net", "Yes"],
+                                 ["", "", "user", "user-test@mg.shadowcon.net", "No"],
+                                 ["", "", "staff", "staff-test@mg.shadowcon.net", "No"]])
+
+    def test_column_order(self):
+        rows = self.get_rows("contact_info", columns="email, username")
+        self.assertEquals(rows[0], ["E-mail", "Username"])
+        self.assertEquals(rows[1], ["admin-test@mg.shadowcon.net", "admin"])
+
+    def test_unknown_column(self):
+        response = self.client.get(reverse('convention:export_contact_info'), {"columns": "username,password"})
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.content, "Unknown column(s): password")
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+    def test_formula(self):
+        User.objects.filter(username="admin").update(first_name="=HYPERLINK(\"x\")")
+        rows = self.get_rows("contact_info", columns="first_name")
+        self.assertEquals(rows[1], ["'=HYPERLINK(\"x\")"])
+
+    def test_unicode(self):
+        User.objects.filter(username="admin").update(first_name=u"Ad\u00efan")
+        rows = self.get_rows("contact_info", columns="first_name")
+        self.assertEquals(rows[1], [u"Ad\u00efan".encode("utf-8")])
+
+    def test_batches(self):
+        add_registrations(7)
+        export = AttendanceExport()
+        export.batch_size = 3
+        with CaptureQueriesContext(connection) as context:
+            rows = list(csv.reader(export.stream()))
+        self.assertEquals([row[1] for row in rows[1:]],
+                          list(Registration.objects.order_by('id').values_list('user__username', flat=True)))
+
+        # registrations and their block registrations for each of the three batches, plus the final empty batch
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertEquals(len([sql for sql in queries if 'FROM "convention_registration"' in sql]), 3 + 1)
+        self.assertEquals(len([sql for sql in queries if 'FROM "convention_blockregistration"' in sql]), 3)
+
+    def test_not_staff(self):
+        self.client.logout()
+        self.client.login(username="user", password="123")
+        response = self.client.get(reverse('convention:export_contact_info'))
+        self.assertSectionContains(response, "Staff Permissions Required", "h2")
+
+    def test_not_logged_in(self):
+        self.client.logout()
+        response = self.client.get(reverse('convention:export_contact_info'))
+        self.assertEquals(response.status_code, 302)
+
+    def test_links(self):
+        response = self.client.get(reverse('convention:attendance_list'))
+        for name in ["attendance", "donations", "contact_info"]:
+            self.assertContains(response, 'href="%s"' % reverse('convention:export_%s' % name))
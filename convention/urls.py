@@ -5,14 +5,21 @@ from convention.views import games, user
 app_name = 'convention'
 urlpatterns = [
     url(r'^games/description/$', games.ListGameView.as_view(), name='games_list'),
+    url(r'^games/description/(?P<slug>[\w-]+)/$', games.GameDetailView.as_view(), name='game_detail'),
     url(r'^games/edit/(?P<pk>[0-9]+)/$', games.UpdateGameView.as_view(), name='edit_game'),
     url(r'^games/register/$', games.NewGameView.as_view(), name='submit_game'),
     url(r'^games/schedule/$', games.ScheduleView.as_view(), name='show_schedule'),
     url(r'^games/schedule/edit/$', games.ScheduleEditView.as_view(), name='edit_schedule'),
     url(r'^games/schedule/ajax/view/location/$', games.SchedulerHandler.as_view(), name='ajax_location_schedule_view'),
+    url(r'^games/schedule/ajax/save/$', games.ScheduleSaveHandler.as_view(), name='ajax_schedule_save'),
+    url(r'^games/schedule/ajax/suggest/$', games.ScheduleSuggestHandler.as_view(), name='ajax_schedule_suggest'),
     url(r'^user/attendance/$', user.AttendanceView.as_view(), name='register_attendance'),
     url(r'^user/payment/$', user.PaymentView.as_view(), name='payment'),
     url(r'^user/new/$', user.NewUserView.as_view(), name='new_user'),
     url(r'^user/profile/$', user.show_profile, name='user_profile'),
-    url(r'^attendance/list/$', user.AttendanceList.as_view(), name='attendance_list')
+    url(r'^attendance/list/$', user.AttendanceList.as_view(), name='attendance_list'),
+    url(r'^attendance/export/attendance/$', user.ExportView.as_view(export='attendance'), name='export_attendance'),
+    url(r'^attendance/export/donations/$', user.ExportView.as_view(export='donations'), name='export_donations'),
+    url(r'^attendance/export/contact_info/$', user.ExportView.as_view(export='contact_info'),
+        name='export_contact_info'),
 ]
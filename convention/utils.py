@@ -1,6 +1,45 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
 from django.utils import timezone
+from django.utils.functional import cached_property
+from reversion import revisions as reversion
+from reversion.models import Revision, Version
 
-from .models import ConInfo, Registration, BlockRegistration, TimeBlock, get_choice, Game
+from .models import ConInfo, Registration, BlockRegistration, TimeBlock, TimeSlot, Location, get_choice, Game
+from .summary import get_headcounts
+
+import hashlib
+import os
+import time
+
+CON_INFO_CACHE_KEY = "convention:con_info"
+HEADCOUNTS_CACHE_KEY = "convention:headcounts"
+
+# process wide snapshot, used unless settings.CON_INFO_CACHE names a shared cache, and the time it's reloaded by
+_con_info = None
+_con_info_expires = 0
+
+# the same for the headcounts staff see on every page
+_headcounts = None
+_headcounts_expires = 0
+
+# identifies the deployed code, so validators change when templates or static files do
+_site_version = None
+
+
+def save_revision(objects, user=None, comment=""):
+    """
+    Saves the objects as a single revision, the same as changing them inside reversion.create_revision(), but with
+    one query for all of their versions rather than one each.  Use it for objects written in bulk, which don't send
+    the signals create_revision() listens for.
+    """
+    revision = Revision.objects.create(user=user, comment=comment)
+    Version.objects.bulk_create([Version(revision=revision,
+                                         **reversion.get_adapter(obj.__class__).get_version_data(obj))
+                                 for obj in objects])
+    return revision
 
 
 def friendly_username(user):
@@ -11,7 +50,31 @@ def friendly_username(user):
     return name
 
 
-def get_con_value(parameter):
+class ConInfoSnapshot(object):
+    """
+    Read only copy of the single ConInfo row.  Instances are shared between requests, so they can't be modified.
+    """
+
+    def __init__(self, values):
+        object.__setattr__(self, "_values", values)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["_values"][name]
+        except KeyError:
+            raise AttributeError("'ConInfo' object has no attribute '%s'" % name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConInfo snapshot is read only")
+
+    def __delattr__(self, name):
+        raise AttributeError("ConInfo snapshot is read only")
+
+    def items(self):
+        return sorted(self.__dict__["_values"].items())
+
+
+def load_con_info():
     con_objects = ConInfo.objects.all()
     if len(con_objects) == 0:
         raise ValueError("No con object found")
@@ -19,7 +82,78 @@ def get_con_value(parameter):
         raise ValueError("Multiple con objects found")
 
     info = con_objects[0]
-    return getattr(info, parameter)
+    return dict((field.attname, getattr(info, field.attname)) for field in ConInfo._meta.concrete_fields)
+
+
+def get_con_info_cache():
+    alias = getattr(settings, "CON_INFO_CACHE", None)
+    if alias:
+        return caches[alias]
+    return None
+
+
+def get_con_info():
+    global _con_info, _con_info_expires
+
+    shared_cache = get_con_info_cache()
+    if shared_cache is not None:
+        values = shared_cache.get(CON_INFO_CACHE_KEY)
+        if values is None:
+            values = load_con_info()
+            shared_cache.set(CON_INFO_CACHE_KEY, values, None)
+        return ConInfoSnapshot(values)
+
+    # other workers' changes only reach this one's snapshot when it expires
+    now = time.time()
+    if _con_info is None or now >= _con_info_expires:
+        _con_info = ConInfoSnapshot(load_con_info())
+        _con_info_expires = now + getattr(settings, "CON_INFO_TIMEOUT", 30)
+    return _con_info
+
+
+def invalidate_con_info():
+    global _con_info
+    _con_info = None
+
+    shared_cache = get_con_info_cache()
+    if shared_cache is not None:
+        shared_cache.delete(CON_INFO_CACHE_KEY)
+
+
+def get_cached_headcounts():
+    """
+    The attendance headcounts, kept alongside the ConInfo snapshot so base.html reads at most one of them per request.
+    They're read again after HEADCOUNTS_TIMEOUT seconds, so staff may see counts that far behind.
+    """
+    global _headcounts, _headcounts_expires
+    timeout = getattr(settings, "HEADCOUNTS_TIMEOUT", 10)
+
+    shared_cache = get_con_info_cache()
+    if shared_cache is not None:
+        rows = shared_cache.get(HEADCOUNTS_CACHE_KEY)
+        if rows is None:
+            rows = get_headcounts()
+            shared_cache.set(HEADCOUNTS_CACHE_KEY, rows, timeout)
+        return rows
+
+    now = time.time()
+    if _headcounts is None or now >= _headcounts_expires:
+        _headcounts = get_headcounts()
+        _headcounts_expires = now + timeout
+    return _headcounts
+
+
+def invalidate_headcounts():
+    global _headcounts
+    _headcounts = None
+
+    shared_cache = get_con_info_cache()
+    if shared_cache is not None:
+        shared_cache.delete(HEADCOUNTS_CACHE_KEY)
+
+
+def get_con_value(parameter):
+    return getattr(get_con_info(), parameter)
 
 
 def is_registration_open():
@@ -29,25 +163,118 @@ def is_registration_open():
 
 def is_pre_reg_open(user):
     if user and user.id is not None:
-        return len(Game.objects.filter(user=user)) > 0
+        return Game.objects.filter(user=user).exists()
     else:
         return False
 
 
+class ConventionContext(object):
+    """
+    Convention state for a single request.  Each value is looked up the first time it's needed and then reused by
+    every template tag and view that asks for it.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+
+    @cached_property
+    def info(self):
+        return get_con_info()
+
+    @cached_property
+    def is_registration_open(self):
+        return self.info.registration_opens <= timezone.now()
+
+    @cached_property
+    def is_pre_reg_open(self):
+        return is_pre_reg_open(self.user)
+
+    @cached_property
+    def headcounts(self):
+        user = self.user
+        if user is not None and (user.is_staff or user.is_superuser) and user.is_active:
+            return get_cached_headcounts()
+        return []
+
+
+def get_convention_context(request):
+    if not hasattr(request, "convention"):
+        request.convention = ConventionContext(getattr(request, "user", None))
+    return request.convention
+
+
+def get_schedule_fingerprint():
+    """
+    Identifies everything the schedule pages show, read from the database so every worker agrees: the game count and
+    timestamps, and the rows of the small time block, time slot and location tables, which have no timestamps
+    """
+    games = Game.objects.aggregate(count=Count('id'), modified=Max('last_modified'), scheduled=Max('last_scheduled'))
+    return (games['count'], games['modified'], games['scheduled'],
+            list(TimeBlock.objects.order_by('id').values_list('id', 'text', 'sort_id')),
+            list(TimeSlot.objects.order_by('id').values_list('id', 'start', 'stop')),
+            list(Location.objects.order_by('id').values_list('id', 'text')))
+
+
+def get_file_version():
+    """
+    A digest of the names and modification times of every template and static file, which is the same in every
+    worker running the same code
+    """
+    roots = list(settings.STATICFILES_DIRS)
+    for engine in settings.TEMPLATES:
+        roots.extend(engine.get('DIRS', []))
+    for app in apps.get_app_configs():
+        roots.extend(os.path.join(app.path, folder) for folder in ('templates', 'static'))
+
+    files = []
+    for root in roots:
+        for path, folders, names in os.walk(root):
+            files.extend((os.path.join(path, name), os.path.getmtime(os.path.join(path, name))) for name in names)
+    return hashlib.md5(repr(sorted(files))).hexdigest()
+
+
+def get_site_version():
+    global _site_version
+    if _site_version is None:
+        _site_version = getattr(settings, "SITE_VERSION", None) or get_file_version()
+    return _site_version
+
+
+def get_etag(*parts):
+    return hashlib.md5(repr((get_site_version(),) + parts)).hexdigest()
+
+
+def get_response_etag(request, *parts):
+    """
+    Builds an ETag for a page from the given parts plus everything base.html shows for this user
+    """
+    convention = get_convention_context(request)
+    user = convention.user
+    if user is not None and user.is_authenticated():
+        user_state = (user.pk, user.is_active, user.is_staff, user.is_superuser)
+    else:
+        user_state = None
+
+    headcounts = [(row.time_block_id, row.time_block.text, row.yes, row.maybe) for row in convention.headcounts]
+    return get_etag(request.get_full_path(), user_state, convention.info.items(), convention.is_registration_open,
+                    convention.is_pre_reg_open, headcounts, *parts)
+
+
 def get_registration(user):
     registration = []
 
     registration_object = Registration.objects.filter(user=user)
     if registration_object:
         item_dict = {}
-        for item in BlockRegistration.objects.filter(registration=registration_object):
-            item_dict[item.time_block] = item
+        for item in BlockRegistration.objects.filter(registration=registration_object).select_related('time_block') \
+                .order_by('time_block__sort_id'):
+            item_dict[item.time_block_id] = item
             if item.attendance != BlockRegistration.ATTENDANCE_NO:
-                registration.append("%s: %s" % (item.time_block, get_choice(item.attendance,
-                                                                            BlockRegistration.ATTENDANCE_CHOICES)))
+                registration.append("%s: %s" % (item.time_block.text,
+                                                get_choice(item.attendance, BlockRegistration.ATTENDANCE_CHOICES)))
 
         for time_block in TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id'):
-            if time_block.text not in item_dict:
+            if time_block.id not in item_dict:
                 registration.append("<b>Partially Registered: Please re-register</b>")
                 break
     else:
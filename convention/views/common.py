@@ -1,14 +1,16 @@
 from django.contrib.auth.mixins import AccessMixin
 from django.shortcuts import render
+from django.views.decorators.http import condition
 from reversion import revisions as reversion
 
+from ..admission import is_con_full
 from ..models import Registration
-from ..utils import is_registration_open, get_con_value
+from ..utils import get_convention_context
 
 
 class RegistrationOpenMixin(AccessMixin):
     def dispatch(self, request, *args, **kwargs):
-        if not is_registration_open():
+        if not get_convention_context(request).is_registration_open:
             return render(request, 'convention/registration_not_open.html', {})
         return super(RegistrationOpenMixin, self).dispatch(request, args, kwargs)
 
@@ -20,25 +22,33 @@ class IsStaffMixin(AccessMixin):
         return super(IsStaffMixin, self).dispatch(request, args, kwargs)
 
 
-def is_on_wait_list(entries, request):
-    found = False
-    for i in range(0, len(entries)):
-        entry = entries[i]
-        if request.user == entry.user:
-            found = True
-            if i >= get_con_value('max_attendees'):
-                return True
-            break
-    if not found:
+class ConditionalGetMixin(object):
+    """
+    Answers GET requests whose If-None-Match matches get_etag with a 304 before the view does any real work
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        view = super(ConditionalGetMixin, self).dispatch
+        if request.method in ('GET', 'HEAD'):
+            view = condition(etag_func=self.get_etag)(view)
+        return view(request, *args, **kwargs)
+
+
+def is_on_wait_list(user):
+    status = Registration.objects.filter(user=user).values_list('status', flat=True).first()
+    if status is None:
         raise ValueError('User registration not found')
 
-    return False
+    return status == Registration.STATUS_WAIT_LISTED
 
 
 class NotOnWaitingListMixin(AccessMixin):
     def dispatch(self, request, *args, **kwargs):
         try:
-            if is_on_wait_list(Registration.objects.order_by('registration_date'), request):
+            if is_on_wait_list(request.user):
                 return render(request, 'convention/registration_wait_list.html', {})
         except ValueError:
             return render(request, 'convention/registration_not_found.html', {})
@@ -48,15 +58,14 @@ class NotOnWaitingListMixin(AccessMixin):
 
 class ConHasSpaceOrAlreadyRegisteredMixin(AccessMixin):
     def dispatch(self, request, *args, **kwargs):
-        entries = Registration.objects.order_by('registration_date')
-        if len(entries) >= get_con_value('max_attendees'):
+        if is_con_full():
             try:
-                if is_on_wait_list(entries, request):
+                if is_on_wait_list(request.user):
                     return render(request, 'convention/game_submission_wait_list.html',
-                                  {"is_registration_open": is_registration_open()})
+                                  {"is_registration_open": get_convention_context(request).is_registration_open})
             except ValueError:
                 return render(request, 'convention/game_submission_con_full.html',
-                              {"is_registration_open": is_registration_open()})
+                              {"is_registration_open": get_convention_context(request).is_registration_open})
 
         return super(ConHasSpaceOrAlreadyRegisteredMixin, self).dispatch(request, args, kwargs)
 
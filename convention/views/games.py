@@ -1,38 +1,93 @@
 from django_ajax.mixin import AJAXMixin
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.shortcuts import render
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.views import generic
 from reversion import revisions as reversion
 
 from collections import OrderedDict
+import json
 
 from ..models import Game, Location, TimeBlock, TimeSlot
-from ..utils import friendly_username
-from .common import ConHasSpaceOrAlreadyRegisteredMixin, IsStaffMixin, RevisionMixin
+from ..scheduling import UNSCHEDULED, ScheduledGame, find_conflicts, get_block_offset, get_width
+from ..solver import get_schedule_solver
+from ..utils import friendly_username, get_etag, get_response_etag, get_schedule_fingerprint
+from .common import ConditionalGetMixin, ConHasSpaceOrAlreadyRegisteredMixin, IsStaffMixin, RevisionMixin
 from contact.utils import mail_list
 
 game_fields = ['title', 'gm', 'game_length', 'number_players', 'system', 'triggers', 'preferred_time',
                'special_requests', 'description']
 
 
+# seconds a game's rendered entry on the descriptions page is kept
+GAME_FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+SCHEDULE_GROUPS_KEY = "convention:schedule_groups:%s"
+SCHEDULE_GROUPS_TIMEOUT = 24 * 60 * 60
+
+
 def get_games():
     return Game.objects.order_by('time_block', 'time_slot', 'title')
 
 
-class ScheduleView(generic.ListView):
+def load_schedule_groups():
+    """
+    The games in schedule order, grouped by time block name, read with one query.  The time shown is worked out once
+    for each block and slot pair instead of once per game.
+    """
+    times = {}
+    groups = OrderedDict()
+    for game in get_games().values('title', 'slug', 'number_players', 'gm', 'time_block', 'time_block__text',
+                                   'time_slot', 'time_slot__start', 'time_slot__stop'):
+        key = (game['time_block'], game['time_slot'])
+        if key not in times:
+            block_name = combined_time = "Not Scheduled"
+            if game['time_block'] is not None:
+                block = TimeBlock(text=game['time_block__text'])
+                block_name = block.text
+                if game['time_slot'] is not None:
+                    combined_time = block.get_combined(TimeSlot(start=game['time_slot__start'],
+                                                                stop=game['time_slot__stop']))
+            times[key] = (block_name, combined_time)
+
+        block_name, combined_time = times[key]
+        groups.setdefault(block_name, []).append({'title': game['title'],
+                                                  'slug': game['slug'],
+                                                  'combined_time': combined_time,
+                                                  'number_players': game['number_players'],
+                                                  'gm': game['gm'],
+                                                  })
+    return groups.items()
+
+
+def get_schedule_groups(fingerprint):
+    """
+    The schedule groups, cached as a whole until a game, block, slot or location changes
+    """
+    key = SCHEDULE_GROUPS_KEY % get_etag("schedule groups", fingerprint)
+    groups = cache.get(key)
+    if groups is None:
+        groups = load_schedule_groups()
+        cache.set(key, groups, SCHEDULE_GROUPS_TIMEOUT)
+    return groups
+
+
+class ScheduleView(ConditionalGetMixin, generic.ListView):
     template_name = 'convention/game_schedule_view.html'
 
-    def get_queryset(self):
-        game_map = OrderedDict()
-        for game in get_games():
-            time_block = game.friendly_block()
-            if time_block not in game_map:
-                game_map[time_block] = []
-            game_map[time_block].append(game)
+    @cached_property
+    def fingerprint(self):
+        return get_schedule_fingerprint()
 
-        return game_map
+    def get_etag(self, request, *args, **kwargs):
+        return get_response_etag(request, "schedule", self.fingerprint)
+
+    def get_queryset(self):
+        return get_schedule_groups(self.fingerprint)
 
 
 class ScheduleEditView(LoginRequiredMixin, IsStaffMixin, generic.TemplateView):
@@ -62,12 +117,14 @@ class NewGameView(LoginRequiredMixin, ConHasSpaceOrAlreadyRegisteredMixin, gener
         form.instance.user = self.request.user
         form.instance.last_modified = timezone.now()
 
-        with reversion.create_revision():
-            reversion.set_user(self.request.user)
-            reversion.set_comment("Form Submission - New")
+        # the e-mail is queued in the same transaction as the game, so neither is saved without the other
+        with transaction.atomic():
+            with reversion.create_revision():
+                reversion.set_user(self.request.user)
+                reversion.set_comment("Form Submission - New")
 
-            result = super(NewGameView, self).form_valid(form)
-        self.send_email()
+                result = super(NewGameView, self).form_valid(form)
+            self.send_email()
         return result
 
 
@@ -95,82 +152,113 @@ class UpdateGameView(LoginRequiredMixin, ConHasSpaceOrAlreadyRegisteredMixin, Re
             return render(request, 'convention/not_game_owner.html', {})
 
 
-class ListGameView(generic.ListView):
+class ListGameView(ConditionalGetMixin, generic.ListView):
     model = Game
 
+    def get_etag(self, request, *args, **kwargs):
+        return get_response_etag(request, "games", get_schedule_fingerprint())
+
     def get_queryset(self):
-        return get_games()
+        return get_games().select_related('time_block', 'time_slot')
 
+    def get_context_data(self, **kwargs):
+        context = super(ListGameView, self).get_context_data(**kwargs)
+        context['fragment_timeout'] = GAME_FRAGMENT_TIMEOUT
+        return context
 
-offsets = {u'friday': -18,
-           u'saturday': 6,
-           u'sunday': 30,
-           }
 
+class GameDetailView(ConditionalGetMixin, generic.DetailView):
+    model = Game
+    context_object_name = 'game'
+
+    def get_etag(self, request, *args, **kwargs):
+        return get_response_etag(request, "game", kwargs.get('slug'), get_schedule_fingerprint())
+
+    def get_queryset(self):
+        return Game.objects.select_related('time_block', 'time_slot')
 
-def get_block_offset(time_block):
-    offset = offsets.get(unicode(time_block.first_word().lower()), 100)
-    if time_block.has_second_word() and "midnight" == time_block.second_word().lower():
-        offset += 24
-    return offset
 
+def index_by_id(objects):
+    return dict((obj.id, index) for index, obj in enumerate(objects))
 
-def get_start(game):
-    if game.time_block and game.time_slot:
-        return get_block_offset(game.time_block) + game.time_slot.start
-    else:
-        return 100
 
+def schedule_version(last_scheduled):
+    return last_scheduled.isoformat() if last_scheduled else None
 
-def get_width(time_slot):
-    if time_slot:
-        width = time_slot.stop - time_slot.start
-        if width < 0:
-            width += 24
-        return width
-    else:
-        return 0
 
+def get_schedule_data():
+    """
+    Builds the schedule feed with one query per table.  Games reference locations, blocks and slots by their
+    position in the corresponding lists, or -1 when not set.  Each game's version is sent back when saving, so
+    changes made by someone else in the meantime aren't overwritten.
+    """
+    locations = list(Location.objects.all())
+    blocks = list(TimeBlock.objects.all().order_by('sort_id'))
+    slots = list(TimeSlot.objects.all().order_by('start'))
+
+    location_index = index_by_id(locations)
+    block_index = index_by_id(blocks)
+    slot_index = index_by_id(slots)
+    block_offsets = dict((block.id, get_block_offset(block)) for block in blocks)
+    slot_lookup = dict((slot.id, slot) for slot in slots)
+
+    games = []
+    entries = []
+    for game in Game.objects.values('id', 'title', 'gm', 'location', 'time_block', 'time_slot', 'preferred_time',
+                                    'special_requests', 'last_scheduled', 'user'):
+        time_slot = slot_lookup.get(game['time_slot'])
+        if game['time_block'] is not None and time_slot is not None:
+            start = block_offsets[game['time_block']] + time_slot.start
+        else:
+            start = UNSCHEDULED
 
-def get_index(obj, object_list):
-    if object_list.count(obj):
-        return object_list.index(obj)
-    else:
-        return -1
+        games.append({"title": game['title'],
+                      "id": game['id'],
+                      "gm": game['gm'],
+                      "location": location_index.get(game['location'], -1),
+                      "time_block": block_index.get(game['time_block'], -1),
+                      "time_slot": slot_index.get(game['time_slot'], -1),
+                      "preferred_time": game['preferred_time'],
+                      "special_requests": game['special_requests'],
+                      "start": start,
+                      "width": get_width(time_slot),
+                      "version": schedule_version(game['last_scheduled']),
+                      })
+        entries.append(ScheduledGame(game['id'], game['title'], game['location'], game['user'], start,
+                                     get_width(time_slot)))
 
+    return {"locations": map(lambda x: {"text": x.text, "id": x.id}, locations),
+            "games": games,
+            "blocks": map(lambda x: {"text": x.text, "id": x.id, "offset": get_block_offset(x)}, blocks),
+            "slots": map(lambda x: {"text": str(x), "id": x.id, "start": x.start, "width": get_width(x)}, slots),
+            "conflicts": map(lambda x: {"kind": x.kind, "games": [entry.id for entry in x.games]},
+                             find_conflicts(entries)),
+            }
+
+
+schedule_keys = [('location', Location), ('time_block', TimeBlock), ('time_slot', TimeSlot)]
+
+
+def check_staff(request):
+    if not request.user.is_authenticated():
+        raise Exception("Not logged in!  Only staff have access to this function")
+
+    if not request.user.is_staff and not request.user.is_superuser:
+        raise Exception("Only staff have access to this function")
+
+
+class SchedulerHandler(ConditionalGetMixin, AJAXMixin, generic.base.View):
+    def get_etag(self, request, *args, **kwargs):
+        # the feed is the same for everyone, so only the schedule itself matters
+        return get_etag("schedule feed", get_schedule_fingerprint())
 
-class SchedulerHandler(AJAXMixin, generic.base.View):
     def get(self, request, *args, **kwargs):
-        locations = map(lambda x: x, Location.objects.all())
-        blocks = map(lambda x: x, TimeBlock.objects.all().order_by('sort_id'))
-        slots = map(lambda x: x, TimeSlot.objects.all().order_by('start'))
-        games = Game.objects.all()
-
-        return {"locations": map(lambda x: {"text": x.text, "id": x.id}, locations),
-                "games": map(lambda x: {"title": x.title,
-                                        "id": x.id,
-                                        "gm": x.gm,
-                                        "location": get_index(x.location, locations),
-                                        "time_block": get_index(x.time_block, blocks),
-                                        "time_slot": get_index(x.time_slot, slots),
-                                        "preferred_time": x.preferred_time,
-                                        "special_requests": x.special_requests,
-                                        "start": get_start(x),
-                                        "width": get_width(x.time_slot),
-                                        },
-                             games),
-                "blocks": map(lambda x: {"text": x.text, "id": x.id, "offset": get_block_offset(x)}, blocks),
-                "slots": map(lambda x: {"text": str(x), "id": x.id, "start": x.start, "width": get_width(x)}, slots),
-                }
+        return get_schedule_data()
 
     def post(self, request, *args, **kwargs):
-        if not request.user.is_authenticated():
-            raise Exception("Not logged in!  Only staff have access to this function")
+        check_staff(request)
 
-        if not request.user.is_staff and not request.user.is_superuser:
-            raise Exception("Only staff have access to this function")
-
-        keys = [('location', Location), ('time_block', TimeBlock), ('time_slot', TimeSlot)]
+        keys = schedule_keys
         key_text = 0
         key_db_object = 1
 
@@ -196,3 +284,90 @@ class SchedulerHandler(AJAXMixin, generic.base.View):
             reversion.set_comment("AJAX Schedule Submission - %s Changed" % ", ".join(changed))
 
             game.save()
+
+
+class ScheduleSaveHandler(AJAXMixin, generic.base.View):
+    """
+    Saves the assignments of many games at once.  The games field holds a JSON list of objects with the game id, the
+    location, time_block and time_slot ids, where null clears the assignment, and the version the editor loaded.
+    Games scheduled by someone else since that version are left alone and reported as conflicts.
+    """
+
+    def post(self, request, *args, **kwargs):
+        check_staff(request)
+
+        assignments = json.loads(request.POST.get('games', '[]'))
+
+        lookups = {}
+        for key, model in schedule_keys:
+            lookups[key] = model.objects.in_bulk([x[key] for x in assignments if x.get(key) is not None])
+
+        with transaction.atomic():
+            games = Game.objects.select_for_update().in_bulk([x['id'] for x in assignments])
+
+            # validate everything before writing anything
+            updates = []
+            conflicts = []
+            for assignment in assignments:
+                game = games.get(assignment['id'])
+                if game is None:
+                    raise ValueError("Game %s does not exist" % assignment['id'])
+
+                values = {}
+                for key, model in schedule_keys:
+                    incoming_id = assignment.get(key)
+                    if incoming_id is not None and incoming_id not in lookups[key]:
+                        raise ValueError("%s %s does not exist" % (model.__name__, incoming_id))
+                    values[key] = lookups[key].get(incoming_id)
+
+                version = schedule_version(game.last_scheduled)
+                if 'version' in assignment and assignment['version'] != version:
+                    conflicts.append({"id": game.id, "title": game.title, "version": version})
+                    continue
+
+                changed = []
+                for key, value in values.iteritems():
+                    if getattr(game, key + "_id") != (value.id if value else None):
+                        changed.append(key)
+
+                if changed:
+                    changed.sort()
+                    updates.append((game, values, changed))
+
+            if updates:
+                now = timezone.now()
+                with reversion.create_revision():
+                    reversion.set_user(request.user)
+                    reversion.set_comment("AJAX Schedule Submission - %s" % "; ".join(
+                        "%s: %s Changed" % (game.title, ", ".join(changed)) for game, values, changed in updates))
+
+                    for game, values, changed in updates:
+                        for key, value in values.iteritems():
+                            setattr(game, key, value)
+                        game.last_scheduled = now
+                        game.save()
+
+        saved = [{"id": game.id, "version": schedule_version(game.last_scheduled)}
+                 for game, values, changed in sorted(updates, key=lambda x: x[0].id)]
+        return {"saved": saved, "conflicts": sorted(conflicts, key=lambda x: x["id"])}
+
+
+class ScheduleSuggestHandler(AJAXMixin, generic.base.View):
+    """
+    Proposes placements for the games that aren't fully scheduled.  Nothing is saved; the editor applies the
+    proposals to its copy of the schedule so staff can adjust them before saving.
+    """
+
+    def get(self, request, *args, **kwargs):
+        check_staff(request)
+
+        solver = get_schedule_solver(time_limit=5)
+        proposals = []
+        for proposal in solver.solve():
+            if proposal.time_block is not None:
+                proposals.append({"id": proposal.game.id,
+                                  "location": proposal.location.id,
+                                  "time_block": proposal.time_block.id,
+                                  "time_slot": proposal.time_slot.id})
+
+        return {"proposals": proposals, "conflicts": solver.conflict_count()}
@@ -1,15 +1,18 @@
 from django.core.urlresolvers import reverse
-from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import AccessMixin, LoginRequiredMixin
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.views.generic.edit import FormView, UpdateView
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 from registration.backends.hmac.views import RegistrationView as BaseRegistrationView
 
+import itertools
+
 from ..forms import NewUserForm, AttendanceForm
-from ..models import Registration, PaymentOption, BlockRegistration, TimeBlock, get_choice, Referral
-from ..utils import friendly_username, is_registration_open, is_pre_reg_open
+from ..models import Registration, PaymentOption, Referral
+from ..reports import AttendanceReport, exports
+from ..utils import friendly_username, get_convention_context
 from .common import RegistrationOpenMixin, NotOnWaitingListMixin, IsStaffMixin
 
 
@@ -18,16 +21,20 @@ def show_profile(request):
     registration = Registration.objects.filter(user=request.user)
     payment = None
     payment_received = None
+    wait_list_position = None
 
     if registration:
         payment = registration[0].payment
         payment_received = registration[0].payment_received
+        wait_list_position = registration[0].wait_list_position()
 
+    convention = get_convention_context(request)
     context = {'name': friendly_username(request.user),
-               'is_registration_open': is_registration_open(),
-               'is_pre_reg_open': is_pre_reg_open(request.user),
+               'is_registration_open': convention.is_registration_open,
+               'is_pre_reg_open': convention.is_pre_reg_open,
                'payment': payment,
                'payment_received': payment_received,
+               'wait_list_position': wait_list_position,
                }
     return render(request, 'convention/user_profile.html', context)
 
@@ -49,75 +56,37 @@ class AttendanceView(RegistrationOpenMixin, LoginRequiredMixin, FormView):
         return reverse('convention:payment')
 
 
-def registration_count(time_block, attendance):
-    return str(len(BlockRegistration.objects.filter(time_block=time_block.text).filter(attendance__exact=attendance)))
-
-
-def missing_count(time_block):
-    return str(len(Registration.objects.all()) - len(BlockRegistration.objects.filter(time_block=time_block.text)))
-
-
 class AttendanceList(LoginRequiredMixin, IsStaffMixin, TemplateView):
     template_name = 'convention/attendance_list.html'
 
     def get_context_data(self, **kwargs):
-        time_blocks = TimeBlock.objects.exclude(text__startswith='Not').order_by('sort_id')
-
-        header = "<th></th>"
-        yes = "<td>" + get_choice(BlockRegistration.ATTENDANCE_YES, BlockRegistration.ATTENDANCE_CHOICES) + "</td>"
-        maybe = "<td>" + get_choice(BlockRegistration.ATTENDANCE_MAYBE, BlockRegistration.ATTENDANCE_CHOICES) + "</td>"
-        no = "<td>" + get_choice(BlockRegistration.ATTENDANCE_NO, BlockRegistration.ATTENDANCE_CHOICES) + "</td>"
-        missing = "<td>Missing</td>"
-
-        if 'totals' not in kwargs:
-            for block in time_blocks:
-                header += "<th>" + block.text + "</th>"
-                yes += "<td>" + registration_count(block, BlockRegistration.ATTENDANCE_YES) + "</td>"
-                maybe += "<td>" + registration_count(block, BlockRegistration.ATTENDANCE_MAYBE) + "</td>"
-                no += "<td>" + registration_count(block, BlockRegistration.ATTENDANCE_NO) + "</td>"
-                missing += "<td>" + missing_count(block) + "</td>"
-            kwargs['totals'] = "\n  <tr>" + header + "</tr>\n  <tr>" + yes + "</tr>\n  <tr>" + maybe + \
-                               "</tr>\n  <tr>" + no + "</tr>\n  <tr>" + missing + "</tr>\n"
-
-        if 'details' not in kwargs:
-            details = "\n  <tr>" + header + "</tr>"
-            for entry in Registration.objects.all():
-                details += "\n  <tr><td>" + friendly_username(entry.user) + "</td>"
-                reg_entries = {}
-                for reg in BlockRegistration.objects.filter(registration=entry):
-                    reg_entries[reg.time_block] = reg.attendance
-
-                for block in time_blocks:
-                    if block.text in reg_entries:
-                        details += "<td>" + get_choice(reg_entries[block.text],
-                                                       BlockRegistration.ATTENDANCE_CHOICES) + "</td>"
-                    else:
-                        details += "<td>Missing</td>"
-
-                details += "</tr>"
-            kwargs['details'] = details + "\n"
-
-        if 'payments' not in kwargs:
-            payments = "\n  <tr><th></th><th>Donation Option</th><th>Donation Received</th></tr>"
-            for entry in Registration.objects.all():
-                received = "Yes" if entry.payment_received else "No"
-                payments += "\n  <tr><td>" + friendly_username(entry.user) + "</td>" + "<td>" + entry.payment.name + \
-                            "</td>" + "<td>" + received + "</td></tr>"
-            kwargs['payments'] = payments + "\n"
-
-        if 'contact_info' not in kwargs:
-            contact_info = "\n  <tr><th>Name</th><th>Username</th><th>E-mail</th><th>Registered</th></tr>"
-            for entry in User.objects.all():
-                registered = "No"
-                if Registration.objects.filter(user=entry):
-                    registered = "Yes"
-                contact_info += "\n  <tr><td>" + entry.first_name + " " + entry.last_name + "</td><td>" + \
-                                entry.username + "</td><td>" + entry.email + "</td><td>" + registered + "</td></tr>"
-            kwargs['contact_info'] = contact_info + "\n"
-
+        if 'report' not in kwargs:
+            kwargs['report'] = AttendanceReport()
         return super(AttendanceList, self).get_context_data(**kwargs)
 
 
+class ExportView(LoginRequiredMixin, IsStaffMixin, View):
+    """
+    Streams one of the attendance exports as CSV.  The optional columns parameter holds a comma separated list of
+    column keys to include.
+    """
+    export = None
+
+    def get(self, request, *args, **kwargs):
+        export = exports[self.export]()
+        keys = [key.strip() for key in request.GET.get('columns', '').split(",") if key.strip()]
+        try:
+            rows = export.stream(keys)
+            header = next(rows)
+        except ValueError as e:
+            # the message repeats the keys asked for, so it must not be read as HTML
+            return HttpResponseBadRequest(e.message, content_type="text/plain")
+
+        response = StreamingHttpResponse(itertools.chain([header], rows), content_type="text/csv")
+        response['Content-Disposition'] = 'attachment; filename="%s"' % export.filename
+        return response
+
+
 class NewUserView(BaseRegistrationView):
     form_class = NewUserForm
 
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from page.models import Page
+from page.utils import get_page_html, get_tag_expander
+
+
+class Command(BaseCommand):
+    help = "Expands the tags of every page and stores the result in the page cache.  Only useful when the " \
+           "default cache is shared with the web workers."
+
+    def handle(self, *args, **options):
+        count = 0
+        expander = get_tag_expander()
+        for page in Page.objects.all():
+            get_page_html(page, expander)
+            count += 1
+
+        self.stdout.write("Cached %d page(s)" % count)
@@ -1,15 +1,22 @@
+from convention.models import ConInfo, Trigger
 from ddt import ddt, data
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.template import Template, Context
 from django.test import Client
+from django.utils.six import StringIO
 from reversion import revisions as reversion
 from reversion_compare.admin import CompareVersionAdmin
-from shadowcon.tests.utils import ShadowConTestCase
+from shadowcon.tests.utils import ShadowConTestCase, benchmark, time_call
 
 import json
 import os
+import re
 
 from .admin import PageAdmin, TagAdmin
 from .models import Page, Tag
+from .utils import replace_tags, tag_pattern, get_page_html, get_page_version, get_tag_expander, PAGE_HTML_KEY
 
 
 class PageTest(ShadowConTestCase):
@@ -101,6 +108,159 @@ class PageTest(ShadowConTestCase):
         Tag(tag="c", content="789").save()
         self.run_tag_test("123 456 789")
 
+    def test_similar_tags(self):
+        Tag(tag="a", content="123").save()
+        Tag(tag="ab", content="456").save()
+        self.assertEquals(replace_tags("{{a}} {{ab}} {{ a }} {{abc}}"), "123 456 123 {{abc}}")
+
+    def test_repeated_tag(self):
+        Tag(tag="a", content="123").save()
+        self.run_tag_test("123 {{b}} {{c}}")
+        self.assertEquals(replace_tags("{{a}}{{a}}{ {a} }"), "123123123")
+
+    def test_tag_content_not_treated_as_replacement(self):
+        Tag(tag="a", content="\\1 \\g<0>").save()
+        self.run_tag_test("\\1 \\g<0> {{b}} {{c}}")
+
+    def test_tag_template_rendered(self):
+        Tag(tag="a", content="{% load con_info %}{% con_year %}").save()
+        self.run_tag_test("2016 {{b}} {{c}}")
+
+    def test_tag_change(self):
+        tag = Tag(tag="a", content="123")
+        tag.save()
+        self.run_tag_test("123 {{b}} {{c}}")
+        tag.content = "456"
+        tag.save()
+        self.run_tag_test("456 {{b}} {{c}}")
+
+    def test_tag_delete(self):
+        tag = Tag(tag="a", content="123")
+        tag.save()
+        self.run_tag_test("123 {{b}} {{c}}")
+        tag.delete()
+        self.run_tag_test("{{a}} {{b}} {{c}}")
+
+    def test_tags_not_recompiled(self):
+        Tag(tag="a", content="123").save()
+        replace_tags("{{a}}")
+        expander = get_tag_expander()
+        with self.assertNumQueries(1):
+            self.assertEquals(replace_tags("{{a}} {{b}}"), "123 {{b}}")
+        self.assertIs(get_tag_expander(), expander)
+
+    def test_page_html_cached(self):
+        Tag(tag="a", content="123").save()
+        self.run_tag_test("123 {{b}} {{c}}")
+        page = Page.objects.get(url="tag_test")
+        self.assertEquals(cache.get(PAGE_HTML_KEY % (page.pk, get_page_version(page))), "123 {{b}} {{c}}")
+        with self.assertNumQueries(1):
+            self.assertEquals(get_page_html(page), "123 {{b}} {{c}}")
+
+    def test_page_html_page_change(self):
+        self.run_tag_test("{{a}} {{b}} {{c}}")
+        page = Page.objects.get(url="tag_test")
+        page.content = "{{c}} {{b}}"
+        page.save()
+        self.run_tag_test("{{c}} {{b}}")
+
+    def test_page_html_changed_elsewhere(self):
+        # bulk updates send no signals, the same as a change made by another worker
+        Tag(tag="a", content="123").save()
+        self.run_tag_test("123 {{b}} {{c}}")
+        Tag.objects.filter(tag="a").update(content="456")
+        self.run_tag_test("456 {{b}} {{c}}")
+        Page.objects.filter(url="tag_test").update(content="{{a}}")
+        self.run_tag_test("456")
+
+    def test_page_html_tag_change(self):
+        self.run_tag_test("{{a}} {{b}} {{c}}")
+        Tag(tag="b", content="456").save()
+        self.run_tag_test("{{a}} 456 {{c}}")
+
+    def test_page_html_con_info_change(self):
+        Tag(tag="a", content="{% load con_info %}{% con_location %}").save()
+        self.run_tag_test("Behind the tardis {{b}} {{c}}")
+        info = ConInfo.objects.all()[0]
+        info.location = "Gallifrey"
+        info.save()
+        self.run_tag_test("Gallifrey {{b}} {{c}}")
+
+    def test_page_html_trigger_change(self):
+        Tag(tag="a", content="{% load con_info %}{% triggers_as_list %}").save()
+
+        def assert_listed(expected):
+            response = self.client.get(reverse("page:display", args=["tag_test"]))
+            self.assertSectionContains(response, "<li>Ghosts</li>", 'section id="main" role="main"', "/section",
+                                       expected=expected)
+
+        assert_listed(False)
+        trigger = Trigger(text="Ghosts")
+        trigger.save()
+        assert_listed(True)
+        trigger.delete()
+        assert_listed(False)
+
+    def test_page_html_trigger_changed_elsewhere(self):
+        # the triggers are read from the database, so a change made by another worker is seen too
+        Tag(tag="a", content="{% load con_info %}{% triggers_as_list %}").save()
+        self.assertEquals(get_tag_expander().data_tags, ['triggers_as_list'])
+        page = Page.objects.get(url="tag_test")
+        version = get_page_version(page)
+        Trigger.objects.filter(text="Spiders").update(text="Ghosts")
+        self.assertNotEquals(get_page_version(page), version)
+
+    def test_warm_page_cache(self):
+        out = StringIO()
+        call_command("warm_page_cache", stdout=out)
+        self.assertEquals(out.getvalue().strip(), "Cached %d page(s)" % Page.objects.count())
+
+        for page in Page.objects.all():
+            self.assertEquals(cache.get(PAGE_HTML_KEY % (page.pk, get_page_version(page))), replace_tags(page.content))
+
+    def test_not_modified(self):
+        url = reverse("page:display", args=["tag_test"])
+        etag = self.client.get(url)["ETag"]
+        # the page and its tags
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+
+    def test_not_modified_index(self):
+        etag = self.client.get('/')["ETag"]
+        self.assertEquals(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_modified_page(self):
+        url = reverse("page:display", args=["tag_test"])
+        etag = self.client.get(url)["ETag"]
+        page = Page.objects.get(url="tag_test")
+        page.content = "{{b}}"
+        page.save()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_modified_tag(self):
+        url = reverse("page:display", args=["tag_test"])
+        etag = self.client.get(url)["ETag"]
+        Tag(tag="a", content="123").save()
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_modified_elsewhere(self):
+        url = reverse("page:display", args=["tag_test"])
+        etag = self.client.get(url)["ETag"]
+        Page.objects.filter(url="tag_test").update(content="{{b}}")
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_modified_user(self):
+        url = reverse("page:display", args=["tag_test"])
+        etag = self.client.get(url)["ETag"]
+        self.client.login(username="user", password="123")
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_other_page_etag(self):
+        etag = self.client.get(reverse("page:display", args=["tag_test"]))["ETag"]
+        response = self.client.get(reverse("page:display", args=["site_rules"]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+
     def test_nonexistent(self):
         response = self.client.get(reverse("page:display", args=["does_not_exist"]))
         self.assertEquals(response.status_code, 404)
@@ -149,3 +309,32 @@ class AdminVersionTest(ShadowConTestCase):
         self.assertEquals(actual_final["fields"]["name"], "2nd name")
         self.assertEquals(actual_final["fields"]["url"], "test-url")
         self.assertEquals(actual_final["fields"]["content"], "New content")
+
+
+def legacy_replace_tags(text):
+    # replace_tags before tags were expanded in a single pass, kept for comparison
+    for tag in Tag.objects.all():
+        pattern = tag_pattern % tag.tag
+        if re.search(pattern, text):
+            expanded = Template(tag.content).render(Context({}))
+            text = re.sub(tag_pattern % tag.tag, expanded, text)
+    return text
+
+
+@benchmark
+class TagBenchmark(ShadowConTestCase):
+    def setUp(self):
+        for i in range(100):
+            Tag(tag="tag%d" % i, content="<b>tag %d</b>{%% load con_info %%}{%% con_location %%}" % i).save()
+
+        paragraph = "<p>" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 10 + "</p>\n"
+        self.text = "".join(paragraph + "{{ tag%d }}" % (i % 20) for i in range(200))
+
+    def test_replace_tags(self):
+        self.assertEquals(replace_tags(self.text), legacy_replace_tags(self.text))
+
+        legacy = time_call(lambda: legacy_replace_tags(self.text), 20)
+        current = time_call(lambda: replace_tags(self.text), 20)
+        print("\nTag expansion over %d characters with 100 tags: legacy %.2fms, single pass %.2fms" %
+              (len(self.text), legacy * 1000, current * 1000))
+        self.assertLess(current, legacy)
@@ -1,16 +1,119 @@
+from convention.models import Game, Trigger
+from convention.utils import get_con_info
+from django.core.cache import cache
+from django.db.models import Count, Max
 from django.template import Template, Context
 
+import hashlib
 import re
 
 from .models import Tag
 
 tag_pattern = "\{[ \t]*\{[ \t]*%s[ \t]*\}[ \t]*\}"
 
+PAGE_HTML_KEY = "page:html:%s:%s"
+PAGE_HTML_TIMEOUT = 24 * 60 * 60
+
+
+def load_trigger_data():
+    return list(Trigger.objects.order_by('id').values_list('id', 'text'))
+
+
+def load_game_data():
+    games = Game.objects.aggregate(count=Count('id'), modified=Max('last_modified'))
+    return games['count'], games['modified']
+
+
+# the template tags that show data besides the convention details, with what identifies that data, read from the
+# database so every worker agrees
+tag_data = {'triggers_as_list': load_trigger_data,
+            'show_user_games': load_game_data,
+            }
+
+# process wide expander, rebuilt the next time it's needed after any tag changes
+_expander = None
+
+
+class TagExpander(object):
+    """
+    Expands every tag in a single scan of the text using one pattern matching all of the tag slugs.  Tag templates
+    are compiled the first time they're used and kept for later pages.
+    """
+
+    def __init__(self, sources, version=None):
+        self.version = version
+        self.sources = sources
+        self.templates = {}
+        # only the data the tags use is read for each page, so pages whose tags don't use any cost no queries
+        self.data_tags = sorted(name for name in tag_data if any(name in source for source in sources.values()))
+
+        if self.sources:
+            slugs = sorted(self.sources.keys(), key=len, reverse=True)
+            self.pattern = re.compile(tag_pattern % ("(%s)" % "|".join(re.escape(slug) for slug in slugs)))
+        else:
+            self.pattern = None
+
+    def get_template(self, slug):
+        template = self.templates.get(slug)
+        if template is None:
+            template = Template(self.sources[slug])
+            self.templates[slug] = template
+        return template
+
+    def expand(self, text):
+        if self.pattern is None:
+            return text
+
+        rendered = {}
+
+        def replace(match):
+            slug = match.group(1)
+            if slug not in rendered:
+                rendered[slug] = self.get_template(slug).render(Context({}))
+            return rendered[slug]
+
+        return self.pattern.sub(replace, text)
+
+
+def load_tags():
+    return dict(Tag.objects.values_list('tag', 'content'))
+
+
+def get_tag_expander():
+    """
+    The expander for the tags as they are now.  The tags are read on every call, in a single query, but their
+    templates are only compiled again when one of them has changed.
+    """
+    global _expander
+    sources = load_tags()
+    version = hashlib.md5(repr(sorted(sources.items()))).hexdigest()
+    if _expander is None or _expander.version != version:
+        _expander = TagExpander(sources, version)
+    return _expander
+
 
 def replace_tags(text):
-    for tag in Tag.objects.all():
-        pattern = tag_pattern % tag.tag
-        if re.search(pattern, text):
-            expanded = Template(tag.content).render(Context({}))
-            text = re.sub(tag_pattern % tag.tag, expanded, text)
-    return text
+    return get_tag_expander().expand(text)
+
+
+def get_page_version(page, expander=None):
+    """
+    Identifies the page's expanded HTML by everything it's built from, so no worker can serve it once the page, its
+    tags or the convention details and other data they show have changed.  Tag templates may only show data from the
+    convention details and the tags in tag_data, anything else they render stays cached until PAGE_HTML_TIMEOUT.
+    """
+    if expander is None:
+        expander = get_tag_expander()
+    data = [tag_data[name]() for name in expander.data_tags]
+    return hashlib.md5(repr((page.content, expander.version, get_con_info().items(), data))).hexdigest()
+
+
+def get_page_html(page, expander=None):
+    if expander is None:
+        expander = get_tag_expander()
+    key = PAGE_HTML_KEY % (page.pk, get_page_version(page, expander))
+    html = cache.get(key)
+    if html is None:
+        html = expander.expand(page.content)
+        cache.set(key, html, PAGE_HTML_TIMEOUT)
+    return html
@@ -1,19 +1,35 @@
+from convention.utils import get_response_etag
 from django.shortcuts import render, get_object_or_404
+from django.views.decorators.http import condition
 from .models import Page
-from .utils import replace_tags
+from .utils import get_page_html, get_page_version, get_tag_expander
 
 
 def index(request):
     return display(request, 'home')
 
 
+def get_page(request, url):
+    """
+    The page for the url and the expander for its tags, looked up once per request
+    """
+    if not hasattr(request, "page"):
+        request.page = get_object_or_404(Page, url=url.replace("/", "_")), get_tag_expander()
+    return request.page
+
+
+def page_etag(request, url):
+    page, expander = get_page(request, url)
+    return get_response_etag(request, url, get_page_version(page, expander))
+
+
+@condition(etag_func=page_etag)
 def display(request, url):
-    url = url.replace("/", "_")
-    page = get_object_or_404(Page, url=url)
+    page, expander = get_page(request, url)
     title = "- " + page.name
 
-    if "home" == url:
+    if "home" == page.url:
         title = ""
 
-    context = {'title': title, 'content': replace_tags(page.content)}
+    context = {'title': title, 'content': get_page_html(page, expander)}
     return render(request, 'page/display.html', context)
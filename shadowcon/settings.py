@@ -77,6 +77,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'convention.context_processors.convention',
             ],
         },
     },
@@ -95,6 +96,33 @@ DATABASES = {
     'default': db_from_env,
 }
 
+# Caches
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+#
+# The default is local to each process.  When running more than one worker, point CACHE_BACKEND and
+# CACHE_LOCATION at a shared cache (e.g. django.core.cache.backends.db.DatabaseCache) so workers agree.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'shadowcon'),
+    },
+}
+
+# Cache alias holding the ConInfo snapshot.  None keeps the snapshot in each worker's memory, which
+# is refreshed when that worker sees the change or after CON_INFO_TIMEOUT seconds, whichever is first.
+CON_INFO_CACHE = os.environ.get('CON_INFO_CACHE')
+CON_INFO_TIMEOUT = int(os.environ.get('CON_INFO_TIMEOUT', 30))
+
+# Seconds the attendance headcounts staff see on every page are kept, in CON_INFO_CACHE or each worker's memory.
+HEADCOUNTS_TIMEOUT = int(os.environ.get('HEADCOUNTS_TIMEOUT', 10))
+
+# Identifies the deployed code in ETags, so a release invalidates what browsers have cached.  Defaults to
+# the commit Heroku built, or else to the modification times of the templates and static files, so every
+# worker running the same code agrees.
+SITE_VERSION = os.environ.get('SITE_VERSION') or os.environ.get('SOURCE_VERSION') or \
+    os.environ.get('HEROKU_SLUG_COMMIT')
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -191,4 +219,8 @@ else:
 
 DEFAULT_FROM_EMAIL = 'ShadowCon Website <postmaster@mg.shadowcon.net>'
 
+# Most e-mails the outbox worker sends per second, keeping bulk announcements within the mail provider's limits.
+# None sends as fast as the connection allows.
+EMAIL_SEND_RATE = float(os.environ['EMAIL_SEND_RATE']) if 'EMAIL_SEND_RATE' in os.environ else None
+
 ACCOUNT_ACTIVATION_DAYS = 7  # One-week registration activation window;
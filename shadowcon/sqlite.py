@@ -0,0 +1,8 @@
+def keep_foreign_keys(apps, schema_editor):
+    """
+    For migrations that rebuild a table other tables refer to.  SQLite 3.26 and later repoint those foreign keys at
+    the copy made while a table is rebuilt, which Django 1.9 then drops, so the older behaviour is turned back on.
+    Use it as migrations.RunPython(keep_foreign_keys, keep_foreign_keys) ahead of the other operations.
+    """
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("PRAGMA legacy_alter_table = ON")
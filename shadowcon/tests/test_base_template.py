@@ -1,7 +1,12 @@
+from django.contrib.auth.models import AnonymousUser, User
 from django.core.urlresolvers import reverse
-from django.test import Client
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from convention.models import ConInfo
+from convention.utils import get_convention_context
 from datetime import date, datetime
 import pytz
 from shadowcon.tests.utils import ShadowConTestCase
@@ -24,6 +29,12 @@ class BaseTemplateTest(ShadowConTestCase):
         response = self.client.get(self.url)
         self.assertSectionContains(response, "March 13th - 15th, 2017", "header")
 
+    def test_no_con_info_queries_once_cached(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEquals([x['sql'] for x in queries if 'convention_coninfo' in x['sql']], [])
+
     def test_header_contains_location(self):
         response = self.client.get(self.url)
         self.assertSectionContains(response, "Behind the tardis", "header")
@@ -317,3 +328,38 @@ class BaseTemplateTest(ShadowConTestCase):
 
 class AlternatePageTemplateTest(BaseTemplateTest):
     url = reverse('contact:contact')
+
+
+class BaseTemplateQueryTest(ShadowConTestCase):
+    def render_base(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return render_to_string('base.html', request=request)
+
+    def test_anonymous_queries(self):
+        self.render_base(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.render_base(AnonymousUser())
+
+    def test_logged_in_queries(self):
+        user = User.objects.get(username="user")
+        self.render_base(user)
+        with self.assertNumQueries(1):
+            self.render_base(user)
+
+    def test_staff_queries(self):
+        # staff also see the headcounts, which are kept with the convention details
+        user = User.objects.get(username="admin")
+        self.render_base(user)
+        with self.assertNumQueries(1):
+            self.render_base(user)
+
+    def test_pre_reg_looked_up_once(self):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(username="admin")
+        convention = get_convention_context(request)
+        self.assertTrue(convention.is_pre_reg_open)
+        self.assertTrue(convention.is_registration_open)
+        with self.assertNumQueries(0):
+            self.assertTrue(get_convention_context(request).is_pre_reg_open)
+            self.assertTrue(get_convention_context(request).is_registration_open)
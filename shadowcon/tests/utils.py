@@ -1,13 +1,37 @@
+from contact.outbox import deliver_all
+from convention.models import PaymentOption, Registration
+from convention.summary import rebuild_summary
+from convention.utils import invalidate_con_info, invalidate_headcounts
+from django.contrib.auth.models import User
 from django.core import mail
+from django.core.cache import caches
 from django.test import TestCase
+from django.utils import timezone
 import ddt
+import os
 import re
+import time
+import unittest
 
 
 class ShadowConTestCase(TestCase):
     fixtures = ['auth', 'initial', 'games', 'test']
     from_address = 'ShadowCon Website <postmaster@mg.shadowcon.net>'
 
+    @classmethod
+    def setUpTestData(cls):
+        # fixtures are loaded without the signals that keep the attendance summary
+        rebuild_summary()
+
+    def _pre_setup(self):
+        super(ShadowConTestCase, self)._pre_setup()
+
+        # cached data outlives the transaction rolled back after each test
+        for cache in caches.all():
+            cache.clear()
+        invalidate_con_info()
+        invalidate_headcounts()
+
     def get_section(self, response, section, section_terminator=None):
         if section_terminator is None:
             section_terminator = "/" + section
@@ -43,9 +67,15 @@ class ShadowConTestCase(TestCase):
         else:
             self.assertIsNone(re.search(pattern, sub_str), "Didn't expect %s" % fail_msg)
 
+    def get_emails(self):
+        # e-mail waits in the outbox until it's delivered
+        deliver_all()
+        return mail.outbox
+
     def get_email(self):
-        self.assertEquals(len(mail.outbox), 1)
-        return mail.outbox[0]
+        emails = self.get_emails()
+        self.assertEquals(len(emails), 1)
+        return emails[0]
 
     def assertEmail(self, to, body, subject_source=None, subject_details=None, subject=None):
         if subject is None:
@@ -58,6 +88,16 @@ class ShadowConTestCase(TestCase):
         self.assertEquals(email.body, body)
 
 
+def register(username, email=None):
+    """
+    Registers the user with the username, creating them with a test address first if they don't exist
+    """
+    user = User.objects.get_or_create(username=username, defaults={
+        'email': "%s@test.com" % username if email is None else email})[0]
+    return Registration.objects.create(user=user, registration_date=timezone.now(), last_updated=timezone.now(),
+                                       payment=PaymentOption.objects.all()[0])
+
+
 def data_func(*values):
     """
     Method decorator to add to your test methods.
@@ -68,3 +108,17 @@ def data_func(*values):
         setattr(func, ddt.DATA_ATTR, values[0])
         return func
     return wrapper
+
+
+# Benchmarks are slow, so they only run when SHADOWCON_BENCHMARK is set in the environment
+benchmark = unittest.skipUnless(os.environ.get('SHADOWCON_BENCHMARK'), "Set SHADOWCON_BENCHMARK=1 to run benchmarks")
+
+
+def time_call(func, repeat=1):
+    """
+    Returns the average number of seconds a call to func takes
+    """
+    start = time.time()
+    for _ in range(repeat):
+        func()
+    return (time.time() - start) / repeat
@@ -0,0 +1,26 @@
+from django.core.cache import cache
+from django.db import transaction
+
+import uuid
+
+
+def get_version(key):
+    """
+    The version stored under the key in the default cache, made the first time it's asked for.  Versions are random
+    rather than counters, so losing the key can never bring back what was cached for an older one.
+    """
+    cache.add(key, uuid.uuid4().hex, None)
+    return cache.get(key)
+
+
+def bump_version(key):
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+def invalidate_on_commit(invalidate):
+    """
+    Calls invalidate now and again once the current transaction commits, as another request may cache the old values
+    in between
+    """
+    invalidate()
+    transaction.on_commit(invalidate)